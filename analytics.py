@@ -0,0 +1,342 @@
+"""Cross-ticker analytics: correlation, beta and relative strength over aligned daily returns.
+
+The closes of every stock_list ticker are read from its bars once and kept
+per ticker (the last ANALYTICS_HISTORY sessions). When the data version
+changes, only the tickers the change feed lists with new bars are read again,
+from their last bar id on. Log returns (each bar against the ticker's previous
+bar) are aligned on the union of the dates as a (dates, tickers) matrix, NaN
+where a ticker has no bar.
+
+Statistics over the last `window` sessions use the pairwise-complete
+observations of each pair. Their counts, sums and cross products come from a
+few matrix products, computed ANALYTICS_BLOCK_SIZE tickers at a time, so the
+tickers x tickers matrix of a large universe never exists at once.
+
+    python analytics.py --ticker aapl --top 10 --window 60
+"""
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from changes import changed_tickers
+from db import get_data_version
+from storage import get_storage
+
+# Sessions of closes kept per ticker; the longest window a query may use
+ANALYTICS_HISTORY = int(os.environ.get('ANALYTICS_HISTORY', 504))
+
+# Tickers per block of the pairwise products; memory grows with block size x universe size
+ANALYTICS_BLOCK_SIZE = int(os.environ.get('ANALYTICS_BLOCK_SIZE', 256))
+
+# Benchmark of beta and relative strength: a ticker, or 'market' for the equal-weighted universe
+ANALYTICS_BENCHMARK = os.environ.get('ANALYTICS_BENCHMARK', 'market')
+
+DEFAULT_WINDOW = 60
+
+# Fewest common sessions for a correlation or beta
+MIN_PERIODS = 20
+
+# Tickers in one correlation matrix request
+MAX_MATRIX_TICKERS = 200
+
+# Results of one top-k query
+MAX_TOP = 100
+
+
+def _int_option(args, name, default, low, high):
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if not low <= value <= high:
+        raise ValueError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def parse_options(args):
+    """window, top and min_periods of a query string; raises ValueError"""
+    window = _int_option(args, 'window', DEFAULT_WINDOW, 2, ANALYTICS_HISTORY)
+    return {
+        'window': window,
+        'top': _int_option(args, 'top', 10, 1, MAX_TOP),
+        'min_periods': _int_option(args, 'min_periods', min(MIN_PERIODS, window), 2, window)
+    }
+
+
+def format_number(value, digits=4):
+    """JSON-ready float, None for NaN"""
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def _log_returns(close):
+    """Log return of every close against the previous one, NaN for the first and around non-positive closes"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_close = np.log(np.where(close > 0, close, np.nan))
+    returns = np.full(len(close), np.nan)
+    returns[1:] = np.diff(log_close)
+    return returns
+
+
+def pair_sums(a, b):
+    """Pairwise-complete count, sum a, sum b, sum a², sum b² and sum ab of the columns of a and b.
+
+    Each is a (columns of a, columns of b) matrix over the rows where both values are finite.
+    """
+    ma, mb = np.isfinite(a), np.isfinite(b)
+    a0, b0 = np.where(ma, a, 0.0), np.where(mb, b, 0.0)
+    ma, mb = ma.astype(np.float64), mb.astype(np.float64)
+    return ma.T @ mb, a0.T @ mb, ma.T @ b0, (a0 * a0).T @ mb, ma.T @ (b0 * b0), a0.T @ b0
+
+
+def correlation(a, b, min_periods=MIN_PERIODS):
+    """Correlation of every column of a with every column of b; NaN with fewer than min_periods common rows"""
+    n, sa, sb, saa, sbb, sab = pair_sums(a, b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (n * sab - sa * sb) / np.sqrt((n * saa - sa * sa) * (n * sbb - sb * sb))
+    result[n < min_periods] = np.nan
+    return np.clip(result, -1.0, 1.0)
+
+
+def beta(a, b, min_periods=MIN_PERIODS):
+    """(beta, correlation, observations) of every column of a against the 1-D series b"""
+    n, sa, sb, saa, sbb, sab = (s[:, 0] for s in pair_sums(a, b[:, None]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = n * sab - sa * sb
+        slope = covariance / (n * sbb - sb * sb)
+        corr = np.clip(covariance / np.sqrt((n * saa - sa * sa) * (n * sbb - sb * sb)), -1.0, 1.0)
+    few = n < min_periods
+    slope[few] = np.nan
+    corr[few] = np.nan
+    return slope, corr, n.astype(np.int64)
+
+
+def rolling_correlation(x, y, window, min_periods=MIN_PERIODS):
+    """Correlation of x and y over each trailing window of rows, from cumulative sums"""
+    m = np.isfinite(x) & np.isfinite(y)
+    x0, y0 = np.where(m, x, 0.0), np.where(m, y, 0.0)
+
+    def windowed(values):
+        total = np.concatenate([[0.0], np.cumsum(values)])
+        return total[window:] - total[:-window]
+
+    n, sx, sy = windowed(m.astype(np.float64)), windowed(x0), windowed(y0)
+    sxx, syy, sxy = windowed(x0 * x0), windowed(y0 * y0), windowed(x0 * y0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    result[n < min_periods] = np.nan
+    return np.clip(result, -1.0, 1.0)
+
+
+def _read_bars(cursor, storage, ticker, previous=None):
+    """(last bar id, dates, closes) of a ticker, extending previous with the bars inserted since"""
+    last_id, dates, close = previous or (0, np.empty(0, dtype='datetime64[D]'), np.empty(0))
+    rows = storage.read_new_bars(cursor, ticker, last_id, ('id', 'timestamp', 'close'))
+    if not rows:
+        return previous
+    last_id = max(last_id, max(row[0] for row in rows))
+    rows = [row for row in rows if row[1] is not None and row[2] is not None]
+    if rows:
+        dates = np.concatenate([dates, np.array([row[1] for row in rows], dtype='datetime64[D]')])
+        close = np.concatenate([close, np.array([row[2] for row in rows], dtype=np.float64)])
+        order = np.argsort(dates, kind='stable')
+        dates, close = dates[order], close[order]
+        # One close per day, the last one inserted
+        last = np.append(dates[1:] != dates[:-1], True)
+        # One extra close for the return of the first kept session
+        dates, close = dates[last][-(ANALYTICS_HISTORY + 1):], close[last][-(ANALYTICS_HISTORY + 1):]
+    return last_id, dates, close
+
+
+class ReturnsMatrix:
+    """Daily log returns of every ticker aligned on a common date axis"""
+
+    def __init__(self, bars, version=None, change_id=None):
+        # ticker -> (last bar id, dates, closes), kept for incremental refreshes
+        self.bars = bars
+        self.version = version
+        self.change_id = change_id
+        self.tickers = sorted(t for t, (_, dates, _) in bars.items() if len(dates) > 1)
+        self.index = {t: i for i, t in enumerate(self.tickers)}
+        days = [bars[t][1][1:] for t in self.tickers]
+        dates = np.unique(np.concatenate(days)) if days else np.empty(0, dtype='datetime64[D]')
+        self.dates = dates[-ANALYTICS_HISTORY:]
+
+        self.returns = np.full((len(self.dates), len(self.tickers)), np.nan)
+        for i, ticker in enumerate(self.tickers):
+            _, dates, close = bars[ticker]
+            returns = _log_returns(close)
+            keep = dates >= self.dates[0]
+            self.returns[np.searchsorted(self.dates, dates[keep]), i] = returns[keep]
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, mydb, previous=None):
+        """Read the closes of every stock_list ticker, or with previous only those of tickers with new bars"""
+        storage = get_storage()
+        cursor = mydb.cursor()
+        try:
+            version = get_data_version(mydb)
+            change_id, changed = changed_tickers(cursor, 'bars', previous.change_id if previous else None)
+            if changed is None:
+                cursor.execute('SELECT ticker FROM stock_list')
+                bars, changed = {}, [row[0].lower() for row in cursor.fetchall()]
+            else:
+                bars = dict(previous.bars)
+            for ticker in changed:
+                entry = _read_bars(cursor, storage, ticker, bars.get(ticker))
+                if entry is not None:
+                    bars[ticker] = entry
+        finally:
+            cursor.close()
+        return cls(bars, version, change_id)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _window(self, window):
+        if not 2 <= window <= len(self.dates):
+            raise ValueError(f'window must be between 2 and {len(self.dates)} sessions')
+        return self.returns[-window:]
+
+    def _column(self, ticker):
+        if ticker not in self.index:
+            raise KeyError(f'No returns for {ticker.upper()}')
+        return self.index[ticker]
+
+    def _benchmark(self, returns, benchmark):
+        """Benchmark returns: a ticker's, or the equal-weighted mean of the universe for 'market'"""
+        if benchmark == 'market':
+            finite = np.isfinite(returns)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(finite, returns, 0.0).sum(axis=1) / finite.sum(axis=1)
+        if benchmark not in self.index:
+            raise ValueError(f"Unknown benchmark {benchmark.upper()}; use a ticker with data or 'market'")
+        return returns[:, self.index[benchmark]]
+
+    def correlation_matrix(self, tickers, window=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+        """(tickers with data, their correlation matrix)"""
+        returns = self._window(window)
+        found = [t for t in tickers if t in self.index]
+        columns = returns[:, [self.index[t] for t in found]]
+        return found, correlation(columns, columns, min_periods)
+
+    def most_correlated(self, ticker, window=DEFAULT_WINDOW, top=10, min_periods=MIN_PERIODS):
+        """The top tickers most correlated with ticker, highest first"""
+        returns = self._window(window)
+        i = self._column(ticker)
+        corr, = correlation(returns[:, [i]], returns, min_periods)
+        corr[i] = np.nan
+        order = np.argsort(-np.nan_to_num(corr, nan=-np.inf), kind='stable')[:top]
+        return [(self.tickers[j], corr[j]) for j in order if np.isfinite(corr[j])]
+
+    def rolling(self, ticker, other, window=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+        """(dates, correlation of ticker and other over the window ending on each date)"""
+        self._window(window)
+        x, y = self.returns[:, self._column(ticker)], self.returns[:, self._column(other)]
+        return self.dates[window - 1:], rolling_correlation(x, y, window, min_periods)
+
+    def top_pairs(self, window=DEFAULT_WINDOW, top=10, min_periods=MIN_PERIODS, block_size=ANALYTICS_BLOCK_SIZE):
+        """The top most correlated pairs of the universe, highest first, computed block by block"""
+        returns = self._window(window)
+        n = len(self.tickers)
+        best = np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            # Each pair once: a block against itself and every later ticker
+            corr = correlation(returns[:, start:stop], returns[:, start:], min_periods)
+            corr[np.tril_indices(stop - start, 0, corr.shape[1])] = np.nan
+            flat = np.nan_to_num(corr, nan=-np.inf).ravel()
+            k = min(top, int(np.isfinite(flat).sum()))
+            if not k:
+                continue
+            picked = np.argpartition(-flat, k - 1)[:k]
+            rows, columns = np.divmod(picked, corr.shape[1])
+            best = tuple(np.concatenate(pair) for pair in zip(best, (flat[picked], rows + start, columns + start)))
+            keep = np.argsort(-best[0], kind='stable')[:top]
+            best = tuple(values[keep] for values in best)
+        return [(self.tickers[i], self.tickers[j], value) for value, i, j in zip(*best)]
+
+    def betas(self, tickers=None, benchmark=ANALYTICS_BENCHMARK, window=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+        """ticker -> (beta, correlation, observations) against the benchmark, for tickers (default: all)"""
+        returns = self._window(window)
+        reference = self._benchmark(returns, benchmark)
+        tickers = self.tickers if tickers is None else [t for t in tickers if t in self.index]
+        result = {}
+        for start in range(0, len(tickers), ANALYTICS_BLOCK_SIZE):
+            batch = tickers[start:start + ANALYTICS_BLOCK_SIZE]
+            slope, corr, observations = beta(returns[:, [self.index[t] for t in batch]], reference, min_periods)
+            result.update(zip(batch, zip(slope, corr, observations)))
+        return result
+
+    def relative_strength(self, benchmark=ANALYTICS_BENCHMARK, period=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+        """Tickers ranked by return over the period relative to the benchmark's, strongest first.
+
+        Returns (ticker, return, relative strength, percentile) tuples and the benchmark's return.
+        """
+        returns = self._window(period)
+        reference = np.expm1(np.nansum(self._benchmark(returns, benchmark)))
+        growth = np.expm1(np.nansum(returns, axis=0))
+        strength = (1 + growth) / (1 + reference) - 1
+        valid = np.flatnonzero(np.isfinite(returns).sum(axis=0) >= min_periods)
+        order = valid[np.argsort(-strength[valid], kind='stable')]
+        # Share of the ranked tickers this one beats
+        percentile = 100.0 * (len(order) - 1 - np.arange(len(order))) / max(len(order) - 1, 1)
+        return [(self.tickers[j], growth[j], strength[j], p) for j, p in zip(order, percentile)], reference
+
+
+_matrix = None
+_lock = threading.Lock()
+
+
+def get_returns(get_connection, version):
+    """The process-local ReturnsMatrix for a data version, refreshed incrementally when the version changes"""
+    global _matrix
+    matrix = _matrix
+    if matrix is not None and matrix.version == version:
+        return matrix
+    with _lock:
+        if _matrix is None or _matrix.version != version:
+            with get_connection() as mydb:
+                _matrix = ReturnsMatrix.load(mydb, _matrix)
+        return _matrix
+
+
+def main():
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Cross-ticker correlation, beta and relative strength')
+    parser.add_argument('--ticker', help='list the tickers most correlated with this one (default: top pairs)')
+    parser.add_argument('--benchmark', default=ANALYTICS_BENCHMARK, help="ticker or 'market'")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='sessions')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with get_connection() as mydb:
+        matrix = ReturnsMatrix.load(mydb)
+    print(f"Loaded returns of {len(matrix)} tickers x {len(matrix.dates)} sessions in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    if args.ticker:
+        print(f"\nMost correlated with {args.ticker.upper()} over {args.window} sessions:")
+        for ticker, corr in matrix.most_correlated(args.ticker.lower(), args.window, args.top):
+            print(f"  {ticker.upper():<10} {corr:6.3f}")
+    else:
+        print(f"\nMost correlated pairs over {args.window} sessions:")
+        for a, b, corr in matrix.top_pairs(args.window, args.top):
+            print(f"  {a.upper():<10} {b.upper():<10} {corr:6.3f}")
+
+    ranking, reference = matrix.relative_strength(args.benchmark.lower(), args.window)
+    print(f"\nRelative strength against {args.benchmark.upper()} ({reference:+.2%}):")
+    betas = matrix.betas([t for t, *_ in ranking[:args.top]], args.benchmark.lower(), args.window)
+    for ticker, growth, strength, percentile in ranking[:args.top]:
+        print(f"  {ticker.upper():<10} {growth:+8.2%} {strength:+8.2%}  pct {percentile:5.1f}  beta {betas[ticker][0]:5.2f}")
+    print(f"\nQueries took {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
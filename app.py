@@ -1,171 +1,226 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
-import mysql.connector
-import pandas as pd
+import importlib
 import json
 from datetime import datetime, timedelta
-from ml_model import TradingMLModel
-import joblib
 import os
+from db import connect, get_connection, pool_stats
+from cache import DataVersion, cached_response, default_cache
+from changes import STREAM_HEARTBEAT, STREAM_MAX_TICKERS, ChangeFeed
+import metrics
+from startup import STARTUP_MODE, startup
+import time
+
+# pandas, scikit-learn (through ml_model), the storage layouts and the screener are
+# imported by the routes that use them and by the warm-up, so a new instance starts
+# answering /api/health before they are loaded
 
 app = Flask(__name__)
 CORS(app)
 
-# Database configuration
-DB_CONFIG = {
-    'host': '104.154.25.113',
-    'user': 'kshitij',
-    'password': 'Kshitij_17',
-    'database': 'stocks'
-}
-
 # Initialize ML model
 ml_model = None
+model_registry = None
+
+# Change-feed poller shared by every /api/stream client of this process; polls only while streams are open
+change_feed = ChangeFeed(get_connection)
+
+# Response cache for read endpoints, invalidated when the ingestion jobs bump the data version
+response_cache = default_cache()
+data_version = DataVersion()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    # The server is listening once a request arrives
+    startup.warm()
+    metrics.set_route(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, metrics.current_route(),
+                                        request.method, str(response.status_code))
+    return response
+
+@app.teardown_request
+def clear_route(exc):
+    metrics.set_route('')
+
+def service_metrics():
+    """Response cache and connection pool counters for /api/metrics"""
+    cache = response_cache.stats()
+    pool = pool_stats()
+    return [
+        ('cache_lookups_total', 'counter', 'Response cache lookups by result',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'shared_hit'}, cache['shared_hits']),
+          ({'result': 'miss'}, cache['misses'])]),
+        ('cache_not_modified_total', 'counter', 'Requests answered 304 from a cached ETag', [({}, cache['not_modified'])]),
+        ('cache_entries', 'gauge', 'Entries in the in-process response cache', [({}, cache['entries'])]),
+        ('db_pool_checkouts_total', 'counter', 'Pooled connection checkouts', [({}, pool['checkouts'])]),
+        ('db_pool_connections_created_total', 'counter', 'Connections opened by the pool', [({}, pool['created'])]),
+        ('db_pool_timeouts_total', 'counter', 'Checkouts that timed out waiting for a connection', [({}, pool['timeouts'])]),
+        ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection', [({}, pool['wait_time_total'])]),
+        ('db_pool_in_use', 'gauge', 'Connections checked out', [({}, pool['in_use'])]),
+        ('db_pool_idle', 'gauge', 'Idle pooled connections', [({}, pool['idle'])])
+    ] + stream_metrics()
+
+def stream_metrics():
+    stats = change_feed.stats()
+    return [
+        ('stream_subscribers', 'gauge', 'Open /api/stream connections', [({}, stats['subscribers'])]),
+        ('stream_polls_total', 'counter', 'Change feed polls', [({}, stats['polls'])]),
+        ('stream_events_total', 'counter', 'Events published to streams (before fan-out)', [({}, stats['events'])]),
+        ('stream_replays_total', 'counter', 'Reconnects replayed from Last-Event-ID', [({}, stats['replays'])]),
+        ('stream_poll_errors_total', 'counter', 'Change feed polls that failed', [({}, stats['errors'])])
+    ]
+
+metrics.registry.add_collector(service_metrics)
+metrics.registry.add_collector(startup.collect)
 
 def get_db_connection():
-    """Create database connection"""
-    return mysql.connector.connect(**DB_CONFIG)
+    """Check out a pooled database connection; close() returns it to the pool"""
+    return get_connection()
+
+def cached(view):
+    return cached_response(response_cache, data_version, get_db_connection)(view)
 
 def load_ml_model():
-    """Load the trained ML model"""
-    global ml_model
-    if ml_model is None and os.path.exists('trading_model.pkl'):
-        ml_model = TradingMLModel()
-        ml_model.model = joblib.load('trading_model.pkl')
-        ml_model.scaler = joblib.load('trading_scaler.pkl')
-        ml_model.is_trained = True
+    """The current model from the registry, swapped when a new version is published; the legacy pickle otherwise"""
+    global ml_model, model_registry
+    from ml_model import TradingMLModel
+    from registry import ModelRegistry
+    if model_registry is None:
+        model_registry = ModelRegistry()
+    forest = model_registry.current()
+    if forest is not None:
+        if ml_model is None or ml_model.compact is not forest:
+            # A new object, so requests holding the previous model are unaffected
+            ml_model = TradingMLModel().load_compact(forest)
+    elif ml_model is None and os.path.exists('trading_model.pkl'):
+        ml_model = TradingMLModel().load('trading_model.pkl', 'trading_scaler.pkl')
     return ml_model
 
+def get_signals(tickers):
+    """Precomputed signals, falling back to on-demand batch prediction for tickers without one"""
+    from ml_model import load_signals
+    with get_db_connection() as mydb, metrics.phase('read'):
+        signals = load_signals(mydb, tickers)
+    
+    missing = [t for t in tickers if t not in signals]
+    if missing:
+        model = load_ml_model()
+        if model is not None:
+            for prediction in model.predict_batch(missing):
+                signals[prediction['ticker'].lower()] = prediction
+    
+    return signals
+
 @app.route('/api/stocks', methods=['GET'])
+@cached
 def get_stocks():
     """Get list of all available stocks"""
     try:
-        mydb = get_db_connection()
-        cursor = mydb.cursor()
-        
-        cursor.execute('SELECT ticker, stock FROM stock_list')
-        stocks = [{'ticker': row[0], 'name': row[1]} for row in cursor.fetchall()]
-        
-        cursor.close()
-        mydb.close()
+        with get_db_connection() as mydb:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker, stock FROM stock_list')
+            stocks = [{'ticker': row[0], 'name': row[1]} for row in cursor.fetchall()]
+            cursor.close()
         
         return jsonify({'stocks': stocks})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stock/<ticker>/data', methods=['GET'])
+@cached
 def get_stock_data(ticker):
-    """Get stock data with technical indicators"""
+    """Get stock data with technical indicators; ?format=columns returns one array per field"""
+    if any(request.args.get(name) for name in ('start', 'end', 'max_points')):
+        return get_stock_range(ticker)
+    from serialization import columns_to_records, stock_data_columns
+    from storage import get_storage
     try:
-        mydb = get_db_connection()
+        with get_db_connection() as mydb, metrics.phase('read'):
+            # Technical indicators with the matching bar's volume
+            history = get_storage().read_indicators(mydb, [ticker.lower()], 100).get(ticker.lower())
         
-        # Get price data
-        price_df = pd.read_sql(f"SELECT * FROM {ticker.lower()}_data ORDER BY timestamp DESC LIMIT 100", mydb)
+        if history is None:
+            return jsonify({'error': f'No data for {ticker.upper()}'}), 404
         
-        # Get technical indicators
-        indicators_df = pd.read_sql(f"SELECT * FROM {ticker.lower()}_MA ORDER BY timestamp DESC LIMIT 100", mydb)
+        with metrics.phase('serialize'):
+            # Newest first
+            indicators_df = history.iloc[::-1].reset_index(drop=True)
+            columns = stock_data_columns(indicators_df)
+            
+            if request.args.get('format') == 'columns':
+                return jsonify({'columns': columns, 'count': len(indicators_df)})
+            
+            return jsonify({'data': columns_to_records(columns)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def get_stock_range(ticker):
+    """Rows between ?start and ?end (ISO dates, end inclusive), downsampled to ?max_points with ?method=lttb|minmax"""
+    import pandas as pd
+    from chart import METHODS, MIN_POINTS, get_history, parse_bound
+    from serialization import columns_to_records, stock_data_columns
+    try:
+        start = parse_bound(request.args.get('start'))
+        end = parse_bound(request.args.get('end'), end=True)
+        max_points = request.args.get('max_points', type=int)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid range: {e}'}), 400
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(METHODS)}"}), 400
+    if max_points is None and request.args.get('max_points'):
+        return jsonify({'error': 'max_points must be an integer'}), 400
+    if max_points is not None and max_points < MIN_POINTS:
+        return jsonify({'error': f'max_points must be at least {MIN_POINTS}'}), 400
+    
+    try:
+        version = data_version.get(get_db_connection)
+        with get_db_connection() as mydb, metrics.phase('read'):
+            history = get_history(mydb, ticker.lower(), version)
         
-        mydb.close()
+        if history is None:
+            return jsonify({'error': f'No data for {ticker.upper()}'}), 404
         
-        # Combine data
-        data = []
-        for _, row in indicators_df.iterrows():
-            data.append({
-                'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None,
-                'close': float(row['close']) if row['close'] else None,
-                'volume': int(row['volume']) if 'volume' in row and row['volume'] else None,
-                'ma_5day': float(row['MA_5DAY']) if row['MA_5DAY'] else None,
-                'ma_20day': float(row['MA_20DAY']) if row['MA_20DAY'] else None,
-                'ma_50day': float(row['MA_50DAY']) if row['MA_50DAY'] else None,
-                'ma_200day': float(row['MA_200DAY']) if row['MA_200DAY'] else None,
-                'ema_12day': float(row['EMA_12DAY']) if row['EMA_12DAY'] else None,
-                'ema_26day': float(row['EMA_26DAY']) if row['EMA_26DAY'] else None,
-                'macd': float(row['MACD']) if row['MACD'] else None,
-                'signal_line': float(row['SIGNAL_LINE']) if row['SIGNAL_LINE'] else None,
-                'rsi': float(row['RSI']) if row['RSI'] else None,
-                'fib_0': float(row['Fib_0']) if row['Fib_0'] else None,
-                'fib_236': float(row['Fib_236']) if row['Fib_236'] else None,
-                'fib_382': float(row['Fib_382']) if row['Fib_382'] else None,
-                'fib_500': float(row['Fib_500']) if row['Fib_500'] else None,
-                'fib_618': float(row['Fib_618']) if row['Fib_618'] else None,
-                'fib_100': float(row['Fib_100']) if row['Fib_100'] else None
-            })
+        with metrics.phase('downsample'):
+            arrays, total = history.query(start, end, max_points, method)
         
-        return jsonify({'data': data})
+        with metrics.phase('serialize'):
+            # Newest first, like the latest-rows response
+            columns = stock_data_columns(pd.DataFrame(arrays).iloc[::-1].reset_index(drop=True))
+            count = len(columns['timestamp'])
+            
+            if request.args.get('format') == 'columns':
+                return jsonify({'columns': columns, 'count': count, 'total': total})
+            
+            return jsonify({'data': columns_to_records(columns), 'count': count, 'total': total})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/screener', methods=['POST'])
 def screen_stocks():
     """Screen stocks based on criteria"""
+    from screener import find_events, get_snapshot
     try:
-        criteria = request.json
-        
-        mydb = get_db_connection()
-        cursor = mydb.cursor()
-        
-        # Get list of stocks
-        cursor.execute('SELECT ticker FROM stock_list')
-        tickers = [row[0].lower() for row in cursor.fetchall()]
-        
-        results = []
+        criteria = request.json or {}
         
-        for ticker in tickers:
-            try:
-                # Get latest data
-                df = pd.read_sql(f"SELECT * FROM {ticker}_MA ORDER BY timestamp DESC LIMIT 1", mydb)
-                
-                if len(df) == 0:
-                    continue
-                
-                latest = df.iloc[0]
-                
-                # Apply filters
-                passes_filters = True
-                
-                if 'min_price' in criteria and latest['close'] < criteria['min_price']:
-                    passes_filters = False
-                
-                if 'max_price' in criteria and latest['close'] > criteria['max_price']:
-                    passes_filters = False
-                
-                if 'min_volume' in criteria and latest['volume'] < criteria['min_volume']:
-                    passes_filters = False
-                
-                if 'rsi_oversold' in criteria and latest['RSI'] > criteria['rsi_oversold']:
-                    passes_filters = False
-                
-                if 'rsi_overbought' in criteria and latest['RSI'] < criteria['rsi_overbought']:
-                    passes_filters = False
-                
-                if 'ma_crossover' in criteria and criteria['ma_crossover']:
-                    # Check if price is above 20-day MA and 20-day MA is above 50-day MA
-                    if latest['close'] < latest['MA_20DAY'] or latest['MA_20DAY'] < latest['MA_50DAY']:
-                        passes_filters = False
-                
-                if 'macd_bullish' in criteria and criteria['macd_bullish']:
-                    # Check if MACD is above signal line
-                    if latest['MACD'] <= latest['SIGNAL_LINE']:
-                        passes_filters = False
-                
-                if passes_filters:
-                    results.append({
-                        'ticker': ticker.upper(),
-                        'close': float(latest['close']),
-                        'volume': int(latest['volume']) if latest['volume'] else 0,
-                        'rsi': float(latest['RSI']) if latest['RSI'] else None,
-                        'macd': float(latest['MACD']) if latest['MACD'] else None,
-                        'ma_20day': float(latest['MA_20DAY']) if latest['MA_20DAY'] else None,
-                        'ma_50day': float(latest['MA_50DAY']) if latest['MA_50DAY'] else None
-                    })
-                    
-            except Exception as e:
-                continue
-        
-        cursor.close()
-        mydb.close()
+        with metrics.phase('snapshot'):
+            snapshot = get_snapshot(get_db_connection)
+        events = None
+        if criteria.get('events'):
+            with get_db_connection() as mydb, metrics.phase('events'):
+                events = find_events(mydb, criteria)
+        with metrics.phase('screen'):
+            results = snapshot.screen(criteria, events)
         
         return jsonify({'results': results})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -173,62 +228,321 @@ def screen_stocks():
 def predict_signal(ticker):
     """Get ML prediction for a stock"""
     try:
-        model = load_ml_model()
-        if model is None:
-            return jsonify({'error': 'ML model not available'}), 500
-        
-        prediction = model.predict_trading_signal(ticker.lower())
+        prediction = get_signals([ticker.lower()]).get(ticker.lower())
         
         if prediction is None:
+            if load_ml_model() is None:
+                return jsonify({'error': 'ML model not available'}), 500
             return jsonify({'error': 'Unable to generate prediction'}), 500
         
         return jsonify(prediction)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/market-summary', methods=['GET'])
-def get_market_summary():
-    """Get market summary statistics"""
+@app.route('/api/predict', methods=['POST'])
+def predict_signals():
+    """Get ML predictions for many stocks in one call"""
     try:
-        mydb = get_db_connection()
-        cursor = mydb.cursor()
+        tickers = [t.lower() for t in (request.json or {}).get('tickers', [])]
         
-        # Get total number of stocks
-        cursor.execute('SELECT COUNT(*) FROM stock_list')
-        total_stocks = cursor.fetchone()[0]
+        signals = get_signals(tickers)
         
-        # Get stocks with recent data
-        cursor.execute('SELECT ticker FROM stock_list')
-        tickers = [row[0].lower() for row in cursor.fetchall()]
+        predictions = [
+            signals.get(t, {'ticker': t.upper(), 'signal': 'N/A', 'confidence': 0, 'error': 'Prediction not available'})
+            for t in tickers
+        ]
         
-        active_stocks = 0
-        total_volume = 0
-        
-        for ticker in tickers[:50]:  # Sample first 50 stocks
-            try:
-                df = pd.read_sql(f"SELECT volume FROM {ticker}_data ORDER BY timestamp DESC LIMIT 1", mydb)
-                if len(df) > 0 and df.iloc[0]['volume']:
-                    active_stocks += 1
-                    total_volume += df.iloc[0]['volume']
-            except:
-                continue
+        return jsonify({'predictions': predictions})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/market-summary', methods=['GET'])
+@cached
+def get_market_summary():
+    """Get market summary statistics"""
+    from market_summary import format_summary, read_summary
+    try:
+        with get_db_connection() as mydb, metrics.phase('read'):
+            summary = read_summary(mydb)
         
-        cursor.close()
-        mydb.close()
+        if summary is None:
+            return jsonify({'error': 'Market summary not available'}), 500
         
+        return jsonify(format_summary(summary))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def get_returns_matrix():
+    """Aligned returns of the universe for the current data version"""
+    from analytics import get_returns
+    version = data_version.get(get_db_connection)
+    with metrics.phase('returns'):
+        return get_returns(get_db_connection, version)
+
+def ticker_list(name='tickers'):
+    return list(dict.fromkeys(t.strip().lower() for t in request.args.get(name, '').split(',') if t.strip()))
+
+@app.route('/api/analytics/correlation', methods=['GET'])
+@cached
+def get_correlation_matrix():
+    """Correlation matrix of ?tickers= over the last ?window= sessions"""
+    from analytics import MAX_MATRIX_TICKERS, format_number, parse_options
+    tickers = ticker_list()
+    if not 2 <= len(tickers) <= MAX_MATRIX_TICKERS:
+        return jsonify({'error': f'tickers must list 2 to {MAX_MATRIX_TICKERS} tickers'}), 400
+    try:
+        options = parse_options(request.args)
+        matrix = get_returns_matrix()
+        with metrics.phase('analytics'):
+            found, corr = matrix.correlation_matrix(tickers, options['window'], options['min_periods'])
+
+        return jsonify({
+            'tickers': [t.upper() for t in found],
+            'window': options['window'],
+            'matrix': [[format_number(v) for v in row] for row in corr]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/correlation/<ticker>', methods=['GET'])
+@cached
+def get_correlated(ticker):
+    """The ?top= tickers most correlated with ticker; with ?with=OTHER the rolling correlation of the pair"""
+    from analytics import format_number, parse_options
+    other = request.args.get('with', '').strip().lower()
+    try:
+        options = parse_options(request.args)
+        matrix = get_returns_matrix()
+        with metrics.phase('analytics'):
+            if other:
+                dates, corr = matrix.rolling(ticker.lower(), other, options['window'], options['min_periods'])
+                return jsonify({
+                    'ticker': ticker.upper(),
+                    'with': other.upper(),
+                    'window': options['window'],
+                    'dates': [str(d) for d in dates],
+                    'correlation': [format_number(v) for v in corr]
+                })
+            correlated = matrix.most_correlated(ticker.lower(), options['window'], options['top'], options['min_periods'])
+
+        return jsonify({
+            'ticker': ticker.upper(),
+            'window': options['window'],
+            'correlated': [{'ticker': t.upper(), 'correlation': format_number(v)} for t, v in correlated]
+        })
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/pairs', methods=['GET'])
+@cached
+def get_correlated_pairs():
+    """The ?top= most correlated pairs of the whole universe"""
+    from analytics import format_number, parse_options
+    try:
+        options = parse_options(request.args)
+        matrix = get_returns_matrix()
+        with metrics.phase('analytics'):
+            pairs = matrix.top_pairs(options['window'], options['top'], options['min_periods'])
+
+        return jsonify({
+            'window': options['window'],
+            'pairs': [{'tickers': [a.upper(), b.upper()], 'correlation': format_number(v)} for a, b, v in pairs]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/beta', methods=['GET'])
+@cached
+def get_betas():
+    """Beta against ?benchmark= (a ticker or market) of ?tickers= (default: all)"""
+    from analytics import ANALYTICS_BENCHMARK, format_number, parse_options
+    benchmark = request.args.get('benchmark', ANALYTICS_BENCHMARK).strip().lower()
+    try:
+        options = parse_options(request.args)
+        matrix = get_returns_matrix()
+        with metrics.phase('analytics'):
+            betas = matrix.betas(ticker_list() or None, benchmark, options['window'], options['min_periods'])
+
+        return jsonify({
+            'benchmark': benchmark.upper(),
+            'window': options['window'],
+            'betas': [
+                {'ticker': t.upper(), 'beta': format_number(b), 'correlation': format_number(c), 'observations': int(n)}
+                for t, (b, c, n) in betas.items()
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/relative-strength', methods=['GET'])
+@cached
+def get_relative_strength():
+    """The ?top= tickers with the strongest return over ?window= sessions relative to ?benchmark="""
+    from analytics import ANALYTICS_BENCHMARK, format_number, parse_options
+    benchmark = request.args.get('benchmark', ANALYTICS_BENCHMARK).strip().lower()
+    try:
+        options = parse_options(request.args)
+        matrix = get_returns_matrix()
+        with metrics.phase('analytics'):
+            ranking, reference = matrix.relative_strength(benchmark, options['window'], options['min_periods'])
+
         return jsonify({
-            'total_stocks': total_stocks,
-            'active_stocks': active_stocks,
-            'total_volume': total_volume,
-            'last_updated': datetime.now().isoformat()
+            'benchmark': benchmark.upper(),
+            'window': options['window'],
+            'benchmark_return': format_number(reference),
+            'count': len(ranking),
+            'ranking': [
+                {'ticker': t.upper(), 'return': format_number(r), 'relative_strength': format_number(s),
+                 'percentile': format_number(p, 1)}
+                for t, r, s, p in ranking[:options['top']]
+            ]
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """Server-Sent Events: new bars, indicator rows and signal changes of ?tickers=, market summary with ?market=1"""
+    tickers = sorted({t.strip().lower() for t in request.args.get('tickers', '').split(',') if t.strip()})
+    market = request.args.get('market') in ('1', 'true')
+    if not tickers and not market:
+        return jsonify({'error': 'Subscribe to tickers and/or market'}), 400
+    if len(tickers) > STREAM_MAX_TICKERS:
+        return jsonify({'error': f'At most {STREAM_MAX_TICKERS} tickers per stream'}), 400
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+    
+    try:
+        subscription = change_feed.subscribe(tickers, market, last_event_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def events():
+        try:
+            # Reconnect after 5s if the connection drops
+            yield 'retry: 5000\n\n'
+            while True:
+                text = subscription.get(STREAM_HEARTBEAT)
+                yield text if text is not None else ': keep-alive\n\n'
+        finally:
+            change_feed.unsubscribe(subscription)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/export', methods=['GET'])
+def export_history():
+    """Full history of ?tickers= as ?kind=bars|indicators between ?start and ?end, streamed as
+    ?format=csv|ndjson|arrow with ?compression=none|gzip|zstd"""
+    from export import EXPORT_MAX_TICKERS, MEDIA_TYPES, check_options, export_slots, export_stream, filename, parse_range
+    from storage import EXPORT_COLUMNS
+    tickers = ticker_list()
+    kind = request.args.get('kind', 'indicators')
+    fmt = request.args.get('format', 'csv')
+    compression = request.args.get('compression', 'none')
+    if not tickers:
+        return jsonify({'error': 'tickers is required'}), 400
+    if len(tickers) > EXPORT_MAX_TICKERS:
+        return jsonify({'error': f'At most {EXPORT_MAX_TICKERS} tickers per export'}), 400
+    if kind not in EXPORT_COLUMNS:
+        return jsonify({'error': f"kind must be one of {', '.join(EXPORT_COLUMNS)}"}), 400
+    try:
+        check_options(fmt, compression)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        start, end = parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid range: {e}'}), 400
+
+    if not export_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many exports in progress, retry later'}), 429
+    try:
+        # Unpooled: a long export must not hold one of the connections the other routes share
+        mydb = connect()
     except Exception as e:
+        export_slots.release()
         return jsonify({'error': str(e)}), 500
 
+    def close():
+        mydb.close()
+        export_slots.release()
+
+    response = Response(export_stream(mydb, tickers, kind, start, end, fmt, compression), mimetype=MEDIA_TYPES[fmt],
+                        headers={
+                            'Content-Disposition': f'attachment; filename="{filename(kind, fmt, compression)}"',
+                            'X-Accel-Buffering': 'no'
+                        })
+    # Runs when the response finishes or the client goes away, even before the first chunk
+    response.call_on_close(close)
+    return response
+
+@app.route('/api/db/pool', methods=['GET'])
+def get_pool_stats():
+    """Connection pool statistics for sizing the pool"""
+    return jsonify(pool_stats())
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Response cache statistics"""
+    return jsonify(response_cache.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, phase, query, cache and model latency metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving requests"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once the model and screener snapshot are warm, 503 before; includes phase timings"""
+    status = startup.status()
+    return jsonify(status), 200 if status['status'] == 'ready' else 503
+
+@app.route('/_ah/warmup', methods=['GET'])
+def warmup():
+    """App Engine warmup request: finish warming before the instance gets traffic"""
+    startup.warm(wait=60)
+    status = startup.status()
+    return jsonify(status), 200 if status['status'] == 'ready' else 503
+
+def import_modules(*names):
+    for name in names:
+        importlib.import_module(name)
+
+def warm_snapshot():
+    from screener import get_snapshot
+    get_snapshot(get_db_connection)
+
+# Warm-up steps, run after the first request (or at import with STARTUP_MODE=eager)
+startup.add_step('import_model', lambda: import_modules('ml_model'))
+startup.add_step('model', load_ml_model)
+startup.add_step('import_data', lambda: import_modules('pandas', 'storage', 'serialization', 'chart',
+                                                       'market_summary', 'screener'))
+startup.add_step('snapshot', warm_snapshot)
+
+startup.mark('import')
+if STARTUP_MODE == 'eager':
+    startup.run()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""Vectorized backtests of model signals and screener rules across the whole universe.
+
+The stored indicator histories are aligned on a common date axis as
+(tickers, dates) matrices. A strategy turns them into an entry matrix (+1 long,
+-1 short, 0 none); every entry is held for a fixed number of sessions, so each
+day's signals form a cohort, as if the screener or the signal table had been
+acted on every evening. Trades, the daily portfolio return (equal weight per
+open trade), hit rate and drawdown come from whole-matrix operations, and a
+grid of holding periods, costs and thresholds runs across worker processes.
+
+    python backtest.py --strategy model --holding 5,10,20 --cost-bps 0,10 --min-confidence 0,60
+    python backtest.py --strategy screener --criteria '{"rsi_oversold": 30}' --holding 5,20
+
+Model signals are scored with the saved model. By default the backtest starts
+after the model's training period (recorded when it is trained) plus its label
+horizon, so only out-of-sample entries count; an earlier --start is reported
+as in-sample, since the model has already seen those outcomes.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from db import get_connection
+from features import INDICATOR_COLUMNS, compute_feature_matrix, to_matrix
+from model import TradingMLModel, load_history_arrays
+from screener import SNAPSHOT_COLUMNS, criteria_mask
+
+TRADING_DAYS = 252
+
+# Tickers whose features are computed and scored at once when building model signals
+SIGNAL_CHUNK_SIZE = 100
+
+SIDES = {'Buy': 1, 'Sell': -1, 'Hold': 0}
+
+
+class Universe:
+    """Indicator histories of many tickers aligned on the union of their dates"""
+
+    def __init__(self, tickers, dates, positions, histories):
+        self.tickers = tickers
+        self.dates = dates
+        self.positions = positions  # per ticker, the date index of each of its rows
+        self.histories = histories
+
+    @classmethod
+    def load(cls, mydb, tickers):
+        histories = load_history_arrays(mydb, tickers)
+        tickers = [t for t in tickers if t in histories and len(histories[t]['timestamp'])]
+        histories = [histories[t] for t in tickers]
+        days = [h['timestamp'].astype('datetime64[D]') for h in histories]
+        dates = np.unique(np.concatenate(days)) if days else np.empty(0, dtype='datetime64[D]')
+        positions = [np.searchsorted(dates, d) for d in days]
+        return cls(tickers, dates, positions, histories)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def align(self, rows, fill=np.nan, dtype=np.float64):
+        """(tickers, dates) matrix from per-ticker row arrays (a column name or a list of arrays)"""
+        matrix = np.full((len(self.tickers), len(self.dates)), fill, dtype=dtype)
+        for i, position in enumerate(self.positions):
+            row = self.histories[i][rows] if isinstance(rows, str) else rows[i]
+            matrix[i, position] = row[:len(position)]
+        return matrix
+
+    def matrix(self, name):
+        return self.align(name)
+
+    def window(self, start=None, end=None):
+        """Boolean date mask of [start, end]"""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start:
+            mask &= self.dates >= np.datetime64(start, 'D')
+        if end:
+            mask &= self.dates <= np.datetime64(end, 'D')
+        return mask
+
+
+def model_signals(universe, model):
+    """Side (+1 Buy, -1 Sell, 0 Hold) and confidence (0-100) of the model's prediction for every cell"""
+    side_rows, confidence_rows = [], []
+    classes = model.classes
+    class_sides = np.array([SIDES.get(c, 0) for c in classes], dtype=np.int8)
+    for i in range(0, len(universe), SIGNAL_CHUNK_SIZE):
+        frames = universe.histories[i:i + SIGNAL_CHUNK_SIZE]
+        close = to_matrix([f['close'] for f in frames])
+        ind = {name: to_matrix([f[name] for f in frames]) for name in INDICATOR_COLUMNS}
+        features = compute_feature_matrix(close, to_matrix([f['volume'] for f in frames]), ind)
+        valid = np.isfinite(features).all(axis=2)
+
+        side = np.zeros(close.shape, dtype=np.int8)
+        confidence = np.full(close.shape, np.nan)
+        if valid.any():
+            proba = model.predict_proba(features[valid])
+            side[valid] = class_sides[np.argmax(proba, axis=1)]
+            confidence[valid] = proba.max(axis=1) * 100
+        side_rows.extend(side)
+        confidence_rows.extend(confidence)
+    return universe.align(side_rows, fill=0, dtype=np.int8), universe.align(confidence_rows)
+
+
+def out_of_sample_start(dates, training):
+    """First session after the model's last training sample and label horizon, None if the period is unknown"""
+    if not training.get('trained_until'):
+        return None
+    i = np.searchsorted(dates, np.datetime64(training['trained_until'], 'D'), side='right')
+    i += int(training.get('lookforward_days', 0))
+    return dates[i] if i < len(dates) else dates[-1] + np.timedelta64(1, 'D')
+
+
+def screener_entries(universe, criteria, side=1):
+    """Entries on every cell passing the screener criteria"""
+    columns = {name: universe.matrix(name) for name in SNAPSHOT_COLUMNS}
+    mask = criteria_mask(columns, criteria, columns['close'].shape) & np.isfinite(columns['close'])
+    return (mask * side).astype(np.int8)
+
+
+def forward_returns(close, holding):
+    """Return from each day's close to the close `holding` sessions later"""
+    forward = np.full(close.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        forward[:, :-holding] = close[:, holding:] / close[:, :-holding] - 1
+    return forward
+
+
+def open_positions(entries, holding):
+    """Sum of the entries held on each day: those made on one of the previous `holding` closes"""
+    cumulative = np.cumsum(entries, axis=1, dtype=np.int64)
+    before = np.zeros_like(cumulative)
+    before[:, holding:] = cumulative[:, :-holding]
+    positions = np.zeros_like(cumulative)
+    positions[:, 1:] = (cumulative - before)[:, :-1]
+    return positions
+
+
+def run_backtest(close, entries, holding, cost_bps=0.0, window=None):
+    """Trade and portfolio statistics of holding every entry for `holding` sessions.
+
+    cost_bps is charged on entry and on exit. Entries without a close `holding`
+    sessions later are dropped; window limits entries to a date mask.
+    """
+    cost = cost_bps / 10000
+    forward = forward_returns(close, holding)
+    entries = np.where(np.isfinite(forward), entries, 0).astype(np.int8)
+    if window is not None:
+        entries[:, ~window] = 0
+
+    sides = entries[entries != 0]
+    trade_returns = sides * forward[entries != 0] - 2 * cost
+
+    positions = open_positions(entries, holding)
+    # Open trades of either side, each one unit of capital
+    open_units = open_positions(np.abs(entries), holding).sum(axis=0)
+
+    filled = pd.DataFrame(close.T).ffill().to_numpy().T
+    daily = np.zeros(close.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily[:, 1:] = filled[:, 1:] / filled[:, :-1] - 1
+    daily = np.nan_to_num(daily)
+
+    # Round-trip costs are charged on the first day a trade is held
+    entering = np.zeros(close.shape[1])
+    entering[1:] = np.abs(entries).sum(axis=0)[:-1]
+    pnl = (positions * daily).sum(axis=0) - 2 * cost * entering
+    portfolio = np.divide(pnl, open_units, out=np.zeros_like(pnl), where=open_units > 0)
+
+    equity = np.cumprod(1 + portfolio)
+    drawdown = equity / np.maximum.accumulate(equity) - 1 if len(equity) else np.zeros(0)
+    active = open_units > 0
+    days = int(active.sum())
+    std = portfolio[active].std() if days > 1 else 0.0
+
+    return {
+        'trades': int(len(trade_returns)),
+        'long_trades': int((sides > 0).sum()),
+        'short_trades': int((sides < 0).sum()),
+        'hit_rate': float((trade_returns > 0).mean()) if len(trade_returns) else None,
+        'avg_trade_return': float(trade_returns.mean()) if len(trade_returns) else None,
+        'total_return': float(equity[-1] - 1) if len(equity) else 0.0,
+        'annual_return': float(equity[-1] ** (TRADING_DAYS / days) - 1) if days and equity[-1] > 0 else None,
+        'sharpe': float(portfolio[active].mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else None,
+        'max_drawdown': float(drawdown.min()) if len(drawdown) else 0.0,
+        'exposure': days / len(equity) if len(equity) else 0.0
+    }
+
+
+_close = None
+_signals = None
+
+
+def _init_worker(close, signals):
+    """Hold the universe matrices in each worker for all of its grid points"""
+    global _close, _signals
+    _close, _signals = close, signals
+
+
+def run_grid_point(params):
+    """Backtest one grid point on the worker's matrices"""
+    side, confidence = _signals['side'], _signals.get('confidence')
+    entries = side
+    if confidence is not None and params.get('min_confidence'):
+        entries = np.where(confidence >= params['min_confidence'], side, 0)
+    if not params.get('short', True):
+        entries = np.where(entries > 0, entries, 0)
+    stats = run_backtest(_close, entries.astype(np.int8), params['holding'], params['cost_bps'], _signals.get('window'))
+    return {**params, **stats}
+
+
+def run_grid(close, signals, grid, workers=1):
+    """Backtest every grid point, over worker processes when workers > 1"""
+    if workers <= 1:
+        _init_worker(close, signals)
+        return [run_grid_point(params) for params in grid]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(close, signals)) as executor:
+        return list(executor.map(run_grid_point, grid))
+
+
+def _numbers(text, cast=float):
+    return [cast(v) for v in text.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest model signals or screener rules over the stored history')
+    parser.add_argument('--strategy', choices=['model', 'screener'], default='model')
+    parser.add_argument('--criteria', default='{}', help='screener criteria as JSON (screener strategy)')
+    parser.add_argument('--holding', default='5', help='comma-separated holding periods in sessions')
+    parser.add_argument('--cost-bps', default='10', help='comma-separated costs per side in basis points')
+    parser.add_argument('--min-confidence', default='0', help='comma-separated minimum model confidence (0-100)')
+    parser.add_argument('--long-only', action='store_true', help='ignore Sell signals')
+    parser.add_argument('--tickers', help='comma-separated tickers (default: all of stock_list)')
+    parser.add_argument('--start', help='first entry date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last entry date (YYYY-MM-DD)')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes for the grid (0 = one per CPU)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with get_connection() as mydb:
+        if args.tickers:
+            tickers = [t.strip().lower() for t in args.tickers.split(',') if t.strip()]
+        else:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker FROM stock_list')
+            tickers = [row[0].lower() for row in cursor.fetchall()]
+            cursor.close()
+        universe = Universe.load(mydb, tickers)
+    if not len(universe):
+        print("No indicator history to backtest")
+        return
+    close = universe.matrix('close')
+    print(f"Loaded {len(universe)} tickers x {len(universe.dates)} sessions in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    warning = None
+    if args.strategy == 'model':
+        if not os.path.exists('trading_model.pkl'):
+            print("No trained model found; run `python ml_model.py` first")
+            return
+        model = TradingMLModel().load()
+        first_unseen = out_of_sample_start(universe.dates, model.training)
+        if first_unseen is None:
+            warning = "the model's training period is unknown (retrain to record it); results may be in-sample"
+        elif args.start is None:
+            args.start = str(first_unseen)
+            print(f"Scoring entries from {args.start}, after the training data (until "
+                  f"{model.training['trained_until']}); pass --start to include earlier sessions")
+        elif np.datetime64(args.start, 'D') < first_unseen:
+            warning = (f"entries before {first_unseen} are IN-SAMPLE: the model was trained on them (until "
+                       f"{model.training['trained_until']}), so these results overstate its performance")
+        side, confidence = model_signals(universe, model)
+        signals = {'side': side, 'confidence': confidence}
+        thresholds = _numbers(args.min_confidence)
+    else:
+        signals = {'side': screener_entries(universe, json.loads(args.criteria))}
+        thresholds = [0.0]
+    signals['window'] = universe.window(args.start, args.end)
+    print(f"Built {args.strategy} signals in {time.perf_counter() - start:.1f}s")
+    if not signals['window'].any():
+        print(f"No sessions to backtest from {args.start}")
+        return
+    if warning:
+        print(f"\nWARNING: {warning}")
+
+    grid = [
+        {'holding': holding, 'cost_bps': cost_bps, 'min_confidence': threshold, 'short': not args.long_only}
+        for holding, cost_bps, threshold in itertools.product(
+            _numbers(args.holding, int), _numbers(args.cost_bps), thresholds
+        )
+    ]
+    start = time.perf_counter()
+    results = run_grid(close, signals, grid, min(args.workers or os.cpu_count(), len(grid)))
+    print(f"Ran {len(grid)} backtests in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'holding':>7} {'cost':>6} {'conf':>5} {'trades':>8} {'hit':>6} {'avg':>8} {'total':>9} {'sharpe':>7} {'max dd':>8}")
+    for r in sorted(results, key=lambda r: r['sharpe'] if r['sharpe'] is not None else -np.inf, reverse=True):
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{r['holding']:>7} {r['cost_bps']:>6g} {r['min_confidence']:>5g} {r['trades']:>8} "
+              f"{fmt(r['hit_rate'], '6.1%')} {fmt(r['avg_trade_return'], '8.2%')} {r['total_return']:>9.1%} "
+              f"{fmt(r['sharpe'], '7.2f')} {r['max_drawdown']:>8.1%}")
+    if warning:
+        print(f"\nWARNING: {warning}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'strategy': args.strategy, 'criteria': json.loads(args.criteria), 'tickers': len(universe),
+                       'sessions': len(universe.dates), 'start': args.start, 'end': args.end,
+                       'warning': warning, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""Reproducible benchmarks of indicator generation, training, prediction and the API.
+
+Each run generates a synthetic universe of N tickers x M days and loads it into
+a SQLite stand-in for MySQL (sqlite_shim.py), in the layout selected by
+STORAGE_LAYOUT. It then times the scenarios and writes the results as JSON, so
+runs at different universe sizes or commits can be compared:
+
+    python benchmark.py --tickers 50,200 --days 750 --output bench.json
+    python benchmark.py --tickers 50,200 --days 750 --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+import analytics
+import db
+import indicators
+import model
+import screener
+from changes import ensure_tables as ensure_change_tables
+from events import ensure_tables as ensure_event_tables
+from market_summary import ensure_tables as ensure_market_tables, refresh_summary
+from storage import get_storage
+
+SCENARIO_GROUPS = ('indicators', 'model', 'api')
+
+# Tickers used for the per-call prediction scenario and the multi-ticker predict route
+PREDICT_SAMPLE = 20
+PREDICT_MANY = 50
+
+# Imports app.py in a fresh interpreter, waits for the warm-up and prints the startup phases
+COLD_START_SCRIPT = """
+import importlib.abc, importlib.util, json, os, sys
+sys.path.insert(0, {root!r})
+
+class MlModel(importlib.abc.MetaPathFinder):
+    # app.py imports the model module as ml_model
+    def find_spec(self, name, path, target=None):
+        if name == 'ml_model':
+            return importlib.util.spec_from_file_location(name, os.path.join({root!r}, 'model.py'))
+
+sys.meta_path.append(MlModel())
+import app
+app.app.test_client().get('/api/health')
+app.startup.warm(wait=300)
+print(json.dumps(app.startup.status()))
+"""
+
+SCREEN_CRITERIA = {'min_price': 10, 'min_volume': 500000, 'rsi_oversold': 70, 'macd_bullish': True}
+
+
+def synthetic_universe(n_tickers, n_days, seed=0, end='2024-12-31'):
+    """Random-walk daily OHLCV bars on business days ending at end, as (tickers, days) matrices"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.bdate_range(end=end, periods=n_days).to_numpy(dtype='datetime64[s]') + np.timedelta64(4, 'h')
+    shape = (n_tickers, n_days)
+
+    start = rng.uniform(5, 500, size=(n_tickers, 1))
+    drift = rng.normal(0.0003, 0.0002, size=(n_tickers, 1))
+    volatility = rng.uniform(0.01, 0.04, size=(n_tickers, 1))
+    close = np.round(start * np.exp(np.cumsum(drift + volatility * rng.standard_normal(shape), axis=1)), 2)
+    open_ = np.round(close * (1 + rng.normal(0, 0.005, shape)), 2)
+    high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, shape))), 2)
+    low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, shape))), 2)
+
+    tickers = [f"syn{i:05d}" for i in range(n_tickers)]
+    return tickers, {
+        'timestamp': timestamps,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(100000, 5000000, shape),
+        'vwap': np.round((high + low + close) / 3, 4),
+        'transactions': rng.integers(1000, 50000, shape)
+    }
+
+
+def bar_rows(bars, i, days):
+    """BAR_COLUMNS tuples of ticker row i for the given day slice"""
+    timestamps = bars['timestamp'][days].tolist()
+    columns = [bars[c][i, days].tolist() for c in ('open', 'high', 'low', 'close', 'volume', 'vwap')]
+    transactions = bars['transactions'][i, days].tolist()
+    return [(*values, ts, n, None) for *values, ts, n in zip(*columns, timestamps, transactions)]
+
+
+def populate(tickers, bars, days):
+    """Create stock_list and the bars of the first `days` days of every ticker"""
+    mydb = db.connect()
+    cursor = mydb.cursor()
+    storage = get_storage()
+    storage.ensure_schema(cursor)
+    ensure_market_tables(cursor)
+    ensure_event_tables(cursor)
+    ensure_change_tables(cursor)
+    indicators.ensure_state_table(cursor)
+    cursor.execute('CREATE TABLE IF NOT EXISTS stock_list (ticker VARCHAR(16) PRIMARY KEY, stock VARCHAR(255))')
+    cursor.executemany('INSERT INTO stock_list (ticker, stock) VALUES (%s, %s)',
+                       [(t.upper(), f"Synthetic {t.upper()}") for t in tickers])
+    for i, ticker in enumerate(tickers):
+        storage.ensure_bars(cursor, ticker)
+        storage.insert_bars(cursor, ticker, bar_rows(bars, i, slice(0, days)))
+    mydb.commit()
+    db.bump_data_version(mydb)
+    cursor.close()
+    mydb.close()
+
+
+def append_day(tickers, bars, day):
+    mydb = db.connect()
+    cursor = mydb.cursor()
+    storage = get_storage()
+    for i, ticker in enumerate(tickers):
+        storage.insert_bars(cursor, ticker, bar_rows(bars, i, slice(day, day + 1)))
+    mydb.commit()
+    cursor.close()
+    mydb.close()
+
+
+def publish():
+    """What the data jobs do after a run: refresh the market summary and bump the data version"""
+    mydb = db.connect()
+    refresh_summary(mydb)
+    db.bump_data_version(mydb)
+    mydb.close()
+
+
+def run_indicators(tickers, incremental, workers):
+    failures = [r for r in indicators.run_tickers(tickers, incremental, workers) if r[3] is not None]
+    if failures:
+        raise RuntimeError(f"indicators failed for {len(failures)} tickers, e.g. {failures[0][0]}: {failures[0][3]}")
+
+
+def timed(fn, repeat, setup=None):
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+class Suite:
+    """Scenarios of one universe size, sharing the database built by setup()"""
+
+    def __init__(self, n_tickers, n_days, repeat, workdir, workers=1, train_workers=None, seed=0):
+        self.n_tickers = n_tickers
+        self.n_days = n_days
+        self.repeat = repeat
+        self.workers = workers
+        self.train_workers = train_workers
+        self.dir = os.path.join(workdir, f"{n_tickers}x{n_days}")
+        self.tickers, self.bars = synthetic_universe(n_tickers, n_days + repeat, seed)
+        self.next_day = n_days
+        self.results = []
+
+    def record(self, scenario, seconds, calls=1):
+        self.results.append({
+            'scenario': scenario,
+            'tickers': self.n_tickers,
+            'days': self.n_days,
+            'repeat': len(seconds),
+            'calls': calls,
+            'seconds': seconds,
+            'min': min(seconds),
+            'median': statistics.median(seconds),
+            'mean': statistics.mean(seconds)
+        })
+
+    def setup(self):
+        """Point every module at a fresh SQLite database (and local store) in the suite directory"""
+        db.DB_SQLITE_PATH = os.environ['DB_SQLITE_PATH'] = os.path.join(self.dir, 'stocks.sqlite')
+        if db._pool is not None:
+            db._pool.close_all()
+        db._pool = None
+        indicators._worker_db = None
+        screener._snapshot = None
+        analytics._matrix = None
+
+        storage = get_storage()
+        if hasattr(storage, 'store'):
+            from local_store import LocalStore
+            storage.store = LocalStore(os.path.join(self.dir, 'local_store'))
+
+        self.record('populate', timed(lambda: populate(self.tickers, self.bars, self.n_days), 1))
+
+    def run_indicators(self):
+        self.record('indicators.rebuild', timed(lambda: run_indicators(self.tickers, False, self.workers), self.repeat))
+
+        def add_day():
+            append_day(self.tickers, self.bars, self.next_day)
+            self.next_day += 1
+
+        self.record('indicators.incremental',
+                    timed(lambda: run_indicators(self.tickers, True, self.workers), self.repeat, setup=add_day))
+        publish()
+
+    def run_model(self):
+        trainer = model.TradingMLModel()
+        self.record('model.train', timed(lambda: trainer.train_model(workers=self.train_workers, folds=2), 1))
+        if not os.path.exists('trading_model.pkl'):
+            raise RuntimeError(f"training produced no model from {self.n_days} days; use a longer --days")
+
+        predictor = model.TradingMLModel().load()
+        self.record('model.generate_signals', timed(predictor.generate_signals, self.repeat))
+        self.record('model.predict_batch', timed(lambda: predictor.predict_batch(self.tickers), self.repeat))
+
+        sample = self.tickers[:PREDICT_SAMPLE]
+        self.record('model.predict_trading_signal',
+                    timed(lambda: [predictor.predict_trading_signal(t) for t in sample], self.repeat), calls=len(sample))
+
+    def run_api(self):
+        # app.py imports the model module as ml_model
+        sys.modules.setdefault('ml_model', model)
+        import app as api
+
+        client = api.app.test_client()
+        ticker = self.tickers[0].upper()
+        routes = [
+            ('api.stocks', 'GET', '/api/stocks', None),
+            ('api.stock_data', 'GET', f"/api/stock/{ticker}/data", None),
+            ('api.stock_data.columns', 'GET', f"/api/stock/{ticker}/data?format=columns", None),
+            ('api.market_summary', 'GET', '/api/market-summary', None),
+            ('api.screener', 'POST', '/api/screener', SCREEN_CRITERIA),
+            ('api.predict', 'GET', f"/api/predict/{ticker}", None),
+            ('api.predict_many', 'POST', '/api/predict', {'tickers': [t.upper() for t in self.tickers[:PREDICT_MANY]]}),
+            ('api.analytics_correlated', 'GET', f"/api/analytics/correlation/{ticker}", None),
+            ('api.analytics_pairs', 'GET', '/api/analytics/pairs', None),
+            ('api.analytics_relative_strength', 'GET', '/api/analytics/relative-strength', None)
+        ]
+
+        def request(method, path, body):
+            response = client.open(path, method=method, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+        def cold():
+            api.response_cache.local.clear()
+            api.data_version._version = None
+            screener._snapshot = None
+            analytics._matrix = None
+
+        for name, method, path, body in routes:
+            self.record(f"{name}.cold", timed(lambda: request(method, path, body), self.repeat, setup=cold))
+            request(method, path, body)
+            self.record(f"{name}.warm", timed(lambda: request(method, path, body), self.repeat))
+
+        self.run_cold_start()
+
+    def run_cold_start(self):
+        """Seconds from interpreter start until app.py is imported and until the warm-up has finished"""
+        script = COLD_START_SCRIPT.format(root=os.path.dirname(os.path.abspath(__file__)))
+        phases = []
+        for _ in range(self.repeat):
+            result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+            status = json.loads(result.stdout.strip().splitlines()[-1])
+            if status['status'] != 'ready':
+                raise RuntimeError(f"warm-up did not finish: {status['errors']}")
+            phases.append(status['phases'])
+        for phase in ('import', 'ready'):
+            self.record(f"api.cold_start.{phase}", [p[phase] for p in phases])
+
+    def run(self, groups):
+        self.setup()
+        # Scenarios build on each other: the model needs indicators, the API needs signals
+        self.run_indicators()
+        if 'model' in groups or 'api' in groups:
+            self.run_model()
+        if 'api' in groups:
+            self.run_api()
+        wanted = ('populate',) + tuple(groups)
+        return [r for r in self.results if r['scenario'].split('.')[0] in wanted]
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    storage = get_storage()
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'storage_layout': storage.layout,
+        'local_store': hasattr(storage, 'store')
+    }
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Print median ratios against a baseline run; returns the regressed scenarios"""
+    previous = {(r['scenario'], r['tickers'], r['days']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'scenario':40} {'tickers':>7} {'days':>6} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for r in results:
+        old = previous.get((r['scenario'], r['tickers'], r['days']))
+        if old is None:
+            continue
+        ratio = r['median'] / old['median'] if old['median'] else float('inf')
+        # Sub-millisecond scenarios jitter by more than the threshold, so also require an absolute slowdown
+        slower = ratio > 1 + threshold and r['median'] - old['median'] > min_delta
+        flag = ' REGRESSION' if slower else ''
+        print(f"{r['scenario']:40} {r['tickers']:>7} {r['days']:>6} {old['median']:>10.4f} {r['median']:>10.4f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data jobs, the model and the API on synthetic data')
+    parser.add_argument('--tickers', default='50', help='comma-separated universe sizes')
+    parser.add_argument('--days', type=int, default=500, help='trading days of history per ticker')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIO_GROUPS), help='groups to report: indicators, model, api')
+    parser.add_argument('--workers', type=int, default=1, help='indicators.py worker processes')
+    parser.add_argument('--train-workers', type=int, help='feature extraction processes when training')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='where databases and model files go (default: a temporary directory)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON results to compare medians against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='median slowdown reported as a regression')
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help='seconds a median must also slow down by to count as a regression')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the benchmarked code')
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.scenarios.split(',') if g.strip()]
+    unknown = set(groups) - set(SCENARIO_GROUPS)
+    if unknown:
+        parser.error(f"unknown scenario groups: {', '.join(sorted(unknown))}")
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='trade_vision_bench_'))
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = []
+    cwd = os.getcwd()
+    try:
+        for n_tickers in [int(n) for n in args.tickers.split(',')]:
+            suite = Suite(n_tickers, args.days, args.repeat, workdir, args.workers, args.train_workers, args.seed)
+            # Model files are written to the working directory
+            shutil.rmtree(suite.dir, ignore_errors=True)
+            os.makedirs(suite.dir)
+            os.chdir(suite.dir)
+            print(f"Benchmarking {n_tickers} tickers x {args.days} days...")
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                suite_results = suite.run(groups)
+            for r in suite_results:
+                per_call = f" ({r['median'] / r['calls'] * 1000:.2f} ms/call)" if r['calls'] > 1 else ''
+                print(f"  {r['scenario']:40} median {r['median']:.4f}s  min {r['min']:.4f}s{per_call}")
+            results.extend(suite_results)
+    finally:
+        os.chdir(cwd)
+
+    report = {'environment': environment(), 'results': results}
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if baseline is not None and compare(results, baseline, args.threshold, args.min_delta):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
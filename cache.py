@@ -0,0 +1,203 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request
+from db import get_data_version
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))  # Seconds before an entry expires regardless of version
+CACHE_BACKEND_URL = os.environ.get('CACHE_BACKEND_URL')  # e.g. redis://localhost:6379/0 to share across workers
+
+# Seconds between data-version checks against MySQL
+DATA_VERSION_CHECK_INTERVAL = float(os.environ.get('DATA_VERSION_CHECK_INTERVAL', 5))
+
+
+class LRUCache:
+    """Bounded in-process LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """Dict-backed stand-in for a shared cache server, for local runs and tests"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+
+class RedisBackend:
+    """Shared cache in Redis, so every worker and instance reuses one rendered payload"""
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=int(ttl))
+
+
+class ResponseCache:
+    """Two-level cache of rendered JSON responses keyed by endpoint, parameters and data version"""
+
+    def __init__(self, local=None, shared=None, ttl=CACHE_TTL):
+        self.local = local or LRUCache(ttl=ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            self.count('hits')
+            return entry
+        if self.shared is not None:
+            try:
+                data = self.shared.get(key)
+            except Exception:
+                data = None
+            if data is not None:
+                entry = pickle.loads(data)
+                self.local.set(key, entry)
+                self.count('shared_hits')
+                return entry
+        self.count('misses')
+        return None
+
+    def set(self, key, entry):
+        self.local.set(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, pickle.dumps(entry), self.ttl)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['entries'] = len(self.local)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+class DataVersion:
+    """Data-version stamp bumped by fetch.py and indicators.py, re-read at most every check_interval seconds"""
+
+    def __init__(self, check_interval=DATA_VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, get_connection):
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._version
+        with self._lock:
+            if self._version is None or time.monotonic() - self._checked_at >= self.check_interval:
+                with get_connection() as mydb:
+                    self._version = get_data_version(mydb)
+                self._checked_at = time.monotonic()
+        return self._version
+
+
+def make_key(version, path, args):
+    params = '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+    return f"v{version}:{path}?{params}"
+
+
+def default_cache():
+    shared = None
+    if CACHE_BACKEND_URL:
+        if CACHE_BACKEND_URL == 'memory://':
+            shared = MemoryBackend()
+        elif redis is not None:
+            shared = RedisBackend(CACHE_BACKEND_URL)
+        else:
+            print("CACHE_BACKEND_URL is set but redis is not installed; using the in-process cache only")
+    return ResponseCache(shared=shared)
+
+
+def cached_response(cache, data_version, get_connection):
+    """Cache a JSON route's 200 responses until the data version changes, answering If-None-Match with 304"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = make_key(data_version.get(get_connection), request.path, request.args)
+            entry = cache.get(key)
+            if entry is None:
+                result = view(*args, **kwargs)
+                response = result[0] if isinstance(result, tuple) else result
+                status = result[1] if isinstance(result, tuple) else response.status_code
+                if status != 200:
+                    return result
+                body = response.get_data()
+                entry = (body, hashlib.sha1(body).hexdigest())
+                cache.set(key, entry)
+
+            body, etag = entry
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            if etag in request.if_none_match:
+                cache.count('not_modified')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
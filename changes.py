@@ -0,0 +1,418 @@
+"""Change feed of new bars, indicator rows and signals, pushed to streaming clients.
+
+The data jobs append a change_feed row for every ticker they touch: fetch.py
+for new bars, indicators.py for new indicator rows (or a rebuilt history) and
+ml_model.py for signals whose values changed. In the API process a single
+ChangeFeed polls the table every STREAM_POLL_INTERVAL seconds. It reads the
+new rows of the tickers somebody is subscribed to, with one batched query per
+kind, and serializes each event once before fanning it out to the subscribers'
+queues. The database load therefore depends on the number of changes, not on
+the number of open streams.
+
+Ids are AUTO_INCREMENT values of concurrently committing transactions, so a
+lower id can become visible after a higher one. Readers stop at a missing id
+until a later change is STREAM_GAP_TIMEOUT seconds old (the id was then rolled
+back), which keeps the published ids increasing.
+
+Events are Server-Sent Events whose id is the change_feed id. When a client
+reconnects with Last-Event-ID, the changes it missed (and the current market
+summary) are read back from the feed while its live events are held back; a
+change that then arrives from the poller as well is sent once. If the missed
+changes were already pruned, or there are too many of them, the client gets a
+resync event instead.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from db import get_data_version
+
+KINDS = ('bars', 'indicators', 'signal')
+
+# Seconds between polls of change_feed while streams are open
+STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 2))
+
+# Events queued per subscriber; a client that falls further behind is told to resync
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', 256))
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT = 15
+
+# Tickers one stream may subscribe to
+STREAM_MAX_TICKERS = 500
+
+# Rows per ticker sent in one bars/indicators event
+STREAM_MAX_ROWS = 50
+
+# change_feed rows read per poll
+POLL_BATCH_SIZE = 5000
+
+# Seconds before a change_feed id missing below stored ones counts as rolled back. Readers stop at
+# younger gaps, since an open transaction may still commit a lower id than one already read
+STREAM_GAP_TIMEOUT = float(os.environ.get('STREAM_GAP_TIMEOUT', 10))
+
+# change_feed rows kept when the jobs prune it
+CHANGE_FEED_KEEP = int(os.environ.get('CHANGE_FEED_KEEP', 200000))
+
+
+def ensure_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_feed (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(16) NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            since DATETIME NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def record_changes(cursor, kind, changes):
+    """Append (ticker, since) changes of a kind; since is the first new row's timestamp, None for a rebuild"""
+    if changes:
+        cursor.executemany('INSERT INTO change_feed (kind, ticker, since) VALUES (%s, %s, %s)',
+                           [(kind, ticker, since) for ticker, since in changes])
+
+
+def prune(cursor, keep=CHANGE_FEED_KEEP):
+    """Delete all but the latest `keep` changes"""
+    cursor.execute('SELECT MAX(id) FROM change_feed')
+    row = cursor.fetchone()
+    if row and row[0] is not None and row[0] > keep:
+        cursor.execute('DELETE FROM change_feed WHERE id <= %s', (row[0] - keep,))
+
+
+def settled(rows, after_id, now, timeout=STREAM_GAP_TIMEOUT):
+    """Leading rows (id first, created_at last) that no uncommitted lower id can still precede"""
+    expected = after_id + 1
+    for i, row in enumerate(rows):
+        # A missing id before a young row may belong to a transaction that has not committed yet
+        if row[0] != expected and (now - row[-1]).total_seconds() < timeout:
+            return rows[:i]
+        expected = row[0] + 1
+    return rows
+
+
+def _now(cursor):
+    """Database clock, which created_at comes from"""
+    cursor.execute('SELECT CURRENT_TIMESTAMP')
+    return cursor.fetchone()[0]
+
+
+def read_changes(cursor, after_id, limit):
+    """(id, kind, ticker, since) of the settled changes after after_id, oldest first, out of at most limit read"""
+    now = _now(cursor)
+    cursor.execute('SELECT id, kind, ticker, since, created_at FROM change_feed WHERE id > %s ORDER BY id LIMIT %s',
+                   (after_id, limit))
+    return [row[:4] for row in settled(cursor.fetchall(), after_id, now)]
+
+
+def settled_id(cursor, after_id=None):
+    """Highest id up to which every change is committed or rolled back; after_id (or None) if there is none"""
+    now = _now(cursor)
+    cursor.execute('SELECT id, created_at FROM change_feed WHERE id > %s ORDER BY id DESC LIMIT %s',
+                   (after_id or 0, POLL_BATCH_SIZE))
+    rows = cursor.fetchall()[::-1]
+    if not rows:
+        return after_id
+    # Ids older than the latest POLL_BATCH_SIZE changes are long settled
+    start = after_id if after_id is not None and len(rows) < POLL_BATCH_SIZE else rows[0][0] - 1
+    rows = settled(rows, start, now)
+    return rows[-1][0] if rows else start
+
+
+def changed_tickers(cursor, kind, after_id):
+    """(latest settled change id, tickers with changes of kind after after_id).
+
+    The tickers are None when after_id is None or those changes were already
+    pruned; the caller then has to reload everything.
+    """
+    cursor.execute('SELECT MIN(id) FROM change_feed')
+    first = cursor.fetchone()[0]
+    if first is None:
+        return after_id or 0, (None if after_id is None else set())
+    last = settled_id(cursor, after_id)
+    if after_id is None or first > after_id + 1:
+        return last or 0, None
+    cursor.execute('SELECT DISTINCT ticker FROM change_feed WHERE kind = %s AND id > %s AND id <= %s',
+                   (kind, after_id, last))
+    return last, {row[0].lower() for row in cursor.fetchall()}
+
+
+def format_event(event_id, kind, data):
+    """Server-Sent Event text"""
+    lines = [f"event: {kind}", f"data: {json.dumps(data, default=str)}"]
+    if event_id is not None:
+        lines.insert(0, f"id: {event_id}")
+    return '\n'.join(lines) + '\n\n'
+
+
+RESYNC = format_event(None, 'resync', {'reason': 'missed updates; reload the current state'})
+
+
+class Subscription:
+    def __init__(self, tickers, market=False):
+        self.tickers = frozenset(tickers)
+        self.market = market
+        self.queue = queue.Queue(STREAM_QUEUE_SIZE)
+        # Highest change id sent, so a change replayed and then polled again is sent once
+        self.last_id = None
+        # Live events held back while missed changes are replayed
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def wants(self, ticker):
+        return self.market if ticker is None else ticker in self.tickers
+
+    def put(self, text, event_id=None):
+        """Queue an event; event_id (None for market and resync events) drops changes already sent"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((event_id, text))
+            else:
+                self._deliver(event_id, text)
+
+    def _deliver(self, event_id, text):
+        if event_id is not None:
+            if self.last_id is not None and event_id <= self.last_id:
+                return
+            self.last_id = event_id
+        try:
+            self.queue.put_nowait(text)
+        except queue.Full:
+            # Drop the backlog; the client reloads instead of receiving a partial history
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.queue.put_nowait(RESYNC)
+
+    def hold(self):
+        """Buffer live events until release()"""
+        with self._lock:
+            self._pending = []
+
+    def release(self, events=()):
+        """Queue (event id, text) events, then the live events held since hold()"""
+        with self._lock:
+            pending, self._pending = self._pending or [], None
+            for event_id, text in list(events) + pending:
+                self._deliver(event_id, text)
+
+    def get(self, timeout):
+        """Next event text, None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChangeFeed:
+    """Polls change_feed on behalf of every subscriber of this process"""
+
+    def __init__(self, get_connection, interval=STREAM_POLL_INTERVAL):
+        self.get_connection = get_connection
+        self.interval = interval
+        # Last change_feed id read; None while no stream is open
+        self.last_id = None
+        self.version = None
+        self._subscribers = set()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stats = {'polls': 0, 'changes': 0, 'events': 0, 'replays': 0, 'errors': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _start(self):
+        """Start polling from the current end of the feed"""
+        with self.get_connection() as mydb:
+            cursor = mydb.cursor()
+            last_id = settled_id(cursor)
+            cursor.close()
+            self.version = get_data_version(mydb)
+        self.last_id = last_id or 0
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def subscribe(self, tickers, market=False, last_event_id=None):
+        """Register a stream; with last_event_id, the changes it missed since then are queued first"""
+        subscription = Subscription([t.lower() for t in tickers], market)
+        if last_event_id is not None:
+            subscription.hold()
+        with self._start_lock:
+            with self._lock:
+                self._subscribers.add(subscription)
+                running = self._thread is not None
+            if not running:
+                try:
+                    self._start()
+                except Exception:
+                    self.unsubscribe(subscription)
+                    raise
+            # Later changes reach the subscription through the poller
+            until = self.last_id
+        if last_event_id is not None:
+            events = []
+            try:
+                if last_event_id < until:
+                    events = self._replay(subscription, last_event_id)
+            finally:
+                subscription.release(events)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _replay(self, subscription, last_event_id):
+        """(event id, text) of the changes after last_event_id, up to the end of the feed"""
+        self._count('replays')
+        with self.get_connection() as mydb:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT MIN(id) FROM change_feed')
+            first = cursor.fetchone()[0]
+            # Also past the poller's position: whatever it publishes again is dropped as already sent
+            rows = read_changes(cursor, last_event_id, POLL_BATCH_SIZE + 1)
+            cursor.close()
+            # Pruned or too far behind to catch up event by event
+            if first is None or first > last_event_id + 1 or len(rows) > POLL_BATCH_SIZE:
+                return [(None, RESYNC)]
+            events = self._events(mydb, rows, subscription.tickers)
+            if subscription.market and rows:
+                events.extend(self._market_events(mydb, rows[-1][0]))
+        return [(None if ticker is None else event_id, text) for event_id, ticker, text in events]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    # Stop polling until the next stream opens; it starts from the changes made by then
+                    self._thread = None
+                    self.last_id = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                self._count('errors')
+                print(f"Change feed poll failed: {e}")
+
+    def _watched(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        tickers = set()
+        for subscription in subscribers:
+            tickers |= subscription.tickers
+        return tickers, any(s.market for s in subscribers)
+
+    def poll(self):
+        """Read the changes since the last poll and publish the events of watched tickers"""
+        tickers, market = self._watched()
+        with self.get_connection() as mydb:
+            cursor = mydb.cursor()
+            rows = read_changes(cursor, self.last_id, POLL_BATCH_SIZE)
+            cursor.close()
+            self._count('polls')
+            self._count('changes', len(rows))
+
+            events = self._events(mydb, rows, tickers)
+            version = get_data_version(mydb)
+            if version != self.version:
+                self.version = version
+                if market:
+                    events.extend(self._market_events(mydb, rows[-1][0] if rows else self.last_id))
+        if rows:
+            self.last_id = rows[-1][0]
+        self.publish(events)
+
+    def _events(self, mydb, rows, tickers):
+        """(event id, ticker, text) of change_feed rows concerning tickers, one event per ticker and kind"""
+        # kind -> ticker -> [latest change id, earliest since (None: send the latest rows)]
+        changed = {kind: {} for kind in KINDS}
+        for change_id, kind, ticker, since in rows:
+            ticker = ticker.lower()
+            if ticker not in tickers or kind not in changed:
+                continue
+            entry = changed[kind].setdefault(ticker, [change_id, since])
+            entry[0] = change_id
+            if entry[1] is not None and (since is None or since < entry[1]):
+                entry[1] = since
+
+        events = []
+        if changed['bars']:
+            events.extend(self._bar_events(mydb, changed['bars']))
+        if changed['indicators']:
+            events.extend(self._indicator_events(mydb, changed['indicators']))
+        if changed['signal']:
+            events.extend(self._signal_events(mydb, changed['signal']))
+        events.sort(key=lambda e: e[0])
+        return events
+
+    def publish(self, events):
+        """Fan (event id, ticker or None for market events, text) out to the subscribers that want them"""
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats['events'] += len(events)
+        for event_id, ticker, text in events:
+            for subscription in subscribers:
+                if subscription.wants(ticker):
+                    subscription.put(text, None if ticker is None else event_id)
+
+    def _bar_events(self, mydb, changed):
+        from storage import get_storage
+        storage = get_storage()
+        cursor = mydb.cursor()
+        events = []
+        for ticker, (change_id, since) in changed.items():
+            # Newest first from storage
+            rows = [row for row in storage.recent_bars(cursor, ticker, STREAM_MAX_ROWS)
+                    if since is None or row[0] >= since][::-1]
+            if rows:
+                data = {'ticker': ticker.upper(), 'bars': [
+                    {'timestamp': timestamp.isoformat(), 'close': close, 'volume': volume}
+                    for timestamp, close, volume in rows
+                ]}
+                events.append((change_id, ticker, format_event(change_id, 'bars', data)))
+        cursor.close()
+        return events
+
+    def _indicator_events(self, mydb, changed):
+        from serialization import columns_to_records, stock_data_columns
+        from storage import get_storage
+        histories = get_storage().read_indicators(mydb, list(changed), STREAM_MAX_ROWS)
+        events = []
+        for ticker, (change_id, since) in changed.items():
+            df = histories.get(ticker)
+            if df is None:
+                continue
+            if since is not None:
+                df = df[df['timestamp'] >= since]
+            if len(df):
+                # Oldest first; reset means the history was rebuilt and should be reloaded
+                data = {'ticker': ticker.upper(), 'reset': since is None,
+                        'data': columns_to_records(stock_data_columns(df))}
+                events.append((change_id, ticker, format_event(change_id, 'indicators', data)))
+        return events
+
+    def _signal_events(self, mydb, changed):
+        from ml_model import load_signals
+        signals = load_signals(mydb, list(changed))
+        return [
+            (change_id, ticker, format_event(change_id, 'signal', signals[ticker]))
+            for ticker, (change_id, _) in changed.items() if ticker in signals
+        ]
+
+    def _market_events(self, mydb, event_id):
+        from market_summary import format_summary, read_summary
+        summary = read_summary(mydb)
+        if summary is None:
+            return []
+        return [(event_id, None, format_event(event_id, 'market', format_summary(summary)))]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'subscribers': len(self._subscribers), 'last_id': self.last_id}
@@ -0,0 +1,201 @@
+"""Date-range reads of a ticker's indicator history, downsampled for charts.
+
+A ticker's full history is loaded once per data version together with a
+pyramid of min/max levels (the lowest and highest close of every 4, 16, 64...
+bars). A range query picks the coarsest level that still has a few points per
+output point, so a zoomed-out view only downsamples a few thousand candidates
+however long the history is, then reduces them with LTTB or min/max bucketing.
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from cache import CACHE_TTL, LRUCache
+from storage import MA_COLUMNS, get_storage
+
+HISTORY_COLUMNS = MA_COLUMNS + ['volume']
+
+# Tickers whose history and levels are held per process
+CHART_CACHE_TICKERS = int(os.environ.get('CHART_CACHE_TICKERS', 64))
+
+# Bars per bucket of the first level and the ratio between levels
+LEVEL_BASE = 4
+
+# A level is used only if it has at least this many candidates per output point
+LEVEL_OVERSAMPLE = 4
+
+# Smallest max_points LTTB can honour (first, last and one bucket)
+MIN_POINTS = 3
+
+METHODS = ('lttb', 'minmax')
+
+
+def _filled(y):
+    """y with NaNs replaced by the neighbouring value, so argmin/argmax ignore gaps"""
+    if not np.isnan(y).any():
+        return y
+    filled = pd.Series(y).ffill().bfill().to_numpy()
+    return np.where(np.isnan(filled), 0.0, filled)
+
+
+def _bucket_edges(n, buckets, first=0):
+    return np.linspace(first, n, buckets + 1).astype(np.int64)
+
+
+def minmax_indices(y, n_out):
+    """Indices of the lowest and highest value of (n_out - 2)/2 equal buckets plus the end points, at most n_out"""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 4:
+        return np.array([0, n - 1])
+    y = _filled(np.asarray(y, dtype=np.float64))
+    buckets = max((n_out - 2) // 2, 1)
+    edges = _bucket_edges(n, buckets)
+    segment = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sorting by (segment, value) puts every bucket's minimum at its start and maximum at its end
+    order = np.lexsort((y, segment))
+    lows, highs = order[edges[:-1]], order[edges[1:] - 1]
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: n_out indices that keep the visual shape of y over x"""
+    n = len(x)
+    if n <= n_out or n_out < MIN_POINTS:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = _filled(np.asarray(y, dtype=np.float64))
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = _bucket_edges(n - 1, n_out - 2, first=1)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / counts
+    mean_y = np.add.reduceat(y, edges[:-1]) / counts
+    # Each bucket is scored against the average of the next one; the last against the final point
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_indices(x, y, n_out, method='lttb'):
+    if method == 'minmax':
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
+
+
+class ChartHistory:
+    """One ticker's indicator history as column arrays plus its min/max level pyramid"""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.timestamps = arrays['timestamp'].astype('datetime64[s]')
+        self.x = self.timestamps.astype(np.int64).astype(np.float64)
+        self.y = _filled(np.asarray(arrays['close'], dtype=np.float64))
+        self.levels = self._build_levels()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _build_levels(self):
+        """Sorted indices of each level, finest first"""
+        levels = []
+        n = len(self)
+        width = LEVEL_BASE
+        while n // width >= MIN_POINTS:
+            levels.append(minmax_indices(self.y, 2 * (n // width) + 2))
+            width *= LEVEL_BASE
+        return levels
+
+    def _candidates(self, lo, hi, max_points):
+        """Indices in [lo, hi) from the coarsest level with enough points for max_points"""
+        candidates = np.arange(lo, hi)
+        for level in self.levels:
+            sub = level[np.searchsorted(level, lo):np.searchsorted(level, hi)]
+            if len(sub) < LEVEL_OVERSAMPLE * max_points:
+                break
+            candidates = sub
+        # Keep the range's own end points
+        if candidates[0] != lo or candidates[-1] != hi - 1:
+            candidates = np.unique(np.concatenate(([lo, hi - 1], candidates)))
+        return candidates
+
+    def query(self, start=None, end=None, max_points=None, method='lttb'):
+        """Columns of the rows with start <= timestamp < end, downsampled to at most max_points; returns (arrays, total)"""
+        lo = np.searchsorted(self.timestamps, start) if start is not None else 0
+        hi = np.searchsorted(self.timestamps, end) if end is not None else len(self)
+        total = int(max(hi - lo, 0))
+        if total == 0:
+            index = np.arange(0)
+        elif max_points is None or total <= max_points:
+            index = np.arange(lo, hi)
+        else:
+            candidates = self._candidates(lo, hi, max_points)
+            index = candidates[downsample_indices(self.x[candidates], self.y[candidates], max_points, method)]
+        return {name: values[index] for name, values in self.arrays.items()}, total
+
+
+_histories = LRUCache(max_entries=CHART_CACHE_TICKERS, ttl=CACHE_TTL)
+
+
+def get_history(mydb, ticker, version):
+    """Cached ChartHistory of a ticker for a data version, None when the ticker has no indicators"""
+    key = (ticker, version)
+    history = _histories.get(key)
+    if history is None:
+        arrays = get_storage().read_arrays(mydb, [ticker], HISTORY_COLUMNS).get(ticker)
+        if arrays is None or len(arrays['timestamp']) == 0:
+            return None
+        history = ChartHistory(arrays)
+        _histories.set(key, history)
+    return history
+
+
+def parse_bound(value, end=False):
+    """ISO date or datetime as datetime64[s]; a date-only end covers the whole day. Raises ValueError"""
+    if value in (None, ''):
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    if end and len(value) == 10:
+        timestamp += pd.Timedelta(days=1)
+    elif end:
+        timestamp += pd.Timedelta(seconds=1)
+    return np.datetime64(timestamp.floor('s').to_pydatetime(), 's')
+
+
+def main():
+    """Compare the level-based query with downsampling the full range directly"""
+    parser = argparse.ArgumentParser(description='Check and time chart downsampling on synthetic data')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--max-points', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    timestamps = np.datetime64('1990-01-01', 's') + np.arange(args.rows) * 86400
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, args.rows)))
+    history = ChartHistory({'timestamp': timestamps, 'close': close})
+
+    for method in METHODS:
+        start = time.perf_counter()
+        arrays, total = history.query(max_points=args.max_points, method=method)
+        elapsed = time.perf_counter() - start
+        direct = close[downsample_indices(history.x, close, args.max_points, method)]
+        print(f"{method}: {len(arrays['close'])}/{total} points in {elapsed * 1000:.2f} ms; "
+              f"range {arrays['close'].min():.2f}-{arrays['close'].max():.2f} "
+              f"(direct {direct.min():.2f}-{direct.max():.2f}, full {close.min():.2f}-{close.max():.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import os
+import queue
+import socket
+import threading
+import time
+from metrics import InstrumentedCursor, phase
+
+# Database configuration
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', '104.154.25.113'),
+    'user': os.environ.get('DB_USER', 'kshitij'),
+    'password': os.environ.get('DB_PASSWORD', 'Kshitij_17'),
+    'database': os.environ.get('DB_NAME', 'stocks')
+}
+
+# Local SQLite file used through sqlite_shim.py instead of MySQL (benchmarks, offline runs)
+DB_SQLITE_PATH = os.environ.get('DB_SQLITE_PATH')
+
+# Pool configuration
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', 3600))  # Max connection age in seconds
+POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))  # Ping connections idle longer than this
+
+
+# Connections a forked child inherited from its parent. They stay referenced for the life of the
+# child and are never closed: closing or collecting one shuts down the socket the parent still uses
+_inherited = []
+
+
+def _abandon(conn):
+    """Stop a forked child from ever touching the parent's connection: detach its socket and keep it referenced"""
+    sock = getattr(getattr(conn, '_socket', None), 'sock', None)
+    if isinstance(sock, socket.socket):
+        # Without an fd the socket's shutdown() on collection fails harmlessly instead of cutting off the parent
+        sock.detach()
+    _inherited.append(conn)
+
+
+def connect(config=None):
+    """Open a new, unpooled database connection: MySQL, or the SQLite stand-in when DB_SQLITE_PATH is set"""
+    if DB_SQLITE_PATH:
+        from sqlite_shim import connect as sqlite_connect
+        return sqlite_connect(DB_SQLITE_PATH)
+    # Imported on first use, so importing db (and app.py) stays cheap
+    import mysql.connector
+    return mysql.connector.connect(**(config or DB_CONFIG))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """Connection checked out of a ConnectionPool; close() returns it to the pool"""
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections with health checks and recycling"""
+
+    def __init__(self, config=None, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER):
+        self.config = dict(config or DB_CONFIG)
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+
+        self._idle = queue.LifoQueue()
+        self._in_use = set()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'timeouts': 0,
+            'in_use': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+
+    def _connect(self):
+        conn = connect(self.config)
+        with self._lock:
+            self._stats['created'] += 1
+        return conn, time.time()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get_connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f"No database connection available within {self.timeout}s")
+        waited = time.perf_counter() - start
+
+        try:
+            conn, created_at = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use.add(conn)
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        return PooledConnection(self, conn, created_at)
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, created_at, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            now = time.time()
+            if now - created_at > self.recycle:
+                self._discard(conn)
+                with self._lock:
+                    self._stats['recycled'] += 1
+                continue
+
+            if now - released_at > self.ping_after and not conn.is_connected():
+                self._discard(conn)
+                with self._lock:
+                    self._stats['failed_health_checks'] += 1
+                continue
+
+            return conn, created_at
+
+    def _release(self, conn, created_at):
+        with self._lock:
+            self._in_use.discard(conn)
+            self._stats['in_use'] -= 1
+        try:
+            if os.getpid() != self.pid:
+                # Connection was inherited across a fork, never share or close the socket
+                _abandon(conn)
+                return
+            try:
+                # End any open transaction so the next user sees fresh data
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                with self._lock:
+                    self._stats['failed_health_checks'] += 1
+                return
+            self._idle.put((conn, created_at, time.time()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def abandon(self):
+        """Give up every connection of a pool inherited across a fork without closing any of them"""
+        # Runs in the child right after fork, where another thread may have held the lock
+        for conn, _, _ in list(self._idle.queue):
+            _abandon(conn)
+        for conn in list(self._in_use):
+            _abandon(conn)
+        _inherited.append(self)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['pid'] = self.pid
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    global _pool, _pool_lock
+    if _pool is not None and _pool.pid != os.getpid():
+        _pool.abandon()
+        _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_pool():
+    """Return the pool for the current process, creating a fresh one after a fork"""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                if _pool is not None:
+                    _pool.abandon()
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_connection():
+    with phase('db_connect'):
+        return get_pool().get_connection()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def existing_tables(cursor):
+    """Lower-cased names of the tables in the current database"""
+    cursor.execute('SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()')
+    return {row[0].lower() for row in cursor.fetchall()}
+
+
+def ensure_data_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def bump_data_version(mydb):
+    """Record that stock data changed; readers holding derived state reload on a new version"""
+    cursor = mydb.cursor()
+    ensure_data_version_table(cursor)
+    cursor.execute("""
+        INSERT INTO data_version (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """)
+    mydb.commit()
+    cursor.close()
+
+
+def get_data_version(mydb):
+    import mysql.connector
+    cursor = mydb.cursor()
+    try:
+        cursor.execute('SELECT version FROM data_version WHERE id = 1')
+        row = cursor.fetchone()
+    except mysql.connector.Error:
+        row = None
+    finally:
+        cursor.close()
+    return row[0] if row else 0
@@ -0,0 +1,165 @@
+"""Index of indicator events (crossovers, RSI threshold crossings, Fibonacci level breaks).
+
+indicators.py records events while it computes indicator rows: a rebuild
+replaces a ticker's events and an incremental run appends those of the new
+rows. Events are keyed by (event_type, timestamp, ticker), so "which tickers
+had a golden cross in the last 10 sessions" is one range scan per event type.
+Sessions are counted on event_sessions, the distinct bar timestamps seen.
+
+Run `python events.py` once to build the index from the stored indicators.
+"""
+import time
+import numpy as np
+from db import connect
+from storage import MA_COLUMNS, READ_BATCH_SIZE, get_storage
+
+RSI_OVERSOLD = 30
+RSI_OVERBOUGHT = 70
+
+# event type -> (column, column or constant it crosses, direction)
+EVENT_TYPES = {
+    'macd_bullish_cross': ('MACD', 'SIGNAL_LINE', 'up'),
+    'macd_bearish_cross': ('MACD', 'SIGNAL_LINE', 'down'),
+    'golden_cross': ('MA_50DAY', 'MA_200DAY', 'up'),
+    'death_cross': ('MA_50DAY', 'MA_200DAY', 'down'),
+    'rsi_oversold': ('RSI', RSI_OVERSOLD, 'down'),
+    'rsi_overbought': ('RSI', RSI_OVERBOUGHT, 'up'),
+    **{
+        f"fib_{level}_break_{direction}": ('close', f"Fib_{level}", direction)
+        for level in ('236', '382', '500', '618') for direction in ('up', 'down')
+    }
+}
+
+# Sessions searched when a lookback is not given
+DEFAULT_LOOKBACK = 5
+
+
+def ensure_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS indicator_events (
+            event_type VARCHAR(32) NOT NULL,
+            timestamp DATETIME NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            value DOUBLE,
+            PRIMARY KEY (event_type, timestamp, ticker),
+            KEY idx_ticker (ticker, timestamp)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_sessions (
+            timestamp DATETIME PRIMARY KEY
+        )
+    """)
+
+
+def detect_events(rows, previous=None):
+    """(event_type, timestamp, value) of the events in indicator rows given as MA_COLUMNS tuples, oldest first.
+
+    previous is the stored row before the first one, so a crossing on the first new row is seen.
+    """
+    if previous is not None:
+        rows = [previous] + list(rows)
+    if len(rows) < 2:
+        return []
+
+    values = list(zip(*rows))
+    columns = {name: np.array(values[i], dtype=np.float64) for i, name in enumerate(MA_COLUMNS) if name != 'timestamp'}
+    timestamps = values[MA_COLUMNS.index('timestamp')]
+
+    events = []
+    with np.errstate(invalid='ignore'):
+        for event_type, (name, other, direction) in EVENT_TYPES.items():
+            a = columns[name]
+            b = columns[other] if isinstance(other, str) else np.full(len(a), float(other))
+            if direction == 'up':
+                crossed = (a[:-1] <= b[:-1]) & (a[1:] > b[1:])
+            else:
+                crossed = (a[:-1] >= b[:-1]) & (a[1:] < b[1:])
+            for i in np.flatnonzero(crossed) + 1:
+                events.append((event_type, timestamps[i], float(a[i])))
+    return events
+
+
+def _insert(cursor, ticker, events, timestamps):
+    """Store events and new sessions; returns the number of events"""
+    if events:
+        cursor.executemany("""
+            INSERT IGNORE INTO indicator_events (event_type, timestamp, ticker, value) VALUES (%s, %s, %s, %s)
+        """, [(event_type, timestamp, ticker, value) for event_type, timestamp, value in events])
+    if timestamps:
+        cursor.executemany('INSERT IGNORE INTO event_sessions (timestamp) VALUES (%s)', [(t,) for t in timestamps])
+    return len(events)
+
+
+def replace_events(cursor, ticker, rows):
+    """Replace a ticker's events with those of its full indicator history"""
+    cursor.execute('DELETE FROM indicator_events WHERE ticker = %s', (ticker,))
+    timestamps = sorted({row[0] for row in rows})
+    if timestamps:
+        # Most sessions are already known from other tickers
+        cursor.execute('SELECT timestamp FROM event_sessions WHERE timestamp BETWEEN %s AND %s',
+                       (timestamps[0], timestamps[-1]))
+        known = {row[0] for row in cursor.fetchall()}
+        timestamps = [t for t in timestamps if t not in known]
+    return _insert(cursor, ticker, detect_events(rows), timestamps)
+
+
+def append_events(cursor, ticker, rows, previous=None):
+    """Add the events of newly appended indicator rows; previous is the last row stored before them"""
+    if not rows:
+        return 0
+    return _insert(cursor, ticker, detect_events(rows, previous), sorted({row[0] for row in rows}))
+
+
+def recent_events(cursor, event_types, lookback=DEFAULT_LOOKBACK):
+    """ticker -> {event_type: latest timestamp} for the given events in the last `lookback` sessions"""
+    unknown = set(event_types) - set(EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+    if not event_types:
+        return {}
+    cursor.execute(f"""
+        SELECT ticker, event_type, MAX(timestamp) FROM indicator_events
+        WHERE event_type IN ({', '.join(['%s'] * len(event_types))})
+          AND timestamp >= (SELECT MIN(timestamp) FROM (
+                SELECT timestamp FROM event_sessions ORDER BY timestamp DESC LIMIT {int(lookback)}
+              ) recent)
+        GROUP BY ticker, event_type
+    """, list(event_types))
+    found = {}
+    for ticker, event_type, timestamp in cursor.fetchall():
+        found.setdefault(ticker, {})[event_type] = timestamp
+    return found
+
+
+def backfill():
+    """Rebuild the index of every ticker from its stored indicator rows"""
+    mydb = connect()
+    cursor = mydb.cursor()
+    ensure_tables(cursor)
+
+    cursor.execute('SELECT ticker FROM stock_list')
+    tickers = [row[0].lower() for row in cursor.fetchall()]
+    storage = get_storage()
+
+    start = time.perf_counter()
+    total = 0
+    for i in range(0, len(tickers), READ_BATCH_SIZE):
+        histories = storage.read_indicators(mydb, tickers[i:i + READ_BATCH_SIZE])
+        for ticker, df in histories.items():
+            try:
+                df = df[df['timestamp'].notna()]
+                rows = list(zip(*(df[c].tolist() for c in MA_COLUMNS)))
+                total += replace_events(cursor, ticker, rows)
+                mydb.commit()
+            except Exception as e:
+                mydb.rollback()
+                print(f"Error processing {ticker}: {e}")
+    print(f"Indexed {total} events for {len(tickers)} tickers in {time.perf_counter() - start:.1f}s")
+
+    cursor.close()
+    mydb.close()
+
+
+if __name__ == '__main__':
+    backfill()
@@ -0,0 +1,275 @@
+"""Bulk export of full-history bars or indicators for many tickers.
+
+Rows are read ticker by ticker through the storage layout's iter_rows, which
+streams them from the database in EXPORT_CHUNK_SIZE chunks (the MySQL cursor
+is unbuffered, so the server hands rows over as they are consumed). Each chunk
+is encoded and compressed on its own and written out before the next one is
+read, so memory stays flat however many rows an export covers.
+
+Formats: csv, ndjson (one JSON object per line) and arrow (an Arrow IPC
+stream of one record batch per chunk, needs pyarrow). Compression: gzip, or
+zstd with the zstandard package.
+
+    python export.py --kind indicators --tickers aapl,msft --start 2020-01-01 --format csv --compression gzip -o out.csv.gz
+    python export.py --kind bars --format arrow --output bars.arrow
+    curl -o bars.csv.gz 'http://localhost:5000/api/export?kind=bars&tickers=aapl,msft&compression=gzip'
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from storage import EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, get_storage
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('csv', 'ndjson', 'arrow')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'arrow': 'arrow', 'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+# Tickers one API export may cover
+EXPORT_MAX_TICKERS = 1000
+
+# API exports streaming at once, each on its own database connection; more get 429
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 4))
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+# zstd level; 3 is the library default and keeps up with the database
+ZSTD_LEVEL = 3
+
+
+def check_options(fmt, compression):
+    """Raise ValueError for an unknown format or compression, or one whose package is not installed"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+    if fmt == 'arrow' and pa is None:
+        raise ValueError('arrow format requires pyarrow (pip install pyarrow)')
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression requires zstandard (pip install zstandard)')
+
+
+def parse_range(start, end):
+    """datetime bounds (or None) of ISO start/end dates, end inclusive. Raises ValueError"""
+    from chart import parse_bound
+    start, end = parse_bound(start), parse_bound(end, end=True)
+    return (None if start is None else start.item()), (None if end is None else end.item())
+
+
+def filename(kind, fmt, compression):
+    return f"{kind}.{EXTENSIONS[fmt]}{EXTENSIONS[compression]}"
+
+
+def _arrow_type(column):
+    if column == 'timestamp':
+        return pa.timestamp('s')
+    if column == 'transactions':
+        return pa.int64()
+    return pa.float64()
+
+
+class CsvEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+
+    def _drain(self):
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text.encode()
+
+    def header(self):
+        self.writer.writerow(['ticker'] + self.columns)
+        return self._drain()
+
+    def encode(self, ticker, rows):
+        ticker = ticker.upper()
+        self.writer.writerows((ticker,) + tuple(row) for row in rows)
+        return self._drain()
+
+    def close(self):
+        return b''
+
+
+class NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def header(self):
+        return b''
+
+    def encode(self, ticker, rows):
+        ticker = ticker.upper()
+        lines = []
+        for row in rows:
+            record = {'ticker': ticker}
+            for column, value in zip(self.columns, row):
+                record[column] = value.isoformat() if isinstance(value, datetime) else value
+            lines.append(json.dumps(record))
+        return ('\n'.join(lines) + '\n').encode()
+
+    def close(self):
+        return b''
+
+
+class ArrowEncoder:
+    """Arrow IPC stream, one record batch per chunk"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.schema = pa.schema([('ticker', pa.string())] + [(c, _arrow_type(c)) for c in columns])
+        self.sink = io.BytesIO()
+        self.writer = None
+
+    def _drain(self):
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def header(self):
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        return self._drain()
+
+    def encode(self, ticker, rows):
+        values = list(zip(*rows))
+        arrays = [pa.array([ticker.upper()] * len(rows), pa.string())] + [
+            pa.array(values[i], self.schema.field(i + 1).type) for i in range(len(self.columns))
+        ]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._drain()
+
+    def close(self):
+        self.writer.close()
+        return self._drain()
+
+
+ENCODERS = {'csv': CsvEncoder, 'ndjson': NdjsonEncoder, 'arrow': ArrowEncoder}
+
+
+class _Identity:
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+def _compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return _Identity()
+
+
+def export_stream(mydb, tickers, kind='indicators', start=None, end=None, fmt='csv', compression='none',
+                  chunk_size=EXPORT_CHUNK_SIZE, stats=None):
+    """Encoded, compressed bytes of the rows of tickers with start <= timestamp < end, chunk by chunk.
+
+    stats, if given, is a dict that receives the tickers and rows exported.
+    """
+    check_options(fmt, compression)
+    if kind not in EXPORT_COLUMNS:
+        raise ValueError(f"kind must be one of {', '.join(EXPORT_COLUMNS)}")
+    stats = stats if stats is not None else {}
+    stats.update(tickers=0, rows=0)
+    storage = get_storage()
+    encoder = ENCODERS[fmt](EXPORT_COLUMNS[kind])
+    compressor = _compressor(compression)
+
+    yield compressor.compress(encoder.header())
+    cursor = mydb.cursor()
+    try:
+        for ticker in tickers:
+            found = False
+            for rows in storage.iter_rows(cursor, ticker, kind, start, end, chunk_size):
+                found = True
+                stats['rows'] += len(rows)
+                data = compressor.compress(encoder.encode(ticker, rows))
+                if data:
+                    yield data
+            stats['tickers'] += found
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            # Stopped mid-ticker with rows still unread; the pool discards the connection
+            pass
+    yield compressor.compress(encoder.close()) + compressor.flush()
+
+
+def main():
+    from db import connect
+
+    parser = argparse.ArgumentParser(description='Export stored bars or indicators for many tickers')
+    parser.add_argument('--kind', choices=list(EXPORT_COLUMNS), default='indicators')
+    parser.add_argument('--tickers', help='comma-separated tickers (default: all of stock_list)')
+    parser.add_argument('--start', help='first date (YYYY-MM-DD or ISO datetime)')
+    parser.add_argument('--end', help='last date, inclusive (YYYY-MM-DD or ISO datetime)')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='rows fetched per round trip')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    try:
+        check_options(args.format, args.compression)
+        start, end = parse_range(args.start, args.end)
+    except ValueError as e:
+        parser.error(str(e))
+
+    began = time.perf_counter()
+    stats = {}
+    written = 0
+    # A dedicated connection: the export keeps it busy for its whole duration
+    mydb = connect()
+    try:
+        if args.tickers:
+            tickers = [t.strip().lower() for t in args.tickers.split(',') if t.strip()]
+        else:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker FROM stock_list')
+            tickers = [row[0].lower() for row in cursor.fetchall()]
+            cursor.close()
+
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for data in export_stream(mydb, tickers, args.kind, start, end, args.format,
+                                      args.compression, args.chunk_size, stats):
+                out.write(data)
+                written += len(data)
+        finally:
+            if args.output:
+                out.close()
+    finally:
+        mydb.close()
+
+    print(f"Exported {stats['rows']} {args.kind} rows of {stats['tickers']}/{len(tickers)} tickers, "
+          f"{written / 1e6:.1f} MB in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
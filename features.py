@@ -0,0 +1,300 @@
+"""Vectorized indicator and model-feature engine.
+
+Works on 2-D price matrices of shape (tickers, days). Each ticker's history is
+left-aligned (row position i is that ticker's i-th bar) and padded with NaN
+on the right, which keeps the warm-up null-outs of indicators.py per ticker.
+Rolling means are sums of shifted slices and exponential means run through
+lfilter, so no kernel loops over the days in Python. Unrounded values match
+pandas' rolling/ewm kernels to within floating-point rounding.
+
+Run `python features.py` to check the engine against the pandas implementation.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+MA_WINDOWS = (5, 20, 50, 200)
+RSI_WINDOW = 14
+FIB_WINDOW = 60
+FIB_LEVELS = {'Fib_236': 0.236, 'Fib_382': 0.382, 'Fib_500': 0.5, 'Fib_618': 0.618}
+
+INDICATOR_COLUMNS = [
+    'MA_5DAY', 'MA_20DAY', 'MA_50DAY', 'MA_200DAY',
+    'EMA_12DAY', 'EMA_26DAY', 'MACD', 'SIGNAL_LINE', 'RSI',
+    'Fib_0', 'Fib_236', 'Fib_382', 'Fib_500', 'Fib_618', 'Fib_100'
+]
+
+FEATURE_COLUMNS = [
+    'price_change', 'volume_change', 'ma5_ratio', 'ma20_ratio', 'ma50_ratio', 'ma200_ratio',
+    'macd', 'signal_line', 'macd_histogram', 'rsi_norm', 'fib_position', 'fib618_ratio',
+    'fib382_ratio', 'volatility_20d'
+]
+
+
+def to_matrix(series_list, dtype=np.float64):
+    """Left-align 1-D histories of different lengths into a NaN-padded (tickers, days) matrix"""
+    width = max((len(s) for s in series_list), default=0)
+    matrix = np.full((len(series_list), width), np.nan, dtype=dtype)
+    for i, s in enumerate(series_list):
+        matrix[i, :len(s)] = np.asarray(s, dtype=dtype)
+    return matrix
+
+
+def window_sum(values):
+    """Sum of a window of floats, added in the same order as rolling_mean"""
+    total = values[0]
+    for value in values[1:]:
+        total += value
+    return total
+
+
+def rolling_mean(x, window):
+    """Mean over a trailing window of every row of x; NaN where the window holds a NaN (pandas' min_periods=window)"""
+    n, days = x.shape
+    out = np.full((n, days), np.nan)
+    if days >= window:
+        # One shifted add per window position, oldest bar first, so an incremental window_sum gets the same bits
+        total = x[:, :days - window + 1].copy()
+        for k in range(1, window):
+            total += x[:, k:days - window + 1 + k]
+        out[:, window - 1:] = total / window
+    return out
+
+
+def ewm_sums(x, span):
+    """Decaying sums of the observed values and of their weights, whose ratio is ewm_mean"""
+    # Imported on first use, scipy.signal alone takes over a second to import
+    from scipy.signal import lfilter
+    com = (span - 1) / 2
+    decay = 1. - 1. / (1. + com)
+    observed = ~np.isnan(x)
+    weighted = lfilter([1.], [1., -decay], np.where(observed, x, 0.), axis=1)
+    weights = lfilter([1.], [1., -decay], observed.astype(np.float64), axis=1)
+    return weighted, weights
+
+
+def ewm_mean(x, span, sums=None):
+    """pandas Series.ewm(span=span, adjust=True).mean() of every row of x; appends the sums behind it to `sums`"""
+    weighted, weights = ewm_sums(x, span)
+    if sums is not None:
+        sums.append((weighted, weights))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # No weight before a row's first observation, so those days stay NaN
+        return weighted / weights
+
+
+def _rolling_reduce(x, window, reduce):
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= window:
+        # Any NaN in the window propagates, matching pandas' min_periods=window
+        out[:, window - 1:] = reduce(sliding_window_view(x, window, axis=1), axis=-1)
+    return out
+
+
+def rolling_max(x, window):
+    return _rolling_reduce(x, window, np.max)
+
+
+def rolling_min(x, window):
+    return _rolling_reduce(x, window, np.min)
+
+
+def rolling_std(x, window):
+    """Sample standard deviation over a trailing window; NaN where the window holds a NaN"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] < window:
+        return out
+    missing = np.isnan(x)
+    filled = np.where(missing, 0.0, x)
+    # Center each row before accumulating to limit cancellation in the running sums
+    offset = filled.sum(axis=1, keepdims=True) / np.maximum((~missing).sum(axis=1, keepdims=True), 1)
+    centered = np.where(missing, 0.0, filled - offset)
+
+    def window_sums(values):
+        c = np.concatenate([np.zeros((x.shape[0], 1)), np.cumsum(values, axis=1)], axis=1)
+        return c[:, window:] - c[:, :-window]
+
+    sum1 = window_sums(centered)
+    sum2 = window_sums(centered * centered)
+    var = np.maximum((sum2 - sum1 * sum1 / window) / (window - 1), 0.0)
+    out[:, window - 1:] = np.where(window_sums(missing) > 0, np.nan, np.sqrt(var))
+    return out
+
+
+def shift_diff(x):
+    out = np.full(x.shape, np.nan)
+    out[:, 1:] = x[:, 1:] - x[:, :-1]
+    return out
+
+
+def pct_change(x):
+    out = np.full(x.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[:, 1:] = x[:, 1:] / x[:, :-1] - 1
+    return out
+
+
+def compute_indicator_matrix(close, ewm=None):
+    """All {ticker}_MA indicator columns for a (tickers, days) close matrix, as stored by indicators.py.
+
+    If ewm is a list, the ewm_sums of the 12/26-day EMAs and the signal line are appended to it.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    ind = {}
+
+    # MA
+    for w in MA_WINDOWS:
+        ind[f'MA_{w}DAY'] = np.round(rolling_mean(close, w), 2)
+
+    # EMA
+    ema_12 = np.round(ewm_mean(close, 12, ewm), 2)
+    ema_26 = np.round(ewm_mean(close, 26, ewm), 2)
+    ema_12[:, :11] = np.nan
+    ema_26[:, :25] = np.nan
+    ind['EMA_12DAY'] = ema_12
+    ind['EMA_26DAY'] = ema_26
+
+    # MACD and Signal Line
+    macd = np.round(ema_12 - ema_26, 2)
+    signal = np.round(ewm_mean(macd, 9, ewm), 2)
+    signal[:, :34] = np.nan
+    ind['MACD'] = macd
+    ind['SIGNAL_LINE'] = signal
+
+    # RSI
+    delta = shift_diff(close)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rs = rolling_mean(gain, RSI_WINDOW) / rolling_mean(loss, RSI_WINDOW)
+        ind['RSI'] = np.round(100 - (100 / (1 + rs)), 2)
+
+    # Fibonacci
+    high = rolling_max(close, FIB_WINDOW)
+    low = rolling_min(close, FIB_WINDOW)
+    diff = high - low
+    ind['Fib_0'] = np.round(low, 2)
+    for name, level in FIB_LEVELS.items():
+        ind[name] = np.round(high - level * diff, 2)
+    ind['Fib_100'] = np.round(high, 2)
+    for name in ('Fib_0', *FIB_LEVELS, 'Fib_100'):
+        ind[name][:, :FIB_WINDOW] = np.nan
+
+    return ind
+
+
+def compute_feature_matrix(close, volume, ind, dtype=np.float64):
+    """Model features of TradingMLModel as a (tickers, days, features) array in FEATURE_COLUMNS order"""
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    col = {name: np.asarray(ind[name], dtype=np.float64) for name in INDICATOR_COLUMNS}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        features = [
+            pct_change(close),
+            pct_change(volume),
+            col['MA_5DAY'] / close - 1,
+            col['MA_20DAY'] / close - 1,
+            col['MA_50DAY'] / close - 1,
+            col['MA_200DAY'] / close - 1,
+            col['MACD'],
+            col['SIGNAL_LINE'],
+            col['MACD'] - col['SIGNAL_LINE'],
+            col['RSI'] / 100,
+            (close - col['Fib_0']) / (col['Fib_100'] - col['Fib_0']),
+            close / col['Fib_618'] - 1,
+            close / col['Fib_382'] - 1,
+            rolling_std(close, 20) / close
+        ]
+
+    out = np.empty(close.shape + (len(FEATURE_COLUMNS),), dtype=dtype)
+    for i, feature in enumerate(features):
+        out[:, :, i] = feature
+    return out
+
+
+def reference_indicators(df):
+    """Original per-ticker pandas implementation, kept as the reference for check_against_pandas"""
+    ind = pd.DataFrame(index=df.index)
+    for w in MA_WINDOWS:
+        ind[f'MA_{w}DAY'] = df['close'].rolling(window=w).mean().round(2)
+    ind['EMA_12DAY'] = df['close'].ewm(span=12, adjust=True).mean().round(2)
+    ind['EMA_26DAY'] = df['close'].ewm(span=26, adjust=True).mean().round(2)
+    ind.loc[:10, 'EMA_12DAY'] = np.nan
+    ind.loc[:24, 'EMA_26DAY'] = np.nan
+    ind['MACD'] = (ind['EMA_12DAY'] - ind['EMA_26DAY']).round(2)
+    ind['MACD'] = ind.apply(lambda x: None if pd.isna(x['EMA_12DAY']) or pd.isna(x['EMA_26DAY']) else x['MACD'], axis=1)
+    ind['SIGNAL_LINE'] = ind['MACD'].ewm(span=9, adjust=True).mean().round(2)
+    ind.loc[:33, 'SIGNAL_LINE'] = np.nan
+    delta = df['close'].diff()
+    gain = np.where(delta > 0, delta, 0)
+    loss = np.where(delta < 0, -delta, 0)
+    rs = pd.Series(gain).rolling(window=14).mean() / pd.Series(loss).rolling(window=14).mean()
+    ind['RSI'] = (100 - (100 / (1 + rs))).round(2)
+    high = df['close'].rolling(window=60).max()
+    low = df['close'].rolling(window=60).min()
+    ind['Fib_0'] = low.round(2)
+    for name, level in FIB_LEVELS.items():
+        ind[name] = (high - level * (high - low)).round(2)
+    ind['Fib_100'] = high.round(2)
+    ind.loc[:59, ['Fib_0', *FIB_LEVELS, 'Fib_100']] = np.nan
+    return ind
+
+
+def reference_features(df):
+    """Original TradingMLModel.prepare_features, kept as the reference for check_against_pandas"""
+    features = [
+        df['close'].pct_change(), df['volume'].pct_change(),
+        df['MA_5DAY'] / df['close'] - 1, df['MA_20DAY'] / df['close'] - 1,
+        df['MA_50DAY'] / df['close'] - 1, df['MA_200DAY'] / df['close'] - 1,
+        df['MACD'], df['SIGNAL_LINE'], df['MACD'] - df['SIGNAL_LINE'], df['RSI'] / 100,
+        (df['close'] - df['Fib_0']) / (df['Fib_100'] - df['Fib_0']),
+        df['close'] / df['Fib_618'] - 1, df['close'] / df['Fib_382'] - 1,
+        df['close'].rolling(20).std() / df['close']
+    ]
+    feature_df = pd.concat(features, axis=1)
+    feature_df.columns = FEATURE_COLUMNS
+    return feature_df
+
+
+def check_against_pandas(n_tickers=25, max_days=700, seed=0):
+    """Compare the engine with the pandas reference on random histories; raises AssertionError on mismatch"""
+    rng = np.random.default_rng(seed)
+    closes, volumes = [], []
+    for i in range(n_tickers):
+        days = int(rng.integers(1, max_days))
+        close = np.round(20 + np.abs(np.cumsum(rng.normal(0, 1, days))), 2)
+        if i % 3 == 0:
+            close[rng.integers(0, days, 3)] = close[0]
+        if i % 5 == 0:
+            close[rng.integers(0, days, 2)] = np.nan
+        closes.append(close)
+        volumes.append(rng.integers(1000, 100000, days).astype(float))
+
+    ind = compute_indicator_matrix(to_matrix(closes))
+    features = compute_feature_matrix(to_matrix(closes), to_matrix(volumes), ind)
+
+    for i, (close, volume) in enumerate(zip(closes, volumes)):
+        days = len(close)
+        expected = reference_indicators(pd.DataFrame({'close': close}))
+        for name in INDICATOR_COLUMNS:
+            got, want = ind[name][i, :days], expected[name].to_numpy(dtype=float)
+            differs = ~((got == want) | (np.isnan(got) & np.isnan(want)))
+            if name.startswith('MA_'):
+                # pandas' compensated running sum rounds differently, so a mean on an exact half cent may round either way
+                raw = pd.Series(close).rolling(int(name[3:-3])).mean().to_numpy()
+                half_cent = np.abs(raw * 100 % 1 - 0.5) < 1e-6
+                differs &= ~(half_cent & (np.abs(got - want) < 0.01 + 1e-9))
+            assert not differs.any(), f"ticker {i}: {name} differs from pandas"
+
+        df = pd.DataFrame({name: ind[name][i, :days] for name in INDICATOR_COLUMNS}).assign(close=close, volume=volume)
+        expected_features = reference_features(df).to_numpy(dtype=float)
+        assert np.allclose(features[i, :days], expected_features, rtol=1e-7, atol=1e-12, equal_nan=True), \
+            f"ticker {i}: features differ from pandas"
+
+    return n_tickers
+
+
+if __name__ == '__main__':
+    checked = check_against_pandas()
+    print(f"Engine matches pandas for {checked} random tickers")
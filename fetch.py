@@ -1,49 +1,164 @@
+import argparse
 import datetime
-import mysql.connector
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from polygon import RESTClient
+from changes import ensure_tables as ensure_change_tables, prune as prune_changes, record_changes
+from db import connect, bump_data_version
+from market_summary import ensure_tables as ensure_market_tables, refresh_summary, update_ticker_state
+from storage import get_storage
 
-client = RESTClient("c6PWzvot8L5IRGcyHUa95dzpQVFkCzAc")
+POLYGON_API_KEY = os.environ.get('POLYGON_API_KEY', 'c6PWzvot8L5IRGcyHUa95dzpQVFkCzAc')
+POLYGON_BASE_URL = os.environ.get('POLYGON_BASE_URL', 'https://api.polygon.io')
 
-mydb = mysql.connector.connect(
-    host="104.154.25.113",
-    user="kshitij",
-    password="Kshitij_17",
-    database="stocks"
-)
+# History start for tickers without stored data
+DEFAULT_START = '2023-06-05'
 
-cursor = mydb.cursor()
-cursor.execute("USE stocks")
 
-cursor.execute("SELECT ticker, stock FROM stock_list")
-stock_list = cursor.fetchall()
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per `per` seconds with bursts up to `capacity`"""
 
-for ticker, _ in stock_list:
-    table_name = f"{ticker.lower()}_data"
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (id INT AUTO_INCREMENT PRIMARY KEY, open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE, volume BIGINT, vwap DOUBLE, timestamp TIMESTAMP, transactions INT, otc TINYINT NULL);
-    """)
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.rate = rate / per
+        self.capacity = capacity or rate
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def fetch_aggs(client, limiter, ticker, start, end):
+    """Fetch daily bars for ticker between start and end (inclusive), as naive UTC timestamps"""
+    limiter.acquire()
     aggs = []
-    for a in client.list_aggs(ticker, 1, "day", "2023-06-05", "2025-06-03", limit=50000):
-        a.timestamp = datetime.datetime.fromtimestamp(a.timestamp / 1000, datetime.timezone.utc)
+    for a in client.list_aggs(ticker, 1, "day", start, end, limit=50000):
+        a.timestamp = datetime.datetime.fromtimestamp(a.timestamp / 1000, datetime.timezone.utc).replace(tzinfo=None)
         aggs.append(a)
+    return aggs
+
+
+def store_aggs(mydb, cursor, storage, ticker, aggs, start):
+    """Insert bars whose timestamp is not stored yet; returns the number of new rows"""
+    seen = storage.bar_timestamps(cursor, ticker, start)
+
+    data = []
+    for a in aggs:
+        if a.timestamp in seen:
+            continue
+        seen.add(a.timestamp)
+        data.append((a.open, a.high, a.low, a.close, a.volume, a.vwap, a.timestamp, a.transactions, None))
+
+    if data:
+        storage.insert_bars(cursor, ticker, data)
+        record_changes(cursor, 'bars', [(ticker, min(row[6] for row in data))])
+        mydb.commit()
 
-    print(f"Fetched {len(aggs)} records for {ticker}")
+    return len(data)
 
-    if len(aggs) == 0:
-        print(f"No data returned for {ticker}")
-        continue
 
-    data = [(a.open, a.high, a.low, a.close, a.volume, a.vwap, a.timestamp, a.transactions, None) for a in aggs]
-    cursor.executemany(f"""
-        INSERT INTO {table_name} (open, high, low, close, volume, vwap, timestamp, transactions, otc) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, data)
+def save_aggs(mydb, cursor, storage, ticker, aggs, start):
+    """Store fetched bars and the ticker's market-summary state; returns the number of new rows"""
+    new_rows = store_aggs(mydb, cursor, storage, ticker, aggs, start)
+    if new_rows:
+        update_ticker_state(cursor, ticker, storage)
+        mydb.commit()
+        # Append the new bars to the local store, if one is configured
+        storage.sync(mydb, [ticker], force=True)
+    return new_rows
+
+
+def fetch_ticker(mydb, cursor, storage, client, limiter, symbol, default_start, end):
+    """Fetch and store one ticker's bars since its last stored bar; returns the number of new rows"""
+    ticker = symbol.lower()
+    storage.ensure_bars(cursor, ticker)
+    last = storage.last_bar_timestamp(cursor, ticker)
     mydb.commit()
-    
-    time.sleep(15)
+    start = last.date().isoformat() if last else default_start
+    if start > end:
+        return 0
+    return save_aggs(mydb, cursor, storage, ticker, fetch_aggs(client, limiter, symbol, start, end), start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch daily bars from Polygon.io for every ticker in stock_list')
+    parser.add_argument('--start', default=DEFAULT_START, help='first date for tickers without stored data')
+    parser.add_argument('--end', default=datetime.date.today().isoformat(), help='last date to fetch')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent API requests')
+    parser.add_argument('--rate', type=float, default=5, help='API requests allowed per minute by the plan')
+    parser.add_argument('--base-url', default=POLYGON_BASE_URL, help='Polygon API base URL, e.g. a local stand-in')
+    args = parser.parse_args()
+
+    client = RESTClient(POLYGON_API_KEY, base=args.base_url)
+    limiter = TokenBucket(args.rate)
+
+    mydb = connect()
+    cursor = mydb.cursor()
+    storage = get_storage()
+
+    cursor.execute("SELECT ticker, stock FROM stock_list")
+    stock_list = cursor.fetchall()
+
+    storage.ensure_schema(cursor)
+    ensure_market_tables(cursor)
+    ensure_change_tables(cursor)
+
+    # Work out the missing range of every ticker up front
+    jobs = []
+    for ticker, _ in stock_list:
+        storage.ensure_bars(cursor, ticker.lower())
+        last = storage.last_bar_timestamp(cursor, ticker.lower())
+        start = last.date().isoformat() if last else args.start
+        if start > args.end:
+            continue
+        jobs.append((ticker, start))
+    mydb.commit()
+
+    start_time = time.perf_counter()
+    total_new = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(fetch_aggs, client, limiter, ticker, start, args.end): (ticker, start)
+            for ticker, start in jobs
+        }
+        for future in as_completed(futures):
+            ticker, start = futures[future]
+            try:
+                aggs = future.result()
+            except Exception as e:
+                print(f"Error fetching {ticker}: {e}")
+                continue
+
+            if len(aggs) == 0:
+                print(f"No data returned for {ticker}")
+                continue
+
+            new_rows = save_aggs(mydb, cursor, storage, ticker.lower(), aggs, start)
+            total_new += new_rows
+            print(f"Fetched {len(aggs)} records for {ticker} since {start}, {new_rows} new")
+
+    print(f"Stored {total_new} new records for {len(jobs)} tickers in {time.perf_counter() - start_time:.1f}s")
+
+    refresh_summary(mydb)
+    prune_changes(cursor)
+    mydb.commit()
+    bump_data_version(mydb)
+
+    cursor.close()
+    mydb.close()
 
 
-cursor.close()
-mydb.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Compact array-backed form of the trained random forest and its scaler.
+
+Every tree's nodes are concatenated into flat arrays (feature, threshold,
+left/right child, leaf class probabilities), saved as .npy files next to a
+meta.json and memory-mapped on load, so forked workers share the pages.
+Prediction walks all trees for the whole batch at once with NumPy indexing,
+which is much faster than scikit-learn for the few rows of an API request;
+large offline batches are better served by the pickled model.
+
+Thresholds are stored as:
+- float64: the forest's own thresholds, identical predictions to scikit-learn
+- float32: half the size; a feature value within float32 rounding of a
+  threshold may take the other branch
+- uint16: per-feature codes into a table of the distinct thresholds; features
+  are coded with searchsorted first, so predictions stay identical
+"""
+import json
+import os
+import numpy as np
+
+PRECISIONS = ('float64', 'float32', 'uint16')
+
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'mean', 'scale')
+
+
+def _code_features(X, tables):
+    """Column-wise index of each value among a feature's sorted thresholds: x <= t[k] iff code <= k"""
+    codes = np.zeros(X.shape, dtype=np.uint16)
+    for f, table in enumerate(tables):
+        if len(table):
+            codes[:, f] = np.searchsorted(table, X[:, f], side='left')
+    return codes
+
+
+class CompactForest:
+    """Random forest classifier with its StandardScaler, as flat node arrays"""
+
+    def __init__(self, arrays, classes, feature_names, precision='float64', tables=None, meta=None):
+        self.arrays = arrays
+        self.classes_ = np.array(classes, dtype=object)
+        self.feature_names = list(feature_names)
+        self.precision = precision
+        self.tables = tables
+        self.meta = meta or {}
+        self.max_depth = int(self.meta['max_depth'])
+
+    @classmethod
+    def compile(cls, model, scaler, feature_names, precision='float64'):
+        """Flatten a fitted RandomForestClassifier and StandardScaler"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            roots.append(offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # Leaves point at themselves, so traversal can run a fixed number of steps
+            own = np.arange(tree.node_count) + offset
+            lefts.append(np.where(leaf, own, tree.children_left + offset))
+            rights.append(np.where(leaf, own, tree.children_right + offset))
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        threshold = np.concatenate(thresholds)
+        feature = np.concatenate(features).astype(np.int16)
+        tables = None
+        if precision == 'uint16':
+            tables = []
+            codes = np.zeros(len(threshold), dtype=np.uint16)
+            for f in range(len(feature_names)):
+                mask = feature == f
+                table = np.unique(threshold[mask])
+                if len(table) > np.iinfo(np.uint16).max:
+                    raise ValueError(f"feature {feature_names[f]} has too many thresholds for uint16 codes")
+                codes[mask] = np.searchsorted(table, threshold[mask])
+                tables.append(table)
+            threshold = codes
+        else:
+            threshold = threshold.astype(precision)
+
+        arrays = {
+            'feature': feature,
+            'threshold': threshold,
+            'left': np.concatenate(lefts).astype(np.int32),
+            'right': np.concatenate(rights).astype(np.int32),
+            'value': np.concatenate(values).astype(np.float32),
+            'roots': np.array(roots, dtype=np.int32),
+            'mean': np.asarray(scaler.mean_, dtype=np.float64),
+            'scale': np.asarray(scaler.scale_, dtype=np.float64)
+        }
+        meta = {'trees': len(roots), 'nodes': int(offset), 'max_depth': int(max_depth)}
+        return cls(arrays, list(model.classes_), feature_names, precision, tables, meta)
+
+    def transform(self, X):
+        """Scaled features as scikit-learn's trees see them (float32)"""
+        X = np.asarray(X, dtype=np.float64)
+        return ((X - self.arrays['mean']) / self.arrays['scale']).astype(np.float32)
+
+    def leaves(self, X):
+        """(trees, samples) leaf node index of every sample in every tree"""
+        X = self.transform(X)
+        a = self.arrays
+        if self.precision == 'uint16':
+            X = _code_features(X, self.tables)
+        elif self.precision == 'float32':
+            X = X.astype(np.float32)
+        else:
+            X = X.astype(np.float64)
+
+        n_features = X.shape[1]
+        X = X.ravel()
+        node = np.repeat(a['roots'], len(X) // n_features)
+        base = np.tile(np.arange(0, len(X), n_features), len(a['roots']))
+        # Only cells still at an internal node are advanced, so shallow leaves drop out early
+        active = np.arange(len(node))
+        for _ in range(self.max_depth):
+            current = node[active]
+            go_left = X[base[active] + a['feature'][current]] <= a['threshold'][current]
+            following = np.where(go_left, a['left'][current], a['right'][current])
+            node[active] = following
+            active = active[following != current]
+            if not len(active):
+                break
+        return node.reshape(len(a['roots']), -1)
+
+    def predict_proba(self, X):
+        """Class probabilities in classes_ order, averaged over the trees"""
+        return self.arrays['value'][self.leaves(X)].mean(axis=0, dtype=np.float64)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values()) + sum(t.nbytes for t in self.tables or [])
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name, values in self.arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), values)
+        if self.tables is not None:
+            np.save(os.path.join(path, 'tables.npy'), np.concatenate(self.tables))
+            np.save(os.path.join(path, 'table_sizes.npy'), np.array([len(t) for t in self.tables], dtype=np.int64))
+        meta = {**self.meta, 'classes': [str(c) for c in self.classes_], 'features': self.feature_names,
+                'precision': self.precision}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved forest, memory-mapping its arrays unless mmap is False"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in ARRAYS}
+        tables = None
+        if meta['precision'] == 'uint16':
+            flat = np.load(os.path.join(path, 'tables.npy'), mmap_mode=mode)
+            sizes = np.load(os.path.join(path, 'table_sizes.npy'))
+            tables = np.split(flat, np.cumsum(sizes)[:-1])
+        return cls(arrays, meta['classes'], meta['features'], meta['precision'], tables, meta)
@@ -27,6 +27,11 @@ const Dashboard = () => {
     };
 
     fetchDashboardData();
+
+    // Market summary pushed by the server when the data jobs finish
+    const source = new EventSource('/api/stream?market=1');
+    source.addEventListener('market', (event) => setMarketSummary(JSON.parse(event.data)));
+    return () => source.close();
   }, []);
 
   if (loading) {
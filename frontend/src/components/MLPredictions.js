@@ -25,6 +25,18 @@ const MLPredictions = () => {
     fetchStocks();
   }, []);
 
+  // Keep the shown predictions current: the server pushes signal changes of these tickers
+  const predictedTickers = predictions.map(p => p.ticker).join(',');
+  useEffect(() => {
+    if (!predictedTickers) return undefined;
+    const source = new EventSource(`/api/stream?tickers=${encodeURIComponent(predictedTickers)}`);
+    source.addEventListener('signal', (event) => {
+      const update = JSON.parse(event.data);
+      setPredictions(prev => prev.map(p => (p.ticker === update.ticker ? update : p)));
+    });
+    return () => source.close();
+  }, [predictedTickers]);
+
   const handleStockSelection = (ticker) => {
     setSelectedStocks(prev => {
       if (prev.includes(ticker)) {
@@ -46,22 +58,8 @@ const MLPredictions = () => {
     setPredictions([]);
 
     try {
-      const predictionPromises = selectedStocks.map(async (ticker) => {
-        try {
-          const response = await axios.get(`/api/predict/${ticker}`);
-          return response.data;
-        } catch (error) {
-          return {
-            ticker: ticker.toUpperCase(),
-            signal: 'N/A',
-            confidence: 0,
-            error: 'Prediction not available'
-          };
-        }
-      });
-
-      const results = await Promise.all(predictionPromises);
-      setPredictions(results);
+      const response = await axios.post('/api/predict', { tickers: selectedStocks });
+      setPredictions(response.data.predictions);
     } catch (error) {
       setError('Error fetching predictions. Please try again.');
     } finally {
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { useParams } from 'react-router-dom';
 import { Row, Col, Card, Spinner, Alert, Badge } from 'react-bootstrap';
 import { FaChartLine, FaBrain, FaInfoCircle } from 'react-icons/fa';
@@ -13,32 +13,53 @@ const StockDetail = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
-  useEffect(() => {
-    const fetchStockData = async () => {
+  const fetchStockData = useCallback(async () => {
+    try {
+      setLoading(true);
+      
+      // Fetch stock data
+      const dataResponse = await axios.get(`/api/stock/${ticker}/data`);
+      setStockData(dataResponse.data.data);
+      
+      // Fetch ML prediction
       try {
-        setLoading(true);
-        
-        // Fetch stock data
-        const dataResponse = await axios.get(`/api/stock/${ticker}/data`);
-        setStockData(dataResponse.data.data);
-        
-        // Fetch ML prediction
-        try {
-          const predictionResponse = await axios.get(`/api/predict/${ticker}`);
-          setPrediction(predictionResponse.data);
-        } catch (predError) {
-          console.log('ML prediction not available');
-        }
-        
-        setLoading(false);
-      } catch (error) {
-        setError('Error fetching stock data. Please try again.');
-        setLoading(false);
+        const predictionResponse = await axios.get(`/api/predict/${ticker}`);
+        setPrediction(predictionResponse.data);
+      } catch (predError) {
+        console.log('ML prediction not available');
       }
-    };
+      
+      setLoading(false);
+    } catch (error) {
+      setError('Error fetching stock data. Please try again.');
+      setLoading(false);
+    }
+  }, [ticker]);
 
+  useEffect(() => {
     fetchStockData();
-  }, [ticker]);
+  }, [fetchStockData]);
+
+  // New indicator rows and signal changes pushed by the server instead of refetching
+  useEffect(() => {
+    const source = new EventSource(`/api/stream?tickers=${encodeURIComponent(ticker)}`);
+    source.addEventListener('indicators', (event) => {
+      const update = JSON.parse(event.data);
+      if (update.reset) {
+        fetchStockData();
+        return;
+      }
+      // stockData is newest first; updates arrive oldest first
+      setStockData(prev => {
+        const updated = new Set(update.data.map(row => row.timestamp));
+        const rows = [...update.data.slice().reverse(), ...prev.filter(row => !updated.has(row.timestamp))];
+        return rows.slice(0, Math.max(prev.length, update.data.length));
+      });
+    });
+    source.addEventListener('signal', (event) => setPrediction(JSON.parse(event.data)));
+    source.addEventListener('resync', () => fetchStockData());
+    return () => source.close();
+  }, [ticker, fetchStockData]);
 
   const getSignalClass = (signal) => {
     switch (signal) {
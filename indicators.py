@@ -1,130 +1,415 @@
+import argparse
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import mysql.connector
 import pandas as pd
 import numpy as np
+from changes import ensure_tables as ensure_change_tables, prune as prune_changes, record_changes
+from db import connect, bump_data_version
+from market_summary import ensure_tables as ensure_market_tables, refresh_summary, update_ticker_state
+from events import append_events, ensure_tables as ensure_event_tables, replace_events
+from features import INDICATOR_COLUMNS, MA_WINDOWS, RSI_WINDOW, FIB_WINDOW, compute_indicator_matrix, to_matrix, window_sum
+from storage import MA_COLUMNS, get_storage
 
-try:
-    mydb = mysql.connector.connect(
-        host="104.154.25.113",
-        user="kshitij",
-        password="Kshitij_17",
-        database="stocks"
-    )
-except mysql.connector.Error as err:
-    print(f"Connection Error: {err}")
-    exit()
-
-cursor = mydb.cursor()
-
-# Get stock tickers
-try:
-    cursor.execute('SELECT * FROM stock_list')
-    tickers = [row[1].lower() for row in cursor.fetchall()]
-except Exception as e:
-    print(f"Error fetching stock list: {e}")
-    mydb.close()
-    exit()
+# Format of the stored IndicatorState; states saved in another format are rebuilt
+STATE_VERSION = 2
+
+# Tickers whose histories go through compute_indicator_matrix together
+INDICATOR_BATCH_SIZE = int(os.environ.get('INDICATOR_BATCH_SIZE', 32))
+
+
+def compute_histories(frames):
+    """Indicator columns and final IndicatorState of several bar histories, computed as one matrix"""
+    closes = [df['close'].to_numpy(dtype=np.float64) for df in frames]
+    ewm = []
+    ind = compute_indicator_matrix(to_matrix(closes), ewm)
+    results = []
+    for row, (df, close) in enumerate(zip(frames, closes)):
+        days = len(close)
+        for name in INDICATOR_COLUMNS:
+            df[name] = ind[name][row, :days]
+        state = IndicatorState.from_history(close, [(w[row, days - 1], wt[row, days - 1]) for w, wt in ewm])
+        results.append((df.replace({np.nan: None}), state))
+    return results
+
+
+def _round2(value):
+    return float(np.round(value, 2))
+
+
+def _window_mean(values, window):
+    """Mean of the last `window` values, computed like features.rolling_mean"""
+    if len(values) < window:
+        return math.nan
+    return window_sum(list(values)[-window:]) / window
+
+
+class _EWMean:
+    """Adjusted exponentially weighted mean, stepping like features.ewm_mean"""
+
+    def __init__(self, span):
+        com = (span - 1) / 2
+        self.decay = 1. - 1. / (1. + com)
+        self.weighted = 0.
+        self.weights = 0.
+
+    def update(self, value):
+        observed = value == value
+        self.weighted = self.decay * self.weighted + (value if observed else 0.)
+        self.weights = self.decay * self.weights + (1. if observed else 0.)
+        return self.weighted / self.weights if self.weights else math.nan
+
+
+class IndicatorState:
+    """Rolling indicator state of one ticker, advanced one daily bar at a time.
+
+    Produces the same values, bit for bit, as compute_histories over the full history.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.closes = deque(maxlen=max(MA_WINDOWS + (FIB_WINDOW,)))
+        self.ema_12 = _EWMean(12)
+        self.ema_26 = _EWMean(26)
+        self.signal = _EWMean(9)
+        self.gains = deque(maxlen=RSI_WINDOW)
+        self.losses = deque(maxlen=RSI_WINDOW)
+
+    def update(self, close):
+        """Advance by one bar and return its indicator values in MA_COLUMNS order (without timestamp/close)"""
+        close = math.nan if close is None else float(close)
+        i = self.rows
+        prev = self.closes[-1] if self.closes else math.nan
+        self.closes.append(close)
+
+        mas = [_round2(_window_mean(self.closes, w)) for w in MA_WINDOWS]
+
+        ema_12 = _round2(self.ema_12.update(close))
+        ema_26 = _round2(self.ema_26.update(close))
+        if i <= 10:
+            ema_12 = math.nan
+        if i <= 24:
+            ema_26 = math.nan
+
+        macd = _round2(ema_12 - ema_26)
+        signal = _round2(self.signal.update(macd))
+        if i <= 33:
+            signal = math.nan
+
+        delta = close - prev
+        self.gains.append(delta if delta > 0 else 0.0)
+        self.losses.append(-delta if delta < 0 else 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.float64(_window_mean(self.gains, RSI_WINDOW)) / np.float64(_window_mean(self.losses, RSI_WINDOW))
+            rsi = _round2(100 - (100 / (1 + rs)))
+
+        window = list(self.closes)[-FIB_WINDOW:]
+        if i <= 59 or len(window) < FIB_WINDOW or any(c != c for c in window):
+            fibs = [math.nan] * 6
+        else:
+            high, low = max(window), min(window)
+            diff = high - low
+            fibs = [
+                _round2(low),
+                _round2(high - 0.236 * diff),
+                _round2(high - 0.382 * diff),
+                _round2(high - 0.5 * diff),
+                _round2(high - 0.618 * diff),
+                _round2(high)
+            ]
+
+        self.rows += 1
+        values = mas + [ema_12, ema_26, macd, signal, rsi] + fibs
+        return [None if v != v else v for v in values]
+
+    @classmethod
+    def from_history(cls, closes, ewm):
+        """State after updating with every close, built from the history and the final ewm_sums of its EMAs"""
+        state = cls()
+        state.rows = len(closes)
+        state.closes.extend(closes[-state.closes.maxlen:].tolist())
+        # The same differences as features.shift_diff, so the windows hold the bits update() would have
+        delta = np.diff(closes, prepend=np.nan)
+        state.gains.extend(np.where(delta > 0, delta, 0.0)[-RSI_WINDOW:].tolist())
+        state.losses.extend(np.where(delta < 0, -delta, 0.0)[-RSI_WINDOW:].tolist())
+        for e, (weighted, weights) in zip((state.ema_12, state.ema_26, state.signal), ewm):
+            e.weighted, e.weights = float(weighted), float(weights)
+        return state
+
+    def to_json(self):
+        return json.dumps({
+            'version': STATE_VERSION,
+            'rows': self.rows,
+            'closes': list(self.closes),
+            'ema': [[e.weighted, e.weights] for e in (self.ema_12, self.ema_26, self.signal)],
+            'gains': list(self.gains),
+            'losses': list(self.losses)
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        """Stored state, or None if it was saved in an older format and the ticker needs a rebuild"""
+        data = json.loads(text)
+        if data.get('version') != STATE_VERSION:
+            return None
+        state = cls()
+        state.rows = data['rows']
+        state.closes.extend(data['closes'])
+        for e, (weighted, weights) in zip((state.ema_12, state.ema_26, state.signal), data['ema']):
+            e.weighted, e.weights = weighted, weights
+        state.gains.extend(data['gains'])
+        state.losses.extend(data['losses'])
+        return state
+
+
+def _rows_to_insert(df):
+    """Column-wise conversion of computed indicators into insert rows, skipping rows without timestamp/close"""
+    df = df[df['timestamp'].notna() & df['close'].notna()]
+    return list(zip(*(df[col].tolist() for col in MA_COLUMNS)))
+
+
+def ensure_state_table(cursor, storage=None):
+    storage = storage or get_storage()
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {storage.state_table} (
+            ticker VARCHAR(16) PRIMARY KEY,
+            last_id BIGINT NOT NULL,
+            state LONGTEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def save_state(cursor, ticker, last_id, state, storage=None):
+    storage = storage or get_storage()
+    cursor.execute(f"""
+        REPLACE INTO {storage.state_table} (ticker, last_id, state) VALUES (%s, %s, %s)
+    """, (ticker, int(last_id), state.to_json()))
+
+
+def load_state(cursor, ticker, storage=None):
+    storage = storage or get_storage()
+    cursor.execute(f"SELECT last_id, state FROM {storage.state_table} WHERE ticker = %s", (ticker,))
+    row = cursor.fetchone()
+    state = IndicatorState.from_json(row[1]) if row is not None else None
+    if state is None:
+        return None, None
+    return row[0], state
+
+
+def _read_history(mydb, ticker, storage):
+    df = storage.read_bars(mydb, ticker)
+    if df.empty or 'close' not in df.columns or 'timestamp' not in df.columns:
+        print(f"Skipping {ticker} due to missing data.")
+        return None
+    return df
 
-for ticker in tickers:
-    try:
-        df = pd.read_sql(f"SELECT * FROM {ticker}_data", mydb)
 
-        if df.empty or 'close' not in df.columns or 'timestamp' not in df.columns:
-            print(f"Skipping {ticker} due to missing data.")
+def _store_history(mydb, cursor, ticker, df, state, storage):
+    """Replace the ticker's indicator rows with those computed over its full history, then store the rolling state"""
+    data_to_insert = _rows_to_insert(df)
+    storage.replace_indicators(cursor, ticker, data_to_insert)
+    replace_events(cursor, ticker, data_to_insert)
+    # The whole history changed; streams send the latest rows with reset set
+    record_changes(cursor, 'indicators', [(ticker, None)])
+    # The next incremental run continues from here
+    save_state(cursor, ticker, df['id'].max(), state, storage)
+    mydb.commit()
+
+    return len(data_to_insert)
+
+
+def rebuild_ticker(mydb, cursor, ticker, storage=None):
+    """Rebuild the ticker's indicator rows from the full history, then store the rolling state"""
+    storage = storage or get_storage()
+    df = _read_history(mydb, ticker, storage)
+    if df is None:
+        return 0
+    df, state = compute_histories([df])[0]
+    return _store_history(mydb, cursor, ticker, df, state, storage)
+
+
+def _append_rows(mydb, cursor, ticker, last_id, state, storage):
+    """Advance the stored state over the bars after last_id and append their indicator rows"""
+    new_rows = storage.read_new_bars(cursor, ticker, last_id)
+    if not new_rows:
+        return 0
+
+    data_to_insert = []
+    for _, timestamp, close in new_rows:
+        values = state.update(close)
+        if timestamp is None or close is None:
             continue
+        data_to_insert.append((timestamp, close, *values))
+    last_id = new_rows[-1][0]
+
+    if data_to_insert:
+        # Last stored row, so a crossing on the first new bar is detected
+        previous = storage.latest_rows(cursor, [ticker], MA_COLUMNS)
+        append_events(cursor, ticker, data_to_insert, previous[0][1:] if previous else None)
+        record_changes(cursor, 'indicators', [(ticker, data_to_insert[0][0])])
+    storage.append_indicators(cursor, ticker, data_to_insert)
+    save_state(cursor, ticker, last_id, state, storage)
+    mydb.commit()
+
+    return len(data_to_insert)
+
+
+def update_ticker(mydb, cursor, ticker, storage=None):
+    """Append indicator rows for bars stored after the last run, rebuilding if no state exists"""
+    storage = storage or get_storage()
+    last_id, state = load_state(cursor, ticker, storage)
+    if state is None:
+        return rebuild_ticker(mydb, cursor, ticker, storage)
+    return _append_rows(mydb, cursor, ticker, last_id, state, storage)
 
-        # MA
-        df['5_DAY_MA'] = df['close'].rolling(window=5).mean().round(2)
-        df['20_DAY_MA'] = df['close'].rolling(window=20).mean().round(2)
-        df['50_DAY_MA'] = df['close'].rolling(window=50).mean().round(2)
-        df['200_DAY_MA'] = df['close'].rolling(window=200).mean().round(2)
-
-        # EMA
-        df['12_DAY_EMA'] = df['close'].ewm(span=12, adjust=True).mean().round(2)
-        df['26_DAY_EMA'] = df['close'].ewm(span=26, adjust=True).mean().round(2)
-        df.loc[:10, '12_DAY_EMA'] = None
-        df.loc[:24, '26_DAY_EMA'] = None
-
-        # MACD and Signal Line
-        df['MACD'] = (df['12_DAY_EMA'] - df['26_DAY_EMA']).round(2)
-        df['MACD'] = df.apply(lambda x: None if pd.isna(x['12_DAY_EMA']) or pd.isna(x['26_DAY_EMA']) else x['MACD'], axis=1)
-        df['Signal_Line'] = df['MACD'].ewm(span=9, adjust=True).mean().round(2)
-        df.loc[:33, 'Signal_Line'] = None  
-
-        # RSI
-        delta = df['close'].diff()
-        gain = np.where(delta > 0, delta, 0)
-        loss = np.where(delta < 0, -delta, 0)
-        avg_gain = pd.Series(gain).rolling(window=14).mean()
-        avg_loss = pd.Series(loss).rolling(window=14).mean()
-        rs = avg_gain / avg_loss
-        df['RSI'] = (100 - (100 / (1 + rs))).round(2)
-
-        # Fibonacci
-        df['60_day_high'] = df['close'].rolling(window=60).max()
-        df['60_day_low'] = df['close'].rolling(window=60).min()
-        df['Fib_0'] = df['60_day_low'].round(2)
-        diff = df['60_day_high'] - df['60_day_low']
-        df['Fib_236'] = (df['60_day_high'] - 0.236 * diff).round(2)
-        df['Fib_382'] = (df['60_day_high'] - 0.382 * diff).round(2)
-        df['Fib_500'] = (df['60_day_high'] - 0.5 * diff).round(2)
-        df['Fib_618'] = (df['60_day_high'] - 0.618 * diff).round(2)
-        df['Fib_100'] = df['60_day_high'].round(2)
-        df.loc[:59, ['Fib_0', 'Fib_236', 'Fib_382', 'Fib_500', 'Fib_618', 'Fib_100']] = None
-
-        df = df.replace({np.nan: None})
-
-        # Create new table
-        cursor.execute(f"DROP TABLE IF EXISTS {ticker}_MA")
-        cursor.execute(f"""
-            CREATE TABLE {ticker}_MA (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                timestamp TIMESTAMP,
-                close DOUBLE,
-                MA_5DAY DOUBLE,
-                MA_20DAY DOUBLE,
-                MA_50DAY DOUBLE,
-                MA_200DAY DOUBLE,
-                EMA_12DAY DOUBLE,
-                EMA_26DAY DOUBLE,
-                MACD DOUBLE,
-                SIGNAL_LINE DOUBLE,
-                RSI DOUBLE,
-                Fib_0 DOUBLE,
-                Fib_236 DOUBLE,
-                Fib_382 DOUBLE,
-                Fib_500 DOUBLE,
-                Fib_618 DOUBLE,
-                Fib_100 DOUBLE
-            )
-        """)
-
-        insert_query = f"""
-            INSERT INTO {ticker}_MA (
-                timestamp, close, MA_5DAY, MA_20DAY, MA_50DAY, MA_200DAY,
-                EMA_12DAY, EMA_26DAY, MACD, SIGNAL_LINE, RSI,
-                Fib_0, Fib_236, Fib_382, Fib_500, Fib_618, Fib_100
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        data_to_insert = []
-        for _, row in df.iterrows():
-            if pd.isna(row['timestamp']) or pd.isna(row['close']):
-                continue
-            data_to_insert.append((
-                row['timestamp'], row['close'],
-                row['5_DAY_MA'], row['20_DAY_MA'], row['50_DAY_MA'], row['200_DAY_MA'],
-                row['12_DAY_EMA'], row['26_DAY_EMA'], row['MACD'], row['Signal_Line'], row['RSI'],
-                row['Fib_0'], row['Fib_236'], row['Fib_382'], row['Fib_500'], row['Fib_618'], row['Fib_100']
-            ))
-
-        if data_to_insert:
-            cursor.executemany(insert_query, data_to_insert)
-            mydb.commit()
-
-        print(f"Processed: {ticker}")
 
+_worker_db = None
+
+
+def _init_worker():
+    """Open the connection used by this worker process for all of its tickers"""
+    global _worker_db
+    _worker_db = connect()
+
+
+def _finish_ticker(cursor, ticker):
+    update_ticker_state(cursor, ticker)
+    _worker_db.commit()
+    get_storage().sync(_worker_db, [ticker], force=True)
+
+
+def process_tickers(tickers, incremental=False):
+    """Run a chunk of tickers on the worker connection, computing every history to rebuild as one matrix.
+
+    Returns (ticker, rows, seconds, error) per ticker, in order.
+    """
+    storage = get_storage()
+    _worker_db.ping(reconnect=True, attempts=2)
+    cursor = _worker_db.cursor()
+    results = {}
+    histories = {}
+    try:
+        for ticker in tickers:
+            start = time.perf_counter()
+            try:
+                last_id, state = load_state(cursor, ticker, storage) if incremental else (None, None)
+                rows = 0
+                if state is not None:
+                    rows = _append_rows(_worker_db, cursor, ticker, last_id, state, storage)
+                else:
+                    df = _read_history(_worker_db, ticker, storage)
+                    if df is not None:
+                        histories[ticker] = (df, time.perf_counter() - start)
+                        continue
+                _finish_ticker(cursor, ticker)
+                results[ticker] = (ticker, rows, time.perf_counter() - start, None)
+            except Exception as e:
+                _worker_db.rollback()
+                results[ticker] = (ticker, 0, time.perf_counter() - start, str(e))
+
+        start = time.perf_counter()
+        computed = compute_histories([df for df, _ in histories.values()]) if histories else []
+        shared = (time.perf_counter() - start) / max(len(histories), 1)
+
+        for (ticker, (_, seconds)), (df, state) in zip(histories.items(), computed):
+            start = time.perf_counter()
+            try:
+                rows = _store_history(_worker_db, cursor, ticker, df, state, storage)
+                _finish_ticker(cursor, ticker)
+                results[ticker] = (ticker, rows, seconds + shared + time.perf_counter() - start, None)
+            except Exception as e:
+                _worker_db.rollback()
+                results[ticker] = (ticker, 0, seconds + shared + time.perf_counter() - start, str(e))
+    finally:
+        cursor.close()
+    return [results[t] for t in tickers]
+
+
+def run_tickers(tickers, incremental=False, workers=1):
+    """Process chunks of tickers sequentially or over a pool of worker processes, yielding results as they finish"""
+    tickers = list(tickers)
+    # Smaller chunks when there are few tickers, so every worker gets some
+    size = max(1, min(INDICATOR_BATCH_SIZE, -(-len(tickers) // max(workers, 1))))
+    chunks = [tickers[i:i + size] for i in range(0, len(tickers), size)]
+    if workers <= 1:
+        if _worker_db is None:
+            _init_worker()
+        for chunk in chunks:
+            yield from process_tickers(chunk, incremental)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(process_tickers, chunk, incremental) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def print_report(results, elapsed):
+    failures = [r for r in results if r[3] is not None]
+    total_rows = sum(r[1] for r in results)
+    print(f"\nProcessed {len(results) - len(failures)}/{len(results)} tickers, "
+          f"{total_rows} rows in {elapsed:.1f}s")
+    slowest = sorted(results, key=lambda r: r[2], reverse=True)[:5]
+    if slowest:
+        print("Slowest: " + ', '.join(f"{r[0]} ({r[2]:.2f}s)" for r in slowest))
+    for ticker, _, _, error in failures:
+        print(f"Failed: {ticker}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate technical indicators for every ticker')
+    parser.add_argument('--incremental', action='store_true',
+                        help='append rows for new bars only, using the stored rolling state')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, each with its own connection (0 = one per CPU)')
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count()
+
+    try:
+        mydb = connect()
+    except mysql.connector.Error as err:
+        print(f"Connection Error: {err}")
+        return
+
+    cursor = mydb.cursor()
+
+    # Get stock tickers
+    try:
+        cursor.execute('SELECT ticker FROM stock_list')
+        tickers = [row[0].lower() for row in cursor.fetchall()]
+        get_storage().ensure_schema(cursor)
+        ensure_state_table(cursor)
+        ensure_market_tables(cursor)
+        ensure_event_tables(cursor)
+        ensure_change_tables(cursor)
     except Exception as e:
-        print(f"Error processing {ticker}: {e}")
+        print(f"Error fetching stock list: {e}")
+        mydb.close()
+        return
+
+    start = time.perf_counter()
+    results = []
+    for ticker, rows, seconds, error in run_tickers(tickers, args.incremental, workers):
+        if error is None:
+            print(f"Processed: {ticker} ({rows} rows, {seconds:.2f}s)")
+        else:
+            print(f"Error processing {ticker}: {error}")
+        results.append((ticker, rows, seconds, error))
+    print_report(results, time.perf_counter() - start)
+
+    refresh_summary(mydb)
+    prune_changes(cursor)
+    mydb.commit()
+    bump_data_version(mydb)
+
+    cursor.close()
+    mydb.close()
+
 
-cursor.close()
-mydb.close()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+"""Local memory-mapped columnar store of bars and indicators.
+
+Every ticker has a bars and an indicators directory holding one raw file per
+column (int64 ids, datetime64[s] timestamps, float64 values) plus meta.json with
+the committed row count. Reads memory-map the files, so full histories come
+back as contiguous arrays without a copy; appends write past the committed
+rows and then publish the new count, so readers never see a partial append.
+
+With LOCAL_STORE_DIR set the MySQL layouts read full histories through the
+store (CachedStorage), pulling only rows added since the last data version.
+STORAGE_LAYOUT=local uses the store on its own for offline runs.
+
+    python local_store.py sync [--tickers AAPL,MSFT] [--full]
+    python local_store.py info
+"""
+import argparse
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from db import get_connection, get_data_version
+from storage import BAR_COLUMNS, EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, MA_COLUMNS, get_storage, rebuild_generations
+
+DEFAULT_STORE_DIR = 'local_store'
+
+DATASETS = {
+    'bars': ['id'] + BAR_COLUMNS,
+    'indicators': MA_COLUMNS + ['volume']  # Volume of the matching bar, so feature reads need no join
+}
+
+
+def column_dtype(name):
+    if name == 'id':
+        return np.dtype(np.int64)
+    if name == 'timestamp':
+        return np.dtype('datetime64[s]')
+    return np.dtype(np.float64)
+
+
+def to_column(name, values):
+    """values as a contiguous array of the column's dtype, with NaN/NaT for missing values"""
+    dtype = column_dtype(name)
+    if name == 'timestamp':
+        return np.ascontiguousarray(pd.to_datetime(pd.Series(values, dtype=object)).to_numpy(dtype=dtype))
+    return np.ascontiguousarray(np.asarray(values, dtype=dtype))
+
+
+def rows_to_columns(columns, rows):
+    """Tuples with values in columns order, as one array per column"""
+    values = list(zip(*rows)) if rows else [[] for _ in columns]
+    return {name: to_column(name, v) for name, v in zip(columns, values)}
+
+
+class ColumnTable:
+    """One ticker's dataset: a raw file per column and a meta.json with the committed row count"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def meta(self):
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0, 'generation': 0, 'version': None, 'rebuild': 0}
+
+    def _write_meta(self, meta):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def _file(self, name, generation):
+        return os.path.join(self.path, f"{name}.{generation}.bin")
+
+    def __len__(self):
+        return self.meta()['rows']
+
+    def arrays(self, names=None, last=None):
+        """Read-only memory-mapped columns, limited to the last `last` rows"""
+        for attempt in range(3):
+            meta = self.meta()
+            rows = meta['rows']
+            start = max(rows - last, 0) if last else 0
+            try:
+                return {
+                    name: np.memmap(self._file(name, meta['generation']), dtype=column_dtype(name),
+                                    mode='r', shape=(rows,))[start:]
+                    if rows else np.empty(0, dtype=column_dtype(name))
+                    for name in names or self.columns
+                }
+            except FileNotFoundError:
+                # A concurrent replace() removed this generation, read the new one
+                if attempt == 2:
+                    raise
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock across processes for writers of this table"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def frame(self, names=None, last=None):
+        return pd.DataFrame(self.arrays(names, last))
+
+    def _row_count(self, data):
+        lengths = {len(data[name]) for name in self.columns}
+        if len(lengths) != 1:
+            raise ValueError(f"Columns of {self.path} differ in length: {sorted(lengths)}")
+        return lengths.pop()
+
+    def append(self, data, version=None):
+        """Append equally long columns, then publish the new row count"""
+        count = self._row_count(data)
+        os.makedirs(self.path, exist_ok=True)
+        meta = self.meta()
+        for name in self.columns:
+            values = to_column(name, data[name])
+            with open(self._file(name, meta['generation']), 'ab') as f:
+                # Drop bytes of an interrupted append before writing
+                f.truncate(meta['rows'] * values.itemsize)
+                f.write(values.tobytes())
+
+        meta['rows'] += count
+        if version is not None:
+            meta['version'] = version
+        self._write_meta(meta)
+        return count
+
+    def replace(self, data, version=None):
+        """Write a new generation of every column, then publish it; readers of the old one keep their mapping"""
+        count = self._row_count(data)
+        os.makedirs(self.path, exist_ok=True)
+        old = self.meta()
+        meta = {'rows': count, 'generation': old['generation'] + 1,
+                'version': old['version'] if version is None else version, 'rebuild': old.get('rebuild', 0)}
+        # Until meta.json points at them the new files are invisible, and a crash leaves the old generation intact
+        for name in self.columns:
+            with open(self._file(name, meta['generation']), 'wb') as f:
+                f.write(to_column(name, data[name]).tobytes())
+        self._write_meta(meta)
+        for name in self.columns:
+            try:
+                os.remove(self._file(name, old['generation']))
+            except FileNotFoundError:
+                pass
+        return count
+
+    def clear(self, rebuild=None):
+        """Drop every row and the synced version, so the next sync pulls the full history.
+
+        rebuild is the central rebuild generation the history is then pulled at.
+        """
+        self.replace({name: [] for name in self.columns})
+        meta = self.meta()
+        meta['version'] = None
+        if rebuild is not None:
+            meta['rebuild'] = rebuild
+        self._write_meta(meta)
+
+
+class LocalStore:
+    """Directory of ColumnTables: <root>/<dataset>/<ticker>/"""
+
+    def __init__(self, root=None):
+        self.root = root or DEFAULT_STORE_DIR
+
+    def table(self, dataset, ticker):
+        return ColumnTable(os.path.join(self.root, dataset, ticker), DATASETS[dataset])
+
+    def tickers(self, dataset):
+        try:
+            return sorted(os.listdir(os.path.join(self.root, dataset)))
+        except FileNotFoundError:
+            return []
+
+    def bar_volume(self, ticker, timestamps):
+        """Volume of the stored bars at the given timestamps, NaN where no bar matches"""
+        bars = self.table('bars', ticker).arrays(['timestamp', 'volume'])
+        volume = pd.Series(bars['volume'], index=bars['timestamp'])
+        volume = volume[~volume.index.duplicated(keep='last')]
+        return volume.reindex(pd.to_datetime(timestamps)).to_numpy(dtype=np.float64)
+
+
+def _python(value):
+    """Scalar from a column as the Python value a MySQL cursor would return"""
+    if isinstance(value, np.datetime64):
+        return None if np.isnat(value) else value.item()
+    value = value.item()
+    return None if value != value else value
+
+
+class LocalStorage:
+    """Storage layout over a LocalStore alone; cursor and connection arguments are ignored"""
+
+    layout = 'local'
+    state_table = 'local_indicator_state'
+
+    def __init__(self, store):
+        self.store = store
+
+    def ensure_schema(self, cursor):
+        pass
+
+    def filter_tickers(self, cursor, tickers):
+        return [t for t in tickers if len(self.store.table('indicators', t)) and len(self.store.table('bars', t))]
+
+    def ensure_bars(self, cursor, ticker):
+        pass
+
+    def last_bar_timestamp(self, cursor, ticker):
+        timestamps = self.store.table('bars', ticker).arrays(['timestamp'])['timestamp']
+        timestamps = timestamps[~np.isnat(timestamps)]
+        return timestamps.max().item() if len(timestamps) else None
+
+    def bar_timestamps(self, cursor, ticker, since):
+        timestamps = self.store.table('bars', ticker).arrays(['timestamp'])['timestamp']
+        return set(timestamps[timestamps >= np.datetime64(since, 's')].tolist())
+
+    def insert_bars(self, cursor, ticker, rows):
+        table = self.store.table('bars', ticker)
+        ids = table.arrays(['id'], last=1)['id']
+        first_id = int(ids[-1]) + 1 if len(ids) else 1
+        data = rows_to_columns(BAR_COLUMNS, rows)
+        data['id'] = np.arange(first_id, first_id + len(rows), dtype=np.int64)
+        table.append(data)
+
+    def read_bars(self, mydb, ticker):
+        return self.store.table('bars', ticker).frame()
+
+    def read_new_bars(self, cursor, ticker, after_id, columns=('id', 'timestamp', 'close')):
+        arrays = self.store.table('bars', ticker).arrays(list(columns))
+        start = np.searchsorted(arrays['id'], after_id, side='right') if 'id' in arrays else 0
+        return [tuple(_python(v) for v in row) for row in zip(*(arrays[c][start:] for c in columns))]
+
+    def read_new_indicators(self, cursor, ticker, since=None):
+        arrays = self.store.table('indicators', ticker).arrays()
+        start = 0 if since is None else np.searchsorted(arrays['timestamp'], np.datetime64(since, 's'), side='right')
+        return [tuple(_python(v) for v in row) for row in zip(*(a[start:] for a in arrays.values()))]
+
+    def iter_rows(self, cursor, ticker, kind, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        columns = EXPORT_COLUMNS[kind]
+        arrays = self.store.table(kind, ticker).arrays(columns)
+        timestamps = arrays['timestamp']
+        # Bars are kept in insertion order, indicators by timestamp
+        order = np.argsort(timestamps, kind='stable') if kind == 'bars' else np.arange(len(timestamps))
+        ordered = timestamps[order]
+        lo = np.searchsorted(ordered, np.datetime64(start, 's')) if start is not None else 0
+        hi = np.searchsorted(ordered, np.datetime64(end, 's')) if end is not None else len(ordered)
+        for i in range(lo, hi, chunk_size):
+            index = order[i:min(i + chunk_size, hi)]
+            yield [tuple(_python(v) for v in row) for row in zip(*(arrays[c][index] for c in columns))]
+
+    def _indicator_columns(self, ticker, rows):
+        data = rows_to_columns(MA_COLUMNS, rows)
+        data['volume'] = self.store.bar_volume(ticker, data['timestamp'])
+        return data
+
+    def replace_indicators(self, cursor, ticker, rows):
+        self.store.table('indicators', ticker).replace(self._indicator_columns(ticker, rows))
+
+    def append_indicators(self, cursor, ticker, rows):
+        if rows:
+            self.store.table('indicators', ticker).append(self._indicator_columns(ticker, rows))
+
+    def read_indicators(self, mydb, tickers, limit=None):
+        return {t: self.store.table('indicators', t).frame(last=limit) for t in self.filter_tickers(None, tickers)}
+
+    def read_arrays(self, mydb, tickers, columns, limit=None):
+        """Zero-copy memory-mapped columns of the latest indicator rows"""
+        return {t: self.store.table('indicators', t).arrays(columns, last=limit) for t in self.filter_tickers(None, tickers)}
+
+    def latest_rows(self, cursor, tickers, columns):
+        rows = []
+        for t in self.filter_tickers(cursor, tickers):
+            arrays = self.store.table('indicators', t).arrays(columns, last=1)
+            rows.append((t, *(_python(arrays[c][-1]) for c in columns)))
+        return rows
+
+    def recent_bars(self, cursor, ticker, count):
+        arrays = self.store.table('bars', ticker).arrays(['timestamp', 'close', 'volume'])
+        order = np.argsort(arrays['timestamp'], kind='stable')[::-1][:count]
+        return [tuple(_python(arrays[c][i]) for c in ('timestamp', 'close', 'volume')) for i in order]
+
+    def indicator_row(self, cursor, ticker, timestamp, columns):
+        arrays = self.store.table('indicators', ticker).arrays(list(columns) + ['timestamp'])
+        match = np.flatnonzero(arrays['timestamp'] == np.datetime64(timestamp, 's'))
+        return tuple(_python(arrays[c][match[0]]) for c in columns) if len(match) else None
+
+    def sync(self, mydb, tickers, force=False, full=False):
+        pass
+
+
+class CachedStorage:
+    """MySQL layout with full-history reads served from a LocalStore kept in step by data version.
+
+    Bars are pulled by id and indicators by timestamp, so a sync only transfers
+    rows added since the last one. Histories rewritten on any host (an indicator
+    rebuild, removed duplicate bars) bump their generation in history_rebuilds;
+    a sync that sees a new generation clears the local table and pulls it again in full.
+    """
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+        self.layout = backend.layout
+        self.state_table = backend.state_table
+
+    def __getattr__(self, name):
+        # Writes and single-row reads go straight to MySQL
+        return getattr(self.backend, name)
+
+    def replace_indicators(self, cursor, ticker, rows):
+        self.backend.replace_indicators(cursor, ticker, rows)
+        table = self.store.table('indicators', ticker)
+        with table.lock():
+            table.clear()
+
+    def sync(self, mydb, tickers, force=False, full=False):
+        """Pull rows added since the last sync of each ticker whose data version or rebuild generation is out of date.
+
+        force pulls regardless of the version (after an ingest, before the version
+        is bumped); full discards the local rows and pulls everything again.
+        """
+        version = get_data_version(mydb)
+        cursor = mydb.cursor()
+        pulled = 0
+        try:
+            rebuilds = rebuild_generations(cursor, tickers)
+            for ticker in tickers:
+                bars = self.store.table('bars', ticker)
+                indicators = self.store.table('indicators', ticker)
+                metas = {'bars': bars.meta(), 'indicators': indicators.meta()}
+                current = all(meta['version'] == version and meta.get('rebuild', 0) == rebuilds.get((ticker, dataset), 0)
+                              for dataset, meta in metas.items())
+                if not (force or full) and current:
+                    continue
+
+                with bars.lock():
+                    rebuild = rebuilds.get((ticker, 'bars'), 0)
+                    if full or bars.meta().get('rebuild', 0) != rebuild:
+                        bars.clear(rebuild)
+                    ids = bars.arrays(['id'], last=1)['id']
+                    rows = self.backend.read_new_bars(cursor, ticker, int(ids[-1]) if len(ids) else 0, DATASETS['bars'])
+                    pulled += bars.append(rows_to_columns(DATASETS['bars'], rows), version)
+
+                with indicators.lock():
+                    rebuild = rebuilds.get((ticker, 'indicators'), 0)
+                    if full or indicators.meta().get('rebuild', 0) != rebuild:
+                        indicators.clear(rebuild)
+                    timestamps = indicators.arrays(['timestamp'], last=1)['timestamp']
+                    since = _python(timestamps[-1]) if len(timestamps) else None
+                    rows = self.backend.read_new_indicators(cursor, ticker, since)
+                    pulled += indicators.append(rows_to_columns(DATASETS['indicators'], rows), version)
+        finally:
+            cursor.close()
+        return pulled
+
+    def read_bars(self, mydb, ticker):
+        self.sync(mydb, [ticker])
+        return self.store.table('bars', ticker).frame()
+
+    def read_indicators(self, mydb, tickers, limit=None):
+        self.sync(mydb, tickers)
+        return {t: self.store.table('indicators', t).frame(last=limit) for t in tickers
+                if len(self.store.table('indicators', t))}
+
+    def read_arrays(self, mydb, tickers, columns, limit=None):
+        """Zero-copy memory-mapped columns of the latest indicator rows"""
+        self.sync(mydb, tickers)
+        return {t: self.store.table('indicators', t).arrays(columns, last=limit) for t in tickers
+                if len(self.store.table('indicators', t))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill or inspect the local columnar store')
+    parser.add_argument('command', choices=['sync', 'info'])
+    parser.add_argument('--tickers', help='comma-separated tickers (default: all of stock_list)')
+    parser.add_argument('--full', action='store_true', help='discard local data and pull every row again')
+    parser.add_argument('--layout', help='MySQL layout to pull from (default: STORAGE_LAYOUT)')
+    parser.add_argument('--dir', default=os.environ.get('LOCAL_STORE_DIR') or DEFAULT_STORE_DIR, help='store directory')
+    args = parser.parse_args()
+
+    store = LocalStore(args.dir)
+    if args.command == 'info':
+        for dataset in DATASETS:
+            tickers = store.tickers(dataset)
+            rows = sum(len(store.table(dataset, t)) for t in tickers)
+            print(f"{dataset}: {len(tickers)} tickers, {rows} rows")
+        return
+
+    storage = get_storage(args.layout, args.dir)
+    if not isinstance(storage, CachedStorage):
+        print(f"Nothing to sync for the {storage.layout} layout")
+        return
+
+    with get_connection() as mydb:
+        if args.tickers:
+            tickers = [t.strip().lower() for t in args.tickers.split(',') if t.strip()]
+        else:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker FROM stock_list')
+            tickers = [row[0].lower() for row in cursor.fetchall()]
+            cursor.close()
+
+        start = time.perf_counter()
+        pulled = storage.sync(mydb, tickers, full=args.full)
+    print(f"Pulled {pulled} rows for {len(tickers)} tickers into {args.dir} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
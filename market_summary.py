@@ -0,0 +1,148 @@
+"""Market-wide aggregates maintained by the ingestion and indicator jobs.
+
+fetch.py and indicators.py upsert one ticker_market_state row per ticker they
+touch, then refresh the single market_summary row that /api/market-summary
+reads. Run `python market_summary.py` once to backfill every ticker.
+"""
+import mysql.connector
+from db import connect
+from storage import get_storage
+
+
+def ensure_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticker_market_state (
+            ticker VARCHAR(16) PRIMARY KEY,
+            timestamp TIMESTAMP NULL,
+            close DOUBLE,
+            prev_close DOUBLE,
+            volume BIGINT,
+            ma_50day DOUBLE,
+            ma_200day DOUBLE,
+            INDEX idx_timestamp (timestamp)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS market_summary (
+            id TINYINT PRIMARY KEY,
+            total_stocks INT,
+            active_stocks INT,
+            total_volume BIGINT,
+            advancers INT,
+            decliners INT,
+            unchanged INT,
+            above_ma50 INT,
+            above_ma200 INT,
+            as_of TIMESTAMP NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def update_ticker_state(cursor, ticker, storage=None):
+    """Upsert the latest bar, previous close and long moving averages of one ticker"""
+    storage = storage or get_storage()
+    bars = storage.recent_bars(cursor, ticker, 2)
+    if not bars:
+        return
+    timestamp, close, volume = bars[0]
+    prev_close = bars[1][1] if len(bars) > 1 else None
+
+    ma_50day = ma_200day = None
+    row = storage.indicator_row(cursor, ticker, timestamp, ['MA_50DAY', 'MA_200DAY'])
+    if row:
+        ma_50day, ma_200day = row
+
+    cursor.execute("""
+        REPLACE INTO ticker_market_state (ticker, timestamp, close, prev_close, volume, ma_50day, ma_200day)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (ticker, timestamp, close, prev_close, volume, ma_50day, ma_200day))
+
+
+def refresh_summary(mydb):
+    """Recompute the market_summary row from the per-ticker state; tickers on the latest session count as active"""
+    cursor = mydb.cursor()
+    ensure_tables(cursor)
+    cursor.execute("""
+        REPLACE INTO market_summary (id, total_stocks, active_stocks, total_volume, advancers, decliners,
+                                     unchanged, above_ma50, above_ma200, as_of)
+        SELECT 1,
+               (SELECT COUNT(*) FROM stock_list),
+               COUNT(s.ticker),
+               COALESCE(SUM(s.volume), 0),
+               COALESCE(SUM(s.close > s.prev_close), 0),
+               COALESCE(SUM(s.close < s.prev_close), 0),
+               COALESCE(SUM(s.close = s.prev_close), 0),
+               COALESCE(SUM(s.close > s.ma_50day), 0),
+               COALESCE(SUM(s.close > s.ma_200day), 0),
+               latest.as_of
+        FROM (SELECT MAX(timestamp) AS as_of FROM ticker_market_state) latest
+        LEFT JOIN ticker_market_state s ON s.timestamp = latest.as_of AND s.volume > 0
+        GROUP BY latest.as_of
+    """)
+    mydb.commit()
+    cursor.close()
+
+
+SUMMARY_FIELDS = [
+    'total_stocks', 'active_stocks', 'total_volume', 'advancers', 'decliners', 'unchanged',
+    'above_ma50', 'above_ma200', 'as_of', 'updated_at'
+]
+
+
+def read_summary(mydb):
+    """The market_summary row as a dict, computing it first if it does not exist yet"""
+    cursor = mydb.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(SUMMARY_FIELDS)} FROM market_summary WHERE id = 1")
+        row = cursor.fetchone()
+    except mysql.connector.Error:
+        row = None
+    cursor.close()
+
+    if row is None:
+        refresh_summary(mydb)
+        cursor = mydb.cursor()
+        cursor.execute(f"SELECT {', '.join(SUMMARY_FIELDS)} FROM market_summary WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+
+    return dict(zip(SUMMARY_FIELDS, row)) if row else None
+
+
+def format_summary(summary):
+    """JSON-ready form of a read_summary() dict, as served by /api/market-summary"""
+    summary = dict(summary)
+    as_of, updated_at = summary.pop('as_of'), summary.pop('updated_at')
+    return {
+        **{name: int(value or 0) for name, value in summary.items()},
+        'as_of': as_of.isoformat() if as_of else None,
+        'last_updated': updated_at.isoformat() if updated_at else None
+    }
+
+
+def backfill():
+    mydb = connect()
+    cursor = mydb.cursor()
+    ensure_tables(cursor)
+
+    cursor.execute('SELECT ticker FROM stock_list')
+    tickers = [row[0].lower() for row in cursor.fetchall()]
+    storage = get_storage()
+
+    for ticker in tickers:
+        try:
+            update_ticker_state(cursor, ticker, storage)
+        except Exception as e:
+            print(f"Error processing {ticker}: {e}")
+    mydb.commit()
+
+    refresh_summary(mydb)
+    print(f"Market state backfilled for {len(tickers)} tickers")
+
+    cursor.close()
+    mydb.close()
+
+
+if __name__ == '__main__':
+    backfill()
@@ -0,0 +1,94 @@
+"""Copy the per-ticker {ticker}_data / {ticker}_MA tables into the long bars/indicators layout.
+
+Each ticker is copied server-side with INSERT ... SELECT in its own transaction,
+so the tool can be stopped and re-run; bars already copied are skipped and a
+ticker's indicator rows are replaced. Set STORAGE_LAYOUT=long once it finishes.
+"""
+import argparse
+import time
+import mysql.connector
+from db import connect, bump_data_version, existing_tables
+from storage import BAR_COLUMNS, MA_COLUMNS, get_storage
+
+
+def copy_ticker(cursor, storage, ticker, tables, indicators=True):
+    """Copy one ticker's tables; returns (source bars, copied bars, copied indicator rows)"""
+    ticker_id = storage.ticker_id(cursor, ticker, create=True)
+
+    # Bars without a timestamp cannot be keyed, duplicates of a stored timestamp are skipped
+    cursor.execute(f"SELECT COUNT(*) FROM {ticker}_data")
+    source_bars = cursor.fetchone()[0]
+    cursor.execute(f"""
+        INSERT IGNORE INTO bars (ticker_id, {', '.join(BAR_COLUMNS)})
+        SELECT %s, {', '.join(BAR_COLUMNS)} FROM {ticker}_data
+        WHERE timestamp IS NOT NULL ORDER BY id
+    """, (ticker_id,))
+    copied_bars = cursor.rowcount
+
+    copied_indicators = 0
+    if indicators and f"{ticker}_ma" in tables:
+        cursor.execute("DELETE FROM indicators WHERE ticker_id = %s", (ticker_id,))
+        cursor.execute(f"""
+            INSERT IGNORE INTO indicators (ticker_id, {', '.join(MA_COLUMNS)})
+            SELECT %s, {', '.join(MA_COLUMNS)} FROM {ticker}_MA
+            WHERE timestamp IS NOT NULL ORDER BY id
+        """, (ticker_id,))
+        copied_indicators = cursor.rowcount
+
+    return source_bars, copied_bars, copied_indicators
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy per-ticker tables into the long bars/indicators tables')
+    parser.add_argument('--tickers', help='comma-separated tickers to copy (default: all of stock_list)')
+    parser.add_argument('--partitions', type=int, help='hash partitions when creating the long tables')
+    parser.add_argument('--skip-indicators', action='store_true',
+                        help='copy bars only; indicators.py rebuilds the indicators')
+    args = parser.parse_args()
+
+    try:
+        mydb = connect()
+    except mysql.connector.Error as err:
+        print(f"Connection Error: {err}")
+        return
+
+    cursor = mydb.cursor()
+    storage = get_storage('long')
+    storage.ensure_schema(cursor, args.partitions)
+
+    if args.tickers:
+        tickers = [t.strip().lower() for t in args.tickers.split(',') if t.strip()]
+    else:
+        cursor.execute('SELECT ticker FROM stock_list')
+        tickers = [row[0].lower() for row in cursor.fetchall()]
+    tables = existing_tables(cursor)
+
+    start = time.perf_counter()
+    totals = [0, 0, 0]
+    for ticker in tickers:
+        if f"{ticker}_data" not in tables:
+            print(f"Skipping {ticker}: no {ticker}_data table")
+            continue
+        try:
+            counts = copy_ticker(cursor, storage, ticker, tables, not args.skip_indicators)
+            mydb.commit()
+        except Exception as e:
+            mydb.rollback()
+            print(f"Error migrating {ticker}: {e}")
+            continue
+        totals = [total + count for total, count in zip(totals, counts)]
+        print(f"Migrated: {ticker} ({counts[1]}/{counts[0]} bars, {counts[2]} indicator rows)")
+
+    print(f"\nCopied {totals[1]}/{totals[0]} bars and {totals[2]} indicator rows "
+          f"for {len(tickers)} tickers in {time.perf_counter() - start:.1f}s")
+
+    # The long layout keeps its own rolling state, built by the first indicators.py run
+    print("Run `STORAGE_LAYOUT=long python indicators.py` to rebuild the rolling indicator state")
+
+    bump_data_version(mydb)
+    cursor.close()
+    mydb.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,194 +1,459 @@
-import mysql.connector
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import classification_report, accuracy_score
-import joblib
 import warnings
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from changes import ensure_tables as ensure_change_tables, record_changes
+from db import get_connection
+from metrics import INFERENCE_ROWS, INFERENCE_SECONDS, phase
+from forest import PRECISIONS, CompactForest
+from registry import ModelRegistry
+from features import FEATURE_COLUMNS, INDICATOR_COLUMNS, compute_feature_matrix, to_matrix
+from storage import NO_SUCH_TABLE, get_storage
 warnings.filterwarnings('ignore')
 
+# Bars needed to compute the latest row's features (price change and 20-day volatility)
+FEATURE_HISTORY = 21
+
+# Columns read for feature extraction
+HISTORY_COLUMNS = ['timestamp', 'close', 'volume'] + INDICATOR_COLUMNS
+
+# Tickers per prediction batch when precomputing signals
+SIGNAL_BATCH_SIZE = 500
+
+SIGNAL_CLASSES = ('Buy', 'Sell', 'Hold')
+
+# Tickers per feature-extraction task when training
+TRAIN_CHUNK_SIZE = 100
+
+# Minimum indicator rows for a ticker to be used, and minimum usable samples it must contribute
+MIN_TRAINING_HISTORY = 100
+MIN_TRAINING_SAMPLES = 50
+
+WALK_FORWARD_FOLDS = 4
+
+# Training period recorded with a model, so backtests can tell in-sample dates from out-of-sample ones
+TRAINING_KEYS = ('trained_until', 'lookforward_days', 'samples')
+
+# Rows per partial_fit when fitting the scaler, bounding its float64 temporaries
+SCALER_CHUNK_ROWS = 100000
+
+
+def future_return_matrix(close, lookforward_days):
+    """Return over the next lookforward_days bars for every cell of a (tickers, days) close matrix"""
+    future = np.full(close.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        future[:, :-lookforward_days] = close[:, lookforward_days:] / close[:, :-lookforward_days] - 1
+    return future
+
+
+def label_returns(future_returns, threshold):
+    """Buy/Sell/Hold labels for future returns; unknown returns are Hold"""
+    return np.select([future_returns > threshold, future_returns < -threshold], ['Buy', 'Sell'], 'Hold')
+
+
+def extract_training_chunk(tickers, lookforward_days=5, threshold=0.02):
+    """Features (float32), labels and dates of the usable samples of a chunk of tickers"""
+    with get_connection() as mydb:
+        histories = load_history_arrays(mydb, tickers)
+    
+    frames = [h for h in histories.values() if len(h['close']) >= MIN_TRAINING_HISTORY]
+    if not frames:
+        return np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32), np.empty(0, dtype='<U4'), np.empty(0, dtype='datetime64[D]')
+    
+    close = to_matrix([f['close'] for f in frames])
+    ind = {name: to_matrix([f[name] for f in frames]) for name in INDICATOR_COLUMNS}
+    features = compute_feature_matrix(close, to_matrix([f['volume'] for f in frames]), ind, dtype=np.float32)
+    del ind
+    
+    future = future_return_matrix(close, lookforward_days)
+    dates = np.full(close.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+    for i, f in enumerate(frames):
+        dates[i, :len(f['timestamp'])] = f['timestamp'].astype('datetime64[D]')
+    
+    # Samples need finite features and a known future return
+    valid = np.isfinite(features).all(axis=2) & np.isfinite(future)
+    valid &= (valid.sum(axis=1) > MIN_TRAINING_SAMPLES)[:, np.newaxis]
+    
+    return features[valid], label_returns(future[valid], threshold), dates[valid]
+
+
+def training_path(model_path):
+    """JSON file next to a pickled model holding its training period"""
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def scale_in_place(scaler, X):
+    """Fit scaler on the float32 samples block by block, then scale them in place; returns X"""
+    for i in range(0, len(X), SCALER_CHUNK_ROWS):
+        scaler.partial_fit(X[i:i + SCALER_CHUNK_ROWS])
+    return scaler.transform(X, copy=False)
+
+
+def walk_forward_splits(dates, folds, gap_days):
+    """Expanding-window (train, test) index pairs over date-sorted samples.
+    
+    Test blocks are consecutive date ranges; training rows within gap_days
+    sessions before a test block are left out, since their labels look into it.
+    """
+    unique_dates = np.unique(dates)
+    if folds <= 0 or len(unique_dates) < folds + 1:
+        return
+    bounds = np.linspace(0, len(unique_dates), folds + 2).astype(int)
+    for k in range(1, folds + 1):
+        test_start, test_end = unique_dates[bounds[k]], unique_dates[bounds[k + 1] - 1]
+        train_end = unique_dates[max(bounds[k] - gap_days, 0)]
+        train_idx = np.flatnonzero(dates < train_end)
+        test_idx = np.flatnonzero((dates >= test_start) & (dates <= test_end))
+        if len(train_idx) and len(test_idx):
+            yield train_idx, test_idx
+
+
+def load_history_arrays(mydb, tickers, limit=None):
+    """ticker -> {column: array} of the latest HISTORY_COLUMNS rows, oldest first (memory-mapped from a local store)"""
+    return get_storage().read_arrays(mydb, tickers, HISTORY_COLUMNS, limit)
+
+
+def ensure_signal_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trading_signals (
+            ticker VARCHAR(16) PRIMARY KEY,
+            `signal` VARCHAR(8) NOT NULL,
+            confidence DOUBLE,
+            prob_buy DOUBLE,
+            prob_sell DOUBLE,
+            prob_hold DOUBLE,
+            as_of TIMESTAMP NULL,
+            generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _signal_key(prediction):
+    if prediction is None:
+        return None
+    return prediction['signal'], round(float(prediction['confidence'] or 0), 2), prediction['as_of']
+
+
+def save_signals(mydb, predictions):
+    """Store predictions, recording the tickers whose signal, confidence or as_of changed in the change feed"""
+    previous = load_signals(mydb, [p['ticker'].lower() for p in predictions])
+    changed = [
+        (p['ticker'].lower(), None) for p in predictions
+        if _signal_key(previous.get(p['ticker'].lower())) != _signal_key(p)
+    ]
+    cursor = mydb.cursor()
+    ensure_signal_table(cursor)
+    ensure_change_tables(cursor)
+    cursor.executemany("""
+        REPLACE INTO trading_signals (ticker, `signal`, confidence, prob_buy, prob_sell, prob_hold, as_of)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, [
+        (p['ticker'].lower(), p['signal'], p['confidence'], p['probabilities']['Buy'],
+         p['probabilities']['Sell'], p['probabilities']['Hold'], p['as_of'])
+        for p in predictions
+    ])
+    record_changes(cursor, 'signal', changed)
+    mydb.commit()
+    cursor.close()
+
+
+def delete_signals(mydb, tickers):
+    """Remove the stored signals of tickers that no longer get a prediction; returns the rows deleted"""
+    tickers = list(tickers)
+    cursor = mydb.cursor()
+    deleted = 0
+    for i in range(0, len(tickers), SIGNAL_BATCH_SIZE):
+        batch = tickers[i:i + SIGNAL_BATCH_SIZE]
+        cursor.execute(f"DELETE FROM trading_signals WHERE ticker IN ({', '.join(['%s'] * len(batch))})", batch)
+        deleted += cursor.rowcount
+    mydb.commit()
+    cursor.close()
+    return deleted
+
+
+def load_signals(mydb, tickers):
+    """Precomputed signals for the given tickers, keyed by lower-case ticker"""
+    if not tickers:
+        return {}
+    import mysql.connector
+    cursor = mydb.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT ticker, `signal`, confidence, prob_buy, prob_sell, prob_hold, as_of
+            FROM trading_signals WHERE ticker IN ({', '.join(['%s'] * len(tickers))})
+        """, list(tickers))
+        rows = cursor.fetchall()
+    except mysql.connector.Error as e:
+        # No signals generated yet; anything else is a real failure
+        if e.errno != NO_SUCH_TABLE:
+            raise
+        rows = []
+    finally:
+        cursor.close()
+
+    return {
+        ticker: {
+            'ticker': ticker.upper(),
+            'signal': signal,
+            'confidence': confidence,
+            'probabilities': {'Buy': prob_buy, 'Sell': prob_sell, 'Hold': prob_hold},
+            'as_of': as_of.isoformat() if as_of else None
+        }
+        for ticker, signal, confidence, prob_buy, prob_sell, prob_hold, as_of in rows
+    }
+
 class TradingMLModel:
     def __init__(self):
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.scaler = StandardScaler()
+        # scikit-learn is imported when training or loading a pickle, so serving a compact model skips it
+        self.model = None
+        self.scaler = None
+        # CompactForest serving in place of model and scaler once loaded from the registry
+        self.compact = None
         self.is_trained = False
+        # Training period of the fitted model: last sample date, label horizon and sample count
+        self.training = {}
         
     def connect_db(self):
-        return mysql.connector.connect(
-            host='104.154.25.113',
-            user='kshitij',
-            password='Kshitij_17',
-            database='stocks'
-        )
+        return get_connection()
+    
+    def load(self, model_path='trading_model.pkl', scaler_path='trading_scaler.pkl'):
+        import joblib
+        self.model = joblib.load(model_path)
+        self.scaler = joblib.load(scaler_path)
+        try:
+            with open(training_path(model_path)) as f:
+                self.training = json.load(f)
+        except FileNotFoundError:
+            # Trained before the training period was recorded
+            self.training = {}
+        self.is_trained = True
+        return self
+    
+    def load_compact(self, forest):
+        self.compact = forest
+        self.training = {key: forest.meta[key] for key in TRAINING_KEYS if key in forest.meta}
+        self.is_trained = True
+        return self
+    
+    @property
+    def classes(self):
+        return list(self.compact.classes_ if self.compact is not None else self.model.classes_)
+    
+    def predict_proba(self, X):
+        """Class probabilities (columns in `classes` order) of unscaled feature rows"""
+        if self.compact is not None:
+            return self.compact.predict_proba(X)
+        return self.model.predict_proba(self.scaler.transform(np.asarray(X, dtype=np.float64)))
+    
+    def export(self, precision='float64', registry=None):
+        """Compile the trained model and scaler into a CompactForest and publish it; returns the version"""
+        forest = CompactForest.compile(self.model, self.scaler, FEATURE_COLUMNS, precision)
+        forest.meta.update(self.training)
+        version = (registry or ModelRegistry()).publish(forest)
+        print(f"Published model version {version} ({precision}, {forest.nbytes / 2 ** 20:.1f} MiB)")
+        return version
     
     def prepare_features(self, df):
-        features = []
-        
-        # Price-based features
-        features.append(df['close'].pct_change())  # Price change
-        features.append(df['volume'].pct_change())  # Volume change
-        
-        # Technical indicators
-        features.append(df['MA_5DAY'] / df['close'] - 1)  # Price vs 5-day MA
-        features.append(df['MA_20DAY'] / df['close'] - 1)  # Price vs 20-day MA
-        features.append(df['MA_50DAY'] / df['close'] - 1)  # Price vs 50-day MA
-        features.append(df['MA_200DAY'] / df['close'] - 1)  # Price vs 200-day MA
+        close = df['close'].to_numpy(dtype=np.float64)[np.newaxis, :]
+        volume = df['volume'].to_numpy(dtype=np.float64)[np.newaxis, :]
+        ind = {name: df[name].to_numpy(dtype=np.float64)[np.newaxis, :] for name in INDICATOR_COLUMNS}
         
-        # MACD features
-        features.append(df['MACD'])
-        features.append(df['SIGNAL_LINE'])
-        features.append(df['MACD'] - df['SIGNAL_LINE'])  # MACD histogram
+        features = compute_feature_matrix(close, volume, ind)[0]
         
-        # RSI features
-        features.append(df['RSI'] / 100)  # Normalized RSI
-        
-        # Fibonacci features
-        features.append((df['close'] - df['Fib_0']) / (df['Fib_100'] - df['Fib_0']))  # Price position in Fib range
-        features.append(df['close'] / df['Fib_618'] - 1)  # Price vs 61.8% Fib
-        features.append(df['close'] / df['Fib_382'] - 1)  # Price vs 38.2% Fib
-        
-        # Volatility features
-        features.append(df['close'].rolling(20).std() / df['close'])  # 20-day volatility
-        
-        feature_df = pd.concat(features, axis=1)
-        feature_df.columns = [
-            'price_change', 'volume_change', 'ma5_ratio', 'ma20_ratio', 'ma50_ratio', 'ma200_ratio',
-            'macd', 'signal_line', 'macd_histogram', 'rsi_norm', 'fib_position', 'fib618_ratio', 
-            'fib382_ratio', 'volatility_20d'
-        ]
-        
-        return feature_df
+        return pd.DataFrame(features, columns=FEATURE_COLUMNS, index=df.index)
     
     def create_labels(self, df, lookforward_days=5, threshold=0.02):
-        future_returns = df['close'].shift(-lookforward_days) / df['close'] - 1
-        
-        labels = []
-        for ret in future_returns:
-            if pd.isna(ret):
-                labels.append('Hold')
-            elif ret > threshold:
-                labels.append('Buy')
-            elif ret < -threshold:
-                labels.append('Sell')
-            else:
-                labels.append('Hold')
-        
-        return labels
-    
-    def train_model(self):
-        print("Training ML model...")
+        future_returns = future_return_matrix(df['close'].to_numpy(dtype=np.float64)[np.newaxis, :], lookforward_days)[0]
         
-        mydb = self.connect_db()
-        cursor = mydb.cursor()
-        
-        cursor.execute('SELECT ticker FROM stock_list')
-        tickers = [row[0].lower() for row in cursor.fetchall()]
+        return label_returns(future_returns, threshold).tolist()
+    
+    def train_model(self, workers=None, chunk_size=TRAIN_CHUNK_SIZE, folds=WALK_FORWARD_FOLDS,
+                    lookforward_days=5, threshold=0.02):
+        import joblib
+        from sklearn.base import clone
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.metrics import classification_report, accuracy_score
+        from sklearn.preprocessing import StandardScaler
+        print("Training ML model...")
+        self.model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
+        self.scaler = StandardScaler()
         
-        all_features = []
-        all_labels = []
+        with self.connect_db() as mydb:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker FROM stock_list')
+            tickers = [row[0].lower() for row in cursor.fetchall()]
+            cursor.close()
         
-        for ticker in tickers[:10]:  # Using first 10 stocks for training
-            try:
-                # Get technical indicator data
-                df = pd.read_sql(f"SELECT * FROM {ticker}_MA ORDER BY timestamp", mydb)
-                
-                if len(df) < 100:  # Skipping stocks with insufficient data
+        # Extract features for the whole universe, one chunk of tickers per task
+        start = time.perf_counter()
+        chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+        X_parts, y_parts, date_parts = [], [], []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(extract_training_chunk, chunk, lookforward_days, threshold) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    X_chunk, y_chunk, dates_chunk = future.result()
+                except Exception as e:
+                    print(f"Error extracting features: {e}")
                     continue
-                
-                feature_df = self.prepare_features(df)
-                
-                labels = self.create_labels(df)
-                
-                combined = pd.concat([feature_df, pd.Series(labels, name='label')], axis=1)
-                combined = combined.dropna()
-                
-                if len(combined) > 50: 
-                    all_features.append(combined.drop('label', axis=1))
-                    all_labels.extend(combined['label'])
-                
-            except Exception as e:
-                print(f"Error processing {ticker}: {e}")
-                continue
-        
-        if len(all_features) == 0:
+                X_parts.append(X_chunk)
+                y_parts.append(y_chunk)
+                date_parts.append(dates_chunk)
+        
+        if sum(len(part) for part in y_parts) == 0:
             print("No data available for training")
             return False
         
-        X = pd.concat(all_features, axis=0)
-        y = np.array(all_labels)
+        # Time-ordered samples for walk-forward validation
+        X = np.concatenate(X_parts)
+        y = np.concatenate(y_parts)
+        dates = np.concatenate(date_parts)
+        del X_parts, y_parts, date_parts
+        order = np.argsort(dates, kind='stable')
+        X, y, dates = X[order], y[order], dates[order]
+        print(f"Extracted {len(y)} samples ({X.nbytes / 2 ** 20:.1f} MiB) in {time.perf_counter() - start:.1f}s")
         
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        last_fold = None
+        for fold, (train_idx, test_idx) in enumerate(walk_forward_splits(dates, folds, lookforward_days), 1):
+            # Fancy indexing already copies, so the float32 slices are scaled in place
+            X_train = X[train_idx]
+            scaler = StandardScaler()
+            model = clone(self.model).fit(scale_in_place(scaler, X_train), y[train_idx])
+            del X_train
+            y_pred = model.predict(scaler.transform(X[test_idx], copy=False))
+            print(f"Fold {fold}: train until {dates[train_idx[-1]]}, test {dates[test_idx[0]]} to {dates[test_idx[-1]]}, "
+                  f"accuracy {accuracy_score(y[test_idx], y_pred):.2f}")
+            last_fold = (y[test_idx], y_pred)
+            del model
         
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
+        if last_fold is not None:
+            print("\nClassification Report (last fold):")
+            print(classification_report(*last_fold))
         
-        self.model.fit(X_train_scaled, y_train)
-        
-        y_pred = self.model.predict(X_test_scaled)
-        accuracy = accuracy_score(y_test, y_pred)
-        
-        print(f"Model accuracy: {accuracy:.2f}")
-        print("\nClassification Report:")
-        print(classification_report(y_test, y_pred))
+        # Final fit on every sample, scaling the float32 matrix in place (the forest reads float32 anyway)
+        del order
+        self.model.fit(scale_in_place(self.scaler, X), y)
+        del X
+        print(f"Trained on {len(y)} samples until {dates[-1]} in {time.perf_counter() - start:.1f}s")
         
         self.is_trained = True
+        self.training = {'trained_until': str(dates[-1]), 'lookforward_days': lookforward_days, 'samples': int(len(y))}
         
         # Save model
         joblib.dump(self.model, 'trading_model.pkl')
         joblib.dump(self.scaler, 'trading_scaler.pkl')
-        
-        cursor.close()
-        mydb.close()
+        with open(training_path('trading_model.pkl'), 'w') as f:
+            json.dump(self.training, f)
         
         return True
     
-    def predict_trading_signal(self, ticker):
+    def predict_batch(self, tickers):
+        """Signals for many tickers from one history query and a single predict_proba call"""
         if not self.is_trained:
             print("Model not trained. Please train the model first.")
-            return None
+            return []
         
-        try:
-            mydb = self.connect_db()
-            
-            # Get latest data
-            df = pd.read_sql(f"SELECT * FROM {ticker}_MA ORDER BY timestamp DESC LIMIT 1", mydb)
-            
-            if len(df) == 0:
-                return None
-            
-            # Prepare features
-            feature_df = self.prepare_features(df)
-            latest_features = feature_df.iloc[-1:].dropna()
-            
-            if len(latest_features) == 0:
-                return None
-            
-            features_scaled = self.scaler.transform(latest_features)
-            
-            prediction = self.model.predict(features_scaled)[0]
-            probabilities = self.model.predict_proba(features_scaled)[0]
-            
-            confidence = max(probabilities)
-            
-            mydb.close()
-            
-            return {
+        with self.connect_db() as mydb, phase('history'):
+            histories = load_history_arrays(mydb, [t.lower() for t in tickers], FEATURE_HISTORY)
+        
+        found = [t.lower() for t in tickers if t.lower() in histories]
+        if not found:
+            return []
+        
+        frames = [histories[t] for t in found]
+        with phase('features'):
+            ind = {name: to_matrix([f[name] for f in frames]) for name in INDICATOR_COLUMNS}
+            features = compute_feature_matrix(
+                to_matrix([f['close'] for f in frames]), to_matrix([f['volume'] for f in frames]), ind
+            )
+        
+        # Latest row of each ticker
+        last = np.array([len(f['close']) - 1 for f in frames])
+        X = features[np.arange(len(found)), last]
+        valid = np.isfinite(X).all(axis=1)
+        if not valid.any():
+            return []
+        
+        start = time.perf_counter()
+        probabilities = self.predict_proba(X[valid])
+        INFERENCE_SECONDS.observe(time.perf_counter() - start)
+        INFERENCE_ROWS.inc(amount=len(probabilities))
+        classes = self.classes
+        
+        predictions = []
+        for i, proba in zip(np.flatnonzero(valid), probabilities):
+            by_class = dict(zip(classes, proba))
+            ticker = found[i]
+            timestamp = frames[i]['timestamp'][-1]
+            predictions.append({
                 'ticker': ticker.upper(),
-                'signal': prediction,
-                'confidence': round(confidence * 100, 2),
-                'probabilities': {
-                    'Buy': round(probabilities[0] * 100, 2),
-                    'Sell': round(probabilities[1] * 100, 2),
-                    'Hold': round(probabilities[2] * 100, 2)
-                }
-            }
-            
+                'signal': str(classes[int(np.argmax(proba))]),
+                'confidence': round(float(max(proba)) * 100, 2),
+                'probabilities': {c: round(float(by_class.get(c, 0.0)) * 100, 2) for c in SIGNAL_CLASSES},
+                'as_of': None if np.isnat(timestamp) else timestamp.item().isoformat()
+            })
+        
+        return predictions
+    
+    def predict_trading_signal(self, ticker):
+        try:
+            predictions = self.predict_batch([ticker])
+            return predictions[0] if predictions else None
         except Exception as e:
             print(f"Error predicting for {ticker}: {e}")
             return None
+    
+    def generate_signals(self):
+        """Precompute signals for every ticker into trading_signals"""
+        with self.connect_db() as mydb:
+            cursor = mydb.cursor()
+            cursor.execute('SELECT ticker FROM stock_list')
+            tickers = [row[0].lower() for row in cursor.fetchall()]
+            cursor.close()
+        
+        refreshed = set()
+        for i in range(0, len(tickers), SIGNAL_BATCH_SIZE):
+            predictions = self.predict_batch(tickers[i:i + SIGNAL_BATCH_SIZE])
+            with self.connect_db() as mydb:
+                save_signals(mydb, predictions)
+            refreshed.update(p['ticker'].lower() for p in predictions)
+        
+        # Tickers without valid features now, or gone from stock_list, must not keep serving an old signal
+        with self.connect_db() as mydb:
+            cursor = mydb.cursor()
+            ensure_signal_table(cursor)
+            cursor.execute('SELECT ticker FROM trading_signals')
+            stale = {row[0] for row in cursor.fetchall()} - refreshed
+            cursor.close()
+            deleted = delete_signals(mydb, sorted(stale))
+        
+        print(f"Stored signals for {len(refreshed)}/{len(tickers)} tickers, removed {deleted} stale")
+        return len(refreshed)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the trading model and precompute signals')
+    parser.add_argument('--signals-only', action='store_true',
+                        help='skip training and regenerate signals with the saved model')
+    parser.add_argument('--workers', type=int, help='feature extraction processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=TRAIN_CHUNK_SIZE, help='tickers per extraction task')
+    parser.add_argument('--folds', type=int, default=WALK_FORWARD_FOLDS, help='walk-forward validation folds (0 to skip)')
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help='threshold storage of the published compact model')
+    parser.add_argument('--export-only', action='store_true',
+                        help='publish the saved model to the registry without training')
+    args = parser.parse_args()
+    
     ml_model = TradingMLModel()
-    ml_model.train_model() 
\ No newline at end of file
+    if args.export_only:
+        ml_model.load()
+        ml_model.export(args.precision)
+    elif args.signals_only:
+        ml_model.load()
+        ml_model.generate_signals()
+    elif ml_model.train_model(workers=args.workers, chunk_size=args.chunk_size, folds=args.folds):
+        ml_model.export(args.precision)
+        ml_model.generate_signals()
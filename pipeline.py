@@ -0,0 +1,561 @@
+"""Daily pipeline: fetch -> indicators -> (train) -> signals, run ticker by ticker with checkpoints.
+
+Every ticker x stage is a task. A ticker's indicators start as soon as its
+bars are stored and its signal as soon as its indicators are, so the stages
+overlap instead of each waiting for the whole universe. Training needs the
+whole universe: it waits for every indicators task, and the signals wait for it.
+Each stage has its own pool and degree of parallelism: threads for fetching
+(I/O bound and rate limited), processes for indicators (CPU bound, one
+connection each, batches of up to INDICATOR_BATCH_SIZE tickers computed as one
+matrix) and a thread scoring batches of up to SIGNAL_BATCH_SIZE
+tickers for signals.
+
+Failed tasks are retried with exponential backoff. Finished tasks are
+checkpointed in pipeline_tasks under the run id (the --end date by default),
+so running the same command again after a partial failure only redoes what did
+not finish. Tasks whose upstream failed are skipped and left for that rerun.
+
+    python pipeline.py                                      # nightly: fetch, indicators, signals
+    python pipeline.py --stages fetch,indicators,train,signals --workers fetch=8,indicators=4
+    python pipeline.py --restart                            # ignore the checkpoints of this run id
+"""
+import argparse
+import datetime
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from changes import ensure_tables as ensure_change_tables, prune as prune_changes
+from db import connect, bump_data_version
+from events import ensure_tables as ensure_event_tables
+from market_summary import ensure_tables as ensure_market_tables, refresh_summary
+from storage import get_storage
+
+STAGES = ('fetch', 'indicators', 'train', 'signals')
+DEFAULT_STAGES = ('fetch', 'indicators', 'signals')
+
+# Stage whose task for the same ticker must succeed first
+UPSTREAM = {'indicators': 'fetch', 'signals': 'indicators'}
+
+# Concurrent tasks per stage (0 = one per CPU); training always runs alone
+DEFAULT_WORKERS = {'fetch': 4, 'indicators': 0, 'train': 1, 'signals': 1}
+
+# Attempts after the first, and the delay before the first retry (doubling up to MAX_BACKOFF)
+PIPELINE_RETRIES = int(os.environ.get('PIPELINE_RETRIES', 3))
+PIPELINE_BACKOFF = float(os.environ.get('PIPELINE_BACKOFF', 2))
+MAX_BACKOFF = 60
+
+# Seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 1.0
+
+# Seconds a partial indicators batch waits for more tickers while fetching is still running
+INDICATOR_LINGER = 1.0
+
+# Seconds a partial signals batch waits for more tickers while upstream stages are still running
+SIGNAL_LINGER = 1.0
+
+# Ticker of the training task, which covers the whole universe
+UNIVERSE = '*'
+
+
+def ensure_checkpoint_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_tasks (
+            run_id VARCHAR(32) NOT NULL,
+            stage VARCHAR(16) NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            status VARCHAR(8) NOT NULL,
+            attempts INT NOT NULL,
+            row_count INT NULL,
+            seconds DOUBLE NULL,
+            error TEXT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, stage, ticker)
+        )
+    """)
+
+
+def load_checkpoints(cursor, run_id):
+    """(stage, ticker) of the tasks that finished in an earlier invocation of the run"""
+    cursor.execute("SELECT stage, ticker FROM pipeline_tasks WHERE run_id = %s AND status = 'done'", (run_id,))
+    return {(stage, ticker) for stage, ticker in cursor.fetchall()}
+
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+
+def _thread_connection():
+    """Connection of the calling pool thread, opened on first use"""
+    mydb = getattr(_local, 'mydb', None)
+    if mydb is None:
+        mydb = _local.mydb = connect()
+        with _connections_lock:
+            _connections.append(mydb)
+    else:
+        mydb.ping(reconnect=True, attempts=2)
+    return mydb
+
+
+def _close_thread_connections():
+    with _connections_lock:
+        while _connections:
+            try:
+                _connections.pop().close()
+            except Exception:
+                pass
+
+
+def fetch_task(client, limiter, symbols, default_start, end, tickers):
+    from fetch import fetch_ticker
+    mydb = _thread_connection()
+    cursor = mydb.cursor()
+    try:
+        return {t: fetch_ticker(mydb, cursor, get_storage(), client, limiter, symbols[t], default_start, end)
+                for t in tickers}
+    except Exception:
+        mydb.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def indicators_task(incremental, tickers):
+    """Runs in an indicators worker process, on its connection"""
+    from indicators import process_tickers
+    rows, errors = {}, []
+    for ticker, count, _, error in process_tickers(tickers, incremental):
+        if error is not None:
+            errors.append(f"{ticker}: {error}")
+        rows[ticker] = count
+    if errors:
+        raise RuntimeError('; '.join(errors))
+    return rows
+
+
+class ModelStages:
+    """Training and signal tasks sharing the model they produce or load"""
+
+    def __init__(self, train_workers=None):
+        self.train_workers = train_workers
+        self.model = None
+        self._lock = threading.Lock()
+
+    def train(self, tickers):
+        from model import TradingMLModel
+        model = TradingMLModel()
+        if not model.train_model(workers=self.train_workers):
+            raise RuntimeError('training produced no model')
+        model.export()
+        self.model = model
+        return {UNIVERSE: 1}
+
+    def signals(self, tickers):
+        from model import TradingMLModel, delete_signals, save_signals
+        with self._lock:
+            if self.model is None:
+                if not os.path.exists('trading_model.pkl'):
+                    raise RuntimeError('no trained model; run the train stage first')
+                self.model = TradingMLModel().load()
+        predictions = self.model.predict_batch(tickers)
+        mydb = _thread_connection()
+        save_signals(mydb, predictions)
+        found = {p['ticker'].lower() for p in predictions}
+        # No valid features now: drop the old signal instead of serving it
+        delete_signals(mydb, [t for t in tickers if t not in found])
+        return {t: int(t in found) for t in tickers}
+
+
+class Task:
+    __slots__ = ('stage', 'ticker', 'status', 'waiting', 'blocked', 'dependents', 'attempts', 'rows',
+                 'seconds', 'error', 'queued_at', 'resumed')
+
+    def __init__(self, stage, ticker):
+        self.stage = stage
+        self.ticker = ticker
+        self.status = None  # ready, running, retrying, done, failed or skipped
+        self.waiting = 0  # unfinished tasks this one waits for
+        self.blocked = False  # a required task did not succeed
+        self.dependents = []  # (task, required)
+        self.attempts = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.error = None
+        self.queued_at = None
+        self.resumed = False
+
+
+class Stage:
+    def __init__(self, name, run, workers, processes=False, batch_size=1, linger=0.0, initializer=None):
+        self.name = name
+        self.run = run  # tickers -> {ticker: rows}
+        self.workers = workers
+        self.processes = processes
+        self.batch_size = batch_size
+        self.linger = linger
+        self.initializer = initializer
+        self.executor = None
+        self.ready = deque()
+        self.running = 0
+        self.unfinished = 0
+        self.first_start = None
+        self.last_finish = None
+        self.retries = 0
+
+    def start(self):
+        if self.processes:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+            # With fork, every worker starts on the first submit; do it before other stages start threads
+            self.executor.submit(os.getpid).result()
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class Pipeline:
+    def __init__(self, stages, tickers, run_id, retries=PIPELINE_RETRIES, backoff=PIPELINE_BACKOFF):
+        self.stages = {stage.name: stage for stage in sorted(stages, key=lambda s: STAGES.index(s.name))}
+        self.tickers = tickers
+        self.run_id = run_id
+        self.retries = retries
+        self.backoff = backoff
+        self.tasks = {}
+        self._checkpoints = []
+        self._retry_heap = []
+        self._sequence = 0
+
+        for name in self.stages:
+            for ticker in ([UNIVERSE] if name == 'train' else tickers):
+                self.tasks[(name, ticker)] = Task(name, ticker)
+                self.stages[name].unfinished += 1
+        for (name, ticker), task in self.tasks.items():
+            if name == 'train':
+                # Trains on whatever indicators exist once every indicators task has finished
+                for t in tickers:
+                    self._depend(task, ('indicators', t), required=False)
+                continue
+            self._depend(task, (UPSTREAM.get(name), ticker), required=True)
+            if name == 'signals':
+                self._depend(task, ('train', UNIVERSE), required=True)
+
+    def _depend(self, task, key, required):
+        upstream = self.tasks.get(key)
+        if upstream is not None:
+            upstream.dependents.append((task, required))
+            task.waiting += 1
+
+    def _queue(self, task):
+        task.status = 'ready'
+        task.queued_at = time.monotonic()
+        self.stages[task.stage].ready.append(task)
+
+    def _finish(self, task, status, rows=0, seconds=0.0, error=None):
+        task.status, task.rows, task.error = status, rows, error
+        task.seconds += seconds
+        stage = self.stages[task.stage]
+        stage.unfinished -= 1
+        if not task.resumed:
+            self._checkpoints.append((self.run_id, task.stage, task.ticker, status, task.attempts,
+                                      rows, round(task.seconds, 4), error and error[:1000]))
+        self._release(task)
+
+    def _release(self, task):
+        for dependent, required in task.dependents:
+            if required and task.status != 'done':
+                dependent.blocked = True
+            dependent.waiting -= 1
+            if dependent.waiting == 0 and dependent.status is None:
+                if dependent.blocked:
+                    self._finish(dependent, 'skipped', error=f"{task.stage} {task.status} for {task.ticker}")
+                else:
+                    self._queue(dependent)
+
+    def resume(self, done):
+        """Mark the tasks checkpointed as done; returns how many there were"""
+        resumed = [task for key, task in self.tasks.items() if key in done]
+        for task in resumed:
+            task.status, task.resumed = 'done', True
+            self.stages[task.stage].unfinished -= 1
+        for task in resumed:
+            self._release(task)
+        return len(resumed)
+
+    def _upstream_unfinished(self, name):
+        return sum(stage.unfinished for other, stage in self.stages.items() if STAGES.index(other) < STAGES.index(name))
+
+    def _submit(self, stage, running, now):
+        while stage.ready and stage.running < stage.workers:
+            if (stage.batch_size > 1 and len(stage.ready) < stage.batch_size and self._upstream_unfinished(stage.name)
+                    and now - stage.ready[0].queued_at < stage.linger):
+                return
+            batch = [stage.ready.popleft() for _ in range(min(stage.batch_size, len(stage.ready)))]
+            for task in batch:
+                task.status = 'running'
+                task.attempts += 1
+            stage.running += 1
+            stage.first_start = stage.first_start or time.perf_counter()
+            future = stage.executor.submit(stage.run, [t.ticker for t in batch])
+            running[future] = (stage, batch, time.perf_counter())
+
+    def _completed(self, future, stage, batch, started):
+        seconds = time.perf_counter() - started
+        stage.running -= 1
+        stage.last_finish = time.perf_counter()
+        try:
+            rows = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died; later attempts need a new pool
+                stage.executor.shutdown(wait=False)
+                stage.start()
+            label = batch[0].ticker if len(batch) == 1 else f"{len(batch)} tickers"
+            if batch[0].attempts <= self.retries:
+                delay = min(self.backoff * 2 ** (batch[0].attempts - 1), MAX_BACKOFF)
+                stage.retries += len(batch)
+                print(f"Retrying {stage.name} {label} in {delay:.1f}s: {e}")
+                self._sequence += 1
+                heapq.heappush(self._retry_heap, (time.monotonic() + delay, self._sequence, stage.name, batch))
+                for task in batch:
+                    task.seconds += seconds / len(batch)
+                    task.status = 'retrying'
+            else:
+                print(f"Failed {stage.name} {label} after {batch[0].attempts} attempts: {e}")
+                for task in batch:
+                    self._finish(task, 'failed', seconds=seconds / len(batch), error=str(e))
+            return
+        for task in batch:
+            self._finish(task, 'done', rows.get(task.ticker, 0), seconds / len(batch))
+
+    def _flush_checkpoints(self, mydb):
+        if not self._checkpoints:
+            return
+        cursor = mydb.cursor()
+        cursor.executemany("""
+            REPLACE INTO pipeline_tasks (run_id, stage, ticker, status, attempts, row_count, seconds, error)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, self._checkpoints)
+        mydb.commit()
+        cursor.close()
+        self._checkpoints = []
+
+    def run(self, mydb, progress_interval=10.0):
+        """Run every unfinished task, checkpointing on mydb; returns the stage reports"""
+        for task in self.tasks.values():
+            if task.status is None and task.waiting == 0:
+                self._queue(task)
+
+        running = {}
+        flushed = reported = time.monotonic()
+        try:
+            for stage in self.stages.values():
+                if stage.unfinished:
+                    stage.start()
+            while True:
+                now = time.monotonic()
+                while self._retry_heap and self._retry_heap[0][0] <= now:
+                    _, _, name, batch = heapq.heappop(self._retry_heap)
+                    for task in reversed(batch):
+                        task.status = 'ready'
+                        self.stages[name].ready.appendleft(task)
+                for stage in self.stages.values():
+                    self._submit(stage, running, now)
+                if not running and not self._retry_heap and not any(s.ready for s in self.stages.values()):
+                    break
+
+                deadlines = [now + CHECKPOINT_INTERVAL]
+                if self._retry_heap:
+                    deadlines.append(self._retry_heap[0][0])
+                deadlines.extend(s.ready[0].queued_at + s.linger for s in self.stages.values() if s.ready and s.linger)
+                done, _ = wait(running, timeout=max(min(deadlines) - now, 0.01), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._completed(future, *running.pop(future))
+
+                if time.monotonic() - flushed >= CHECKPOINT_INTERVAL:
+                    self._flush_checkpoints(mydb)
+                    flushed = time.monotonic()
+                if progress_interval and time.monotonic() - reported >= progress_interval:
+                    print('Progress: ' + ', '.join(
+                        f"{name} {len(self.tickers if name != 'train' else [UNIVERSE]) - s.unfinished}/"
+                        f"{len(self.tickers if name != 'train' else [UNIVERSE])}" for name, s in self.stages.items()
+                    ))
+                    reported = time.monotonic()
+        finally:
+            self._flush_checkpoints(mydb)
+            for stage in self.stages.values():
+                stage.shutdown()
+        return self.report()
+
+    def report(self):
+        """Per-stage task counts, rows, timings and throughput"""
+        reports = []
+        for name, stage in self.stages.items():
+            tasks = [t for t in self.tasks.values() if t.stage == name]
+            ran = sorted(t.seconds for t in tasks if t.status in ('done', 'failed') and not t.resumed)
+            wall = (stage.last_finish - stage.first_start) if stage.first_start and stage.last_finish else 0.0
+            done = sum(t.status == 'done' and not t.resumed for t in tasks)
+            reports.append({
+                'stage': name,
+                'workers': stage.workers,
+                'done': done,
+                'failed': sum(t.status == 'failed' for t in tasks),
+                'skipped': sum(t.status == 'skipped' for t in tasks),
+                'resumed': sum(t.resumed for t in tasks),
+                'retries': stage.retries,
+                'rows': sum(t.rows for t in tasks if not t.resumed),
+                'wall_seconds': round(wall, 3),
+                'busy_seconds': round(sum(ran), 3),
+                'tasks_per_second': round(done / wall, 2) if wall else None,
+                'task_p50': round(ran[len(ran) // 2], 4) if ran else None,
+                'task_max': round(ran[-1], 4) if ran else None
+            })
+        return reports
+
+    def failures(self):
+        return [t for t in self.tasks.values() if t.status in ('failed', 'skipped')]
+
+
+def print_report(reports, elapsed):
+    print(f"\n{'stage':<11} {'workers':>7} {'done':>6} {'failed':>6} {'skipped':>7} {'resumed':>7} {'retries':>7} "
+          f"{'rows':>8} {'wall s':>8} {'busy s':>8} {'tasks/s':>8} {'p50 s':>7} {'max s':>7}")
+    for r in reports:
+        def fmt(value, width, digits):
+            return format(value, f">{width}.{digits}f") if value is not None else '-'.rjust(width)
+        print(f"{r['stage']:<11} {r['workers']:>7} {r['done']:>6} {r['failed']:>6} {r['skipped']:>7} {r['resumed']:>7} "
+              f"{r['retries']:>7} {r['rows']:>8} {r['wall_seconds']:>8.1f} {r['busy_seconds']:>8.1f} "
+              f"{fmt(r['tasks_per_second'], 8, 1)} {fmt(r['task_p50'], 7, 3)} {fmt(r['task_max'], 7, 3)}")
+    print(f"Pipeline finished in {elapsed:.1f}s")
+
+
+def parse_workers(text):
+    """'fetch=8,indicators=4' -> DEFAULT_WORKERS with those overrides"""
+    workers = dict(DEFAULT_WORKERS)
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, _, value = item.partition('=')
+        if name not in workers or not value.isdigit():
+            raise ValueError(f"--workers expects stage=count pairs for {', '.join(STAGES)}, got {item!r}")
+        workers[name] = int(value)
+    workers = {name: count or os.cpu_count() for name, count in workers.items()}
+    workers['train'] = 1
+    return workers
+
+
+def build_stages(names, workers, args):
+    from fetch import POLYGON_API_KEY, TokenBucket
+    from indicators import INDICATOR_BATCH_SIZE, _init_worker
+    from model import SIGNAL_BATCH_SIZE
+    model_stages = ModelStages(args.train_workers)
+    stages = []
+    if 'fetch' in names:
+        from polygon import RESTClient
+        client = RESTClient(POLYGON_API_KEY, base=args.base_url)
+        symbols = {t.lower(): t for t in args.symbols}
+        stages.append(Stage('fetch', partial(fetch_task, client, TokenBucket(args.rate), symbols, args.start, args.end),
+                            workers['fetch']))
+    if 'indicators' in names:
+        stages.append(Stage('indicators', partial(indicators_task, not args.rebuild), workers['indicators'],
+                            processes=True, batch_size=INDICATOR_BATCH_SIZE, linger=INDICATOR_LINGER,
+                            initializer=_init_worker))
+    if 'train' in names:
+        stages.append(Stage('train', model_stages.train, 1))
+    if 'signals' in names:
+        stages.append(Stage('signals', model_stages.signals, workers['signals'],
+                            batch_size=SIGNAL_BATCH_SIZE, linger=SIGNAL_LINGER))
+    return stages
+
+
+def main():
+    from fetch import DEFAULT_START, POLYGON_BASE_URL
+    from indicators import ensure_state_table
+
+    parser = argparse.ArgumentParser(description='Run fetch, indicators, training and signals ticker by ticker')
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES), help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument('--workers', help='per-stage concurrency, e.g. fetch=8,indicators=4,signals=1 (0 = one per CPU)')
+    parser.add_argument('--tickers', help='comma-separated tickers (default: all of stock_list)')
+    parser.add_argument('--start', default=DEFAULT_START, help='first date for tickers without stored data')
+    parser.add_argument('--end', default=datetime.date.today().isoformat(), help='last date to fetch')
+    parser.add_argument('--run-id', help='checkpoint key; rerunning with the same id resumes (default: --end)')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoints of this run id')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild indicators from the full history')
+    parser.add_argument('--retries', type=int, default=PIPELINE_RETRIES, help='retries per task')
+    parser.add_argument('--backoff', type=float, default=PIPELINE_BACKOFF, help='seconds before the first retry')
+    parser.add_argument('--rate', type=float, default=5, help='Polygon requests allowed per minute by the plan')
+    parser.add_argument('--base-url', default=POLYGON_BASE_URL, help='Polygon API base URL, e.g. a local stand-in')
+    parser.add_argument('--train-workers', type=int, help='feature extraction processes when training')
+    parser.add_argument('--output', help='write the stage reports as JSON to this file')
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(names) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    try:
+        workers = parse_workers(args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    run_id = args.run_id or args.end
+
+    mydb = connect()
+    cursor = mydb.cursor()
+    if args.tickers:
+        args.symbols = [t.strip() for t in args.tickers.split(',') if t.strip()]
+    else:
+        cursor.execute('SELECT ticker FROM stock_list')
+        args.symbols = [row[0] for row in cursor.fetchall()]
+    tickers = [t.lower() for t in args.symbols]
+
+    get_storage().ensure_schema(cursor)
+    ensure_state_table(cursor)
+    ensure_market_tables(cursor)
+    ensure_event_tables(cursor)
+    ensure_change_tables(cursor)
+    ensure_checkpoint_table(cursor)
+    if args.restart:
+        cursor.execute('DELETE FROM pipeline_tasks WHERE run_id = %s', (run_id,))
+    mydb.commit()
+
+    pipeline = Pipeline(build_stages(names, workers, args), tickers, run_id, args.retries, args.backoff)
+    resumed = pipeline.resume(load_checkpoints(cursor, run_id))
+    cursor.close()
+    print(f"Run {run_id}: {', '.join(names)} for {len(tickers)} tickers"
+          + (f", {resumed} tasks already done" if resumed else ''))
+
+    start = time.perf_counter()
+    try:
+        reports = pipeline.run(mydb)
+    finally:
+        _close_thread_connections()
+    elapsed = time.perf_counter() - start
+    print_report(reports, elapsed)
+
+    failures = pipeline.failures()
+    for task in failures[:20]:
+        print(f"{task.status.capitalize()}: {task.stage} {task.ticker}: {task.error}")
+    if len(failures) > 20:
+        print(f"... and {len(failures) - 20} more; rerun to retry them")
+
+    # Once per run instead of after every stage
+    cursor = mydb.cursor()
+    refresh_summary(mydb)
+    prune_changes(cursor)
+    mydb.commit()
+    cursor.close()
+    bump_data_version(mydb)
+    mydb.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'run_id': run_id, 'seconds': elapsed, 'stages': reports}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+"""Local stand-in for the Polygon.io aggregates API.
+
+Serves deterministic synthetic daily bars so fetch.py can run without an API key:
+
+    python polygon_stub.py --port 8001
+    python fetch.py --base-url http://127.0.0.1:8001 --rate 600
+"""
+import argparse
+import datetime
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+AGGS_PATH = re.compile(r'^/v2/aggs/ticker/(?P<ticker>[^/]+)/range/(?P<multiplier>\d+)/(?P<timespan>\w+)/(?P<start>[^/]+)/(?P<end>[^/?]+)')
+
+
+def synthetic_bars(ticker, start, end):
+    """Deterministic random-walk daily bars on weekdays between start and end (inclusive)"""
+    seed = zlib.crc32(ticker.encode())
+    price = 20 + seed % 300
+    day = datetime.date(2000, 1, 3)
+    bars = []
+    while day <= end:
+        if day.weekday() < 5:
+            seed = (1103515245 * seed + 12345) % 2 ** 31
+            price = max(1.0, price * (1 + ((seed % 2001) - 1000) / 50000))
+            if day >= start:
+                ts = datetime.datetime(day.year, day.month, day.day, 4, tzinfo=datetime.timezone.utc)
+                bars.append({
+                    'o': round(price * 0.995, 2), 'h': round(price * 1.01, 2), 'l': round(price * 0.99, 2),
+                    'c': round(price, 2), 'v': 100000 + seed % 900000, 'vw': round(price, 4),
+                    't': int(ts.timestamp() * 1000), 'n': 1000 + seed % 5000
+                })
+        day += datetime.timedelta(days=1)
+    return bars
+
+
+def _parse_date(value):
+    if value.isdigit():
+        return datetime.datetime.fromtimestamp(int(value) / 1000, datetime.timezone.utc).date()
+    return datetime.date.fromisoformat(value)
+
+
+class PolygonStubHandler(BaseHTTPRequestHandler):
+    rate_limit = None  # Max requests per second before answering 429
+    _lock = threading.Lock()
+    _window = [0.0, 0]
+
+    def _throttled(self):
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window[0] >= 1:
+                self._window[:] = [now, 0]
+            self._window[1] += 1
+            return self._window[1] > self.rate_limit
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        match = AGGS_PATH.match(self.path)
+        if not match:
+            return self._send(404, {'status': 'NOT_FOUND'})
+        if self._throttled():
+            return self._send(429, {'status': 'ERROR', 'error': 'exceeded the maximum requests per second'})
+
+        ticker = match['ticker']
+        bars = synthetic_bars(ticker, _parse_date(match['start']), _parse_date(match['end']))
+        self._send(200, {
+            'ticker': ticker, 'status': 'OK', 'adjusted': True,
+            'queryCount': len(bars), 'resultsCount': len(bars), 'results': bars
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0, rate_limit=None):
+    """Start the stand-in on a background thread; returns the server (base URL from server.server_address)"""
+    handler = type('Handler', (PolygonStubHandler,), {'rate_limit': rate_limit})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Polygon.io aggregates API')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--rate-limit', type=int, help='requests per second before answering 429')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.rate_limit)
+    print(f"Polygon stand-in listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
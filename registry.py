@@ -0,0 +1,135 @@
+"""Versioned store of compact model artifacts with atomic publish and hot reload.
+
+Layout under MODEL_REGISTRY_DIR:
+
+    models/<version>/   one CompactForest (see forest.py)
+    CURRENT             name of the version being served
+
+Publishing writes the new version to a temporary directory, renames it into
+models/ and then replaces CURRENT, so readers see either the old or the new
+model and never a partial one. Serving processes call current(), which
+re-reads CURRENT at most every MODEL_CHECK_INTERVAL seconds and swaps in the
+new version when it changed; requests already holding the old one finish with it.
+
+    python registry.py                 list versions
+    python registry.py --use VERSION   serve an older version (rollback)
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from forest import CompactForest
+
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'model_registry')
+
+# Seconds between checks of CURRENT in serving processes
+MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', 30))
+
+# Versions kept when publishing; older ones are deleted
+MODEL_KEEP = int(os.environ.get('MODEL_KEEP', 5))
+
+
+class ModelRegistry:
+    def __init__(self, root=MODEL_REGISTRY_DIR, check_interval=MODEL_CHECK_INTERVAL):
+        self.root = root
+        self.models_dir = os.path.join(root, 'models')
+        self.check_interval = check_interval
+        self._loaded = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def versions(self):
+        """Published versions, oldest first"""
+        if not os.path.isdir(self.models_dir):
+            return []
+        return sorted(name for name in os.listdir(self.models_dir) if not name.startswith('.'))
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.root, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _set_current(self, version):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.CURRENT')
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp, os.path.join(self.root, 'CURRENT'))
+
+    def publish(self, forest, keep=MODEL_KEEP):
+        """Store a CompactForest as a new version and make it current; returns the version"""
+        os.makedirs(self.models_dir, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        tmp = tempfile.mkdtemp(dir=self.models_dir, prefix='.tmp-')
+        try:
+            forest.meta['version'] = version
+            forest.save(tmp)
+            os.rename(tmp, os.path.join(self.models_dir, version))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._set_current(version)
+        self.prune(keep)
+        return version
+
+    def use(self, version):
+        """Serve a previously published version"""
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version: {version}")
+        self._set_current(version)
+
+    def prune(self, keep=MODEL_KEEP):
+        current = self.current_version()
+        old = [v for v in self.versions() if v != current]
+        for version in old[:max(len(old) - (keep - 1), 0)]:
+            shutil.rmtree(os.path.join(self.models_dir, version), ignore_errors=True)
+
+    def load(self, version=None):
+        version = version or self.current_version()
+        if version is None:
+            return None
+        return CompactForest.load(os.path.join(self.models_dir, version))
+
+    def current(self):
+        """The current CompactForest (None if nothing is published), reloaded when CURRENT changes"""
+        now = time.monotonic()
+        loaded = self._loaded
+        if loaded is not None and now - self._checked < self.check_interval:
+            return loaded[1]
+        with self._lock:
+            self._checked = now
+            version = self.current_version()
+            if version is None:
+                self._loaded = None
+            elif self._loaded is None or self._loaded[0] != version:
+                try:
+                    self._loaded = (version, self.load(version))
+                    print(f"Loaded model version {version}")
+                except Exception as e:
+                    # Keep serving the previous version
+                    print(f"Error loading model version {version}: {e}")
+            return self._loaded[1] if self._loaded else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List or switch published model versions')
+    parser.add_argument('--use', metavar='VERSION', help='make VERSION the served model')
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.use:
+        registry.use(args.use)
+    current = registry.current_version()
+    for version in registry.versions():
+        meta = registry.load(version).meta
+        marker = '*' if version == current else ' '
+        print(f"{marker} {version}  {meta['precision']:<8} {meta['trees']} trees, {meta['nodes']} nodes, "
+              f"classes {', '.join(meta['classes'])}, trained until {meta.get('trained_until', 'unknown')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import threading
+import time
+import numpy as np
+from db import get_data_version
+from events import DEFAULT_LOOKBACK, recent_events
+from storage import get_storage
+
+# Latest-row columns held in the snapshot, keyed by the {ticker}_MA / {ticker}_data column names
+SNAPSHOT_COLUMNS = ['close', 'volume', 'RSI', 'MA_20DAY', 'MA_50DAY', 'MACD', 'SIGNAL_LINE']
+
+# Seconds between data-version checks against MySQL
+VERSION_CHECK_INTERVAL = 30
+
+def criteria_mask(col, criteria, shape):
+    """Cells of SNAPSHOT_COLUMNS arrays (any shape) passing every criterion; missing values never fail a filter"""
+    mask = np.ones(shape, dtype=bool)
+
+    if criteria.get('min_price') not in (None, ''):
+        mask &= ~(col['close'] < float(criteria['min_price']))
+
+    if criteria.get('max_price') not in (None, ''):
+        mask &= ~(col['close'] > float(criteria['max_price']))
+
+    if criteria.get('min_volume') not in (None, ''):
+        mask &= ~(col['volume'] < float(criteria['min_volume']))
+
+    if criteria.get('rsi_oversold') not in (None, ''):
+        mask &= ~(col['RSI'] > float(criteria['rsi_oversold']))
+
+    if criteria.get('rsi_overbought') not in (None, ''):
+        mask &= ~(col['RSI'] < float(criteria['rsi_overbought']))
+
+    if criteria.get('ma_crossover'):
+        # Price above 20-day MA and 20-day MA above 50-day MA
+        mask &= ~((col['close'] < col['MA_20DAY']) | (col['MA_20DAY'] < col['MA_50DAY']))
+
+    if criteria.get('macd_bullish'):
+        # MACD above signal line
+        mask &= ~(col['MACD'] <= col['SIGNAL_LINE'])
+
+    return mask
+
+
+class ScreenerSnapshot:
+    """Latest indicator row of every ticker, held as NumPy column arrays"""
+
+    def __init__(self):
+        self.tickers = np.array([], dtype=object)
+        self.columns = {name: np.array([], dtype=np.float64) for name in SNAPSHOT_COLUMNS}
+        self.version = None
+        self.loaded_at = None
+
+    @classmethod
+    def load(cls, mydb):
+        """Bulk load the latest row of every ticker in stock_list"""
+        snapshot = cls()
+        cursor = mydb.cursor()
+
+        snapshot.version = get_data_version(mydb)
+
+        cursor.execute('SELECT ticker FROM stock_list')
+        tickers = [row[0].lower() for row in cursor.fetchall()]
+        rows = get_storage().latest_rows(cursor, tickers, SNAPSHOT_COLUMNS)
+        cursor.close()
+
+        # Keep stock_list order so results match the previous per-ticker scan
+        by_ticker = {row[0]: row[1:] for row in rows}
+        ordered = [t for t in tickers if t in by_ticker]
+        values = np.array([by_ticker[t] for t in ordered], dtype=np.float64).reshape(len(ordered), len(SNAPSHOT_COLUMNS))
+
+        snapshot.tickers = np.array(ordered, dtype=object)
+        snapshot.columns = {name: values[:, i] for i, name in enumerate(SNAPSHOT_COLUMNS)}
+        snapshot.loaded_at = time.time()
+        return snapshot
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def mask(self, criteria):
+        """Boolean mask of tickers passing every criterion; missing values never fail a filter"""
+        return criteria_mask(self.columns, criteria, len(self.tickers))
+
+    def screen(self, criteria, events=None):
+        """Tickers passing criteria; with events (ticker -> {event_type: timestamp}) only those tickers, with their events"""
+        mask = self.mask(criteria)
+        if events is not None:
+            mask &= np.isin(self.tickers, list(events))
+        idx = np.flatnonzero(mask)
+        col = self.columns
+
+        def values(name):
+            return [None if np.isnan(v) else float(v) for v in col[name][idx]]
+
+        volumes = np.nan_to_num(col['volume'][idx]).astype(np.int64).tolist()
+        results = [
+            {
+                'ticker': ticker.upper(),
+                'close': close,
+                'volume': volume,
+                'rsi': rsi,
+                'macd': macd,
+                'ma_20day': ma_20day,
+                'ma_50day': ma_50day
+            }
+            for ticker, close, volume, rsi, macd, ma_20day, ma_50day in zip(
+                self.tickers[idx], values('close'), volumes, values('RSI'),
+                values('MACD'), values('MA_20DAY'), values('MA_50DAY')
+            )
+        ]
+        if events is not None:
+            for result in results:
+                result['events'] = {
+                    event_type: timestamp.isoformat() for event_type, timestamp in events[result['ticker'].lower()].items()
+                }
+        return results
+
+
+def find_events(mydb, criteria):
+    """ticker -> {event_type: latest timestamp} for criteria['events'] within criteria['lookback'] sessions.
+
+    event_match 'any' (default) keeps tickers with at least one of the events, 'all' those with every one.
+    Returns None when no events are requested; raises ValueError on bad criteria.
+    """
+    event_types = criteria.get('events')
+    if not event_types:
+        return None
+    if isinstance(event_types, str):
+        event_types = [e.strip() for e in event_types.split(',') if e.strip()]
+    lookback = criteria.get('lookback')
+    lookback = DEFAULT_LOOKBACK if lookback in (None, '') else int(lookback)
+    if lookback < 1:
+        raise ValueError('lookback must be at least 1 session')
+    match = criteria.get('event_match', 'any')
+    if match not in ('any', 'all'):
+        raise ValueError("event_match must be 'any' or 'all'")
+
+    cursor = mydb.cursor()
+    try:
+        found = recent_events(cursor, event_types, lookback)
+    finally:
+        cursor.close()
+    if match == 'all':
+        found = {ticker: events for ticker, events in found.items() if len(events) == len(set(event_types))}
+    return found
+
+
+_snapshot = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_snapshot(get_connection, force=False):
+    """Return the process-local snapshot, reloading it when the data version changes"""
+    global _snapshot, _checked_at
+
+    now = time.time()
+    if not force and _snapshot is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+        return _snapshot
+
+    with _lock:
+        if not force and _snapshot is not None and time.time() - _checked_at < VERSION_CHECK_INTERVAL:
+            return _snapshot
+        with get_connection() as mydb:
+            if force or _snapshot is None or get_data_version(mydb) != _snapshot.version:
+                _snapshot = ScreenerSnapshot.load(mydb)
+        _checked_at = time.time()
+
+    return _snapshot
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# Response field -> {ticker}_MA / {ticker}_data column
+STOCK_DATA_FIELDS = {
+    'close': 'close',
+    'volume': 'volume',
+    'ma_5day': 'MA_5DAY',
+    'ma_20day': 'MA_20DAY',
+    'ma_50day': 'MA_50DAY',
+    'ma_200day': 'MA_200DAY',
+    'ema_12day': 'EMA_12DAY',
+    'ema_26day': 'EMA_26DAY',
+    'macd': 'MACD',
+    'signal_line': 'SIGNAL_LINE',
+    'rsi': 'RSI',
+    'fib_0': 'Fib_0',
+    'fib_236': 'Fib_236',
+    'fib_382': 'Fib_382',
+    'fib_500': 'Fib_500',
+    'fib_618': 'Fib_618',
+    'fib_100': 'Fib_100'
+}
+
+
+def _nullable(values, dtype):
+    """Column as a list of Python scalars with None for missing values, converted in one pass"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.flatnonzero(np.isnan(values))
+    out = values.astype(dtype).tolist() if len(missing) == 0 else np.where(np.isnan(values), 0, values).astype(dtype).tolist()
+    for i in missing:
+        out[i] = None
+    return out
+
+
+def timestamp_column(timestamps):
+    """ISO-8601 strings (second precision) for a timestamp column, None for missing values"""
+    stamps = pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[s]')
+    out = np.datetime_as_string(stamps, unit='s').tolist()
+    for i in np.flatnonzero(np.isnat(stamps)):
+        out[i] = None
+    return out
+
+
+def stock_data_columns(df):
+    """Whole-column conversion of an indicator frame into JSON-ready lists keyed by response field"""
+    columns = {'timestamp': timestamp_column(df['timestamp'])}
+    for field, source in STOCK_DATA_FIELDS.items():
+        if source not in df.columns:
+            columns[field] = [None] * len(df)
+        elif field == 'volume':
+            columns[field] = _nullable(df[source], np.int64)
+        else:
+            columns[field] = _nullable(df[source], np.float64)
+    return columns
+
+
+def columns_to_records(columns):
+    """Row-oriented form of stock_data_columns output: one dict per timestamp"""
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
@@ -0,0 +1,197 @@
+"""SQLite stand-in for the MySQL database, for benchmarks and offline runs.
+
+Set DB_SQLITE_PATH and db.connect() returns a connection from here instead of
+MySQL. Statements are rewritten from the MySQL dialect used in this project
+(%s placeholders, AUTO_INCREMENT, inline KEY/INDEX clauses, INSERT IGNORE,
+ON DUPLICATE KEY UPDATE, parenthesized UNION ALL members, information_schema
+table lists) and SQLite errors are raised as mysql.connector errors, so code
+that catches e.g. a missing table (errno 1146) behaves the same.
+"""
+import datetime
+import re
+import sqlite3
+from functools import lru_cache
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+DATETIME_TEXT = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+for _type, _adapt in [
+    (datetime.datetime, lambda v: v.isoformat(' ')),
+    (pd.Timestamp, lambda v: v.to_pydatetime().isoformat(' ')),
+    (datetime.date, lambda v: v.isoformat()),
+    (np.float64, float),
+    (np.float32, float),
+    (np.int64, int),
+    (np.int32, int),
+    (np.str_, str)
+]:
+    sqlite3.register_adapter(_type, _adapt)
+
+
+def _split_top_level(body):
+    """Split a CREATE TABLE body on commas outside parentheses"""
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _translate_create(sql):
+    match = re.match(r'CREATE TABLE\s+(IF NOT EXISTS\s+)?(\w+)\s*\((.*)\)', sql, re.S | re.I)
+    if_not_exists, table, body = match.group(1) or '', match.group(2), match.group(3)
+
+    definitions, indexes = [], []
+    primary_key = auto_column = None
+    for part in _split_top_level(body):
+        upper = part.upper()
+        if upper.startswith('PRIMARY KEY'):
+            primary_key = part[len('PRIMARY KEY'):].strip()
+        elif upper.startswith('UNIQUE'):
+            definitions.append(re.sub(r'^UNIQUE\s+(KEY|INDEX)\s+\w+\s*', 'UNIQUE ', part, flags=re.I))
+        elif re.match(r'(KEY|INDEX)\s', upper):
+            name, columns = re.match(r'(?:KEY|INDEX)\s+(\w+)\s*(\(.*\))', part, re.S | re.I).groups()
+            indexes.append(f"CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} {columns}")
+        elif 'AUTO_INCREMENT' in upper:
+            # Only the rowid can auto-increment in SQLite; a declared composite key becomes UNIQUE
+            auto_column = part.split()[0]
+            definitions.append(f"{auto_column} INTEGER PRIMARY KEY AUTOINCREMENT")
+        else:
+            definitions.append(re.sub(r'\s+ON UPDATE CURRENT_TIMESTAMP', '', part, flags=re.I))
+
+    if primary_key and primary_key.strip('() ') != auto_column:
+        definitions.append(('UNIQUE ' if auto_column else 'PRIMARY KEY ') + primary_key)
+
+    # Table options such as PARTITION BY are dropped
+    return [f"CREATE TABLE {if_not_exists}{table} ({', '.join(definitions)})"] + indexes
+
+
+@lru_cache(maxsize=4096)
+def translate(sql):
+    """SQLite statements equivalent to one MySQL statement"""
+    sql = sql.strip().rstrip(';').strip()
+    if re.match(r'CREATE TABLE', sql, re.I):
+        return _translate_create(sql)
+    if 'information_schema.tables' in sql:
+        return ["SELECT name FROM sqlite_master WHERE type = 'table'"]
+    if 'information_schema.statistics' in sql:
+        # Tables with a unique index on timestamp, the only key looked up this way
+        return ["SELECT DISTINCT m.name FROM sqlite_master m JOIN pragma_index_list(m.name) il "
+                "JOIN pragma_index_info(il.name) ii WHERE m.type = 'table' AND il.\"unique\" = 1 AND ii.name = 'timestamp'"]
+    match = re.match(r'ALTER TABLE\s+(\w+)\s+ADD\s+UNIQUE\s+(?:KEY|INDEX)\s+(\w+)\s*(\(.*\))', sql, re.S | re.I)
+    if match:
+        table, name, columns = match.groups()
+        return [f"CREATE UNIQUE INDEX {table}_{name} ON {table} {columns}"]
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\bINSERT IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.I)
+    sql = re.sub(r'\bON DUPLICATE KEY UPDATE\b', 'ON CONFLICT DO UPDATE SET', sql, flags=re.I)
+    # SQLite does not accept parenthesized compound members
+    sql = re.sub(r'(^|\bUNION ALL)\s*\(\s*SELECT\b', r'\1 SELECT * FROM (SELECT', sql, flags=re.I)
+    return [sql]
+
+
+def _error(e):
+    message = str(e)
+    if 'no such table' in message:
+        return mysql.connector.errors.ProgrammingError(msg=message, errno=1146)
+    if isinstance(e, sqlite3.IntegrityError):
+        return mysql.connector.errors.IntegrityError(msg=message, errno=1062)
+    return mysql.connector.errors.DatabaseError(msg=message)
+
+
+def _convert(value):
+    """TIMESTAMP/DATETIME text back to datetime, as mysql.connector returns it"""
+    if isinstance(value, str) and DATETIME_TEXT.match(value):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+class ShimCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        statements = translate(sql)
+        try:
+            for statement in statements[:-1]:
+                self._cursor.execute(statement)
+            self._cursor.execute(statements[-1], tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def executemany(self, sql, rows):
+        try:
+            self._cursor.executemany(translate(sql)[-1], [tuple(row) for row in rows])
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else tuple(_convert(v) for v in row)
+
+    def fetchall(self):
+        return [tuple(_convert(v) for v in row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [tuple(_convert(v) for v in row) for row in rows]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class ShimConnection:
+    """MySQL-style connection over a SQLite database file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+    def cursor(self):
+        return ShimCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+
+def connect(path):
+    return ShimConnection(path)
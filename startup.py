@@ -0,0 +1,124 @@
+"""Cold-start bookkeeping for app.py: phase timings, background warm-up and readiness.
+
+app.py imports only Flask and the light modules at load, so a new instance
+answers /api/health (liveness) almost immediately. The first request starts a
+warm-up thread that imports the heavy modules, loads the model and builds the
+screener snapshot; /api/ready (readiness) answers 503 until it has finished.
+Every phase is timed from process start and exported through /api/metrics.
+
+STARTUP_MODE=eager runs the warm-up at import instead, e.g. for gunicorn
+--preload, where the master warms once and forked workers share its pages.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# background: warm up after the first request; eager: warm up while app.py is imported
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'background')
+
+# Seconds before failed warm-up steps (e.g. database not reachable yet) are retried
+WARMUP_RETRY_INTERVAL = float(os.environ.get('WARMUP_RETRY_INTERVAL', 10))
+
+
+def _process_age():
+    """Seconds since the process started (since this import where /proc is unavailable)"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class Startup:
+    def __init__(self):
+        # perf_counter value at process start
+        self.origin = time.perf_counter() - _process_age()
+        # phase -> seconds it took; 'import' and 'ready' are seconds since process start
+        self.phases = {}
+        self.errors = {}
+        self._steps = []
+        self._thread = None
+        self._finished = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """Record the time since process start under name"""
+        self.phases[name] = time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def add_step(self, name, fn):
+        """Register a warm-up step; steps run in the order added"""
+        self._steps.append((name, fn))
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def run(self):
+        """Run the steps that have not succeeded yet in this thread"""
+        failed = False
+        for name, fn in self._steps:
+            if name in self.phases and name not in self.errors:
+                continue
+            try:
+                with self.phase(name):
+                    fn()
+                self.errors.pop(name, None)
+            except Exception as e:
+                failed = True
+                self.errors[name] = str(e)
+                print(f"Warm-up step {name} failed: {e}")
+        self._finished = time.monotonic()
+        if not failed:
+            self.mark('ready')
+            self._ready.set()
+
+    def warm(self, wait=None):
+        """Start the warm-up thread unless it is running or done; wait up to `wait` seconds for readiness.
+
+        Failed steps are retried by a call at least WARMUP_RETRY_INTERVAL seconds after the failure.
+        """
+        if not self._ready.is_set():
+            with self._lock:
+                idle = self._thread is None or (
+                    not self._thread.is_alive() and time.monotonic() - self._finished >= WARMUP_RETRY_INTERVAL
+                )
+                if idle:
+                    self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+                    self._thread.start()
+            if wait:
+                self._thread.join(wait)
+        return self.ready
+
+    def status(self):
+        running = self._thread is not None and self._thread.is_alive()
+        state = 'ready' if self.ready else ('failed' if self.errors and not running else 'warming')
+        return {
+            'status': state,
+            'mode': STARTUP_MODE,
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'errors': dict(self.errors)
+        }
+
+    def collect(self):
+        """Metrics collector for /api/metrics"""
+        return [
+            ('startup_phase_seconds', 'gauge', 'Cold-start phase durations (import and ready: since process start)',
+             [({'phase': name}, seconds) for name, seconds in self.phases.items()]),
+            ('ready', 'gauge', 'Whether warm-up has finished', [({}, int(self.ready))])
+        ]
+
+
+startup = Startup()
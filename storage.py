@@ -0,0 +1,570 @@
+"""Storage layouts for daily bars and technical indicators.
+
+per_ticker: the original {ticker}_data / {ticker}_MA table pair of every ticker.
+long: one bars table and one indicators table keyed by (ticker_id, timestamp),
+so a single indexed query answers for many tickers.
+local: the memory-mapped columnar files of local_store.py, for offline runs.
+
+STORAGE_LAYOUT selects the layout for fetch.py, indicators.py, ml_model.py and
+app.py; migrate_storage.py copies the per-ticker tables into the long layout.
+With LOCAL_STORE_DIR set, full-history reads of the MySQL layouts go through
+the local store as a read-through cache.
+"""
+import os
+import mysql.connector
+import numpy as np
+import pandas as pd
+from db import existing_tables
+
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'per_ticker')  # per_ticker, long or local
+STORAGE_PARTITIONS = int(os.environ.get('STORAGE_PARTITIONS', 0))  # Hash partitions of the long tables (0 = none)
+LOCAL_STORE_DIR = os.environ.get('LOCAL_STORE_DIR')  # Local columnar store; a read-through cache unless STORAGE_LAYOUT=local
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'vwap', 'timestamp', 'transactions', 'otc']
+
+MA_COLUMNS = [
+    'timestamp', 'close', 'MA_5DAY', 'MA_20DAY', 'MA_50DAY', 'MA_200DAY',
+    'EMA_12DAY', 'EMA_26DAY', 'MACD', 'SIGNAL_LINE', 'RSI',
+    'Fib_0', 'Fib_236', 'Fib_382', 'Fib_500', 'Fib_618', 'Fib_100'
+]
+
+# Columns of a bulk export (iter_rows) by kind
+EXPORT_COLUMNS = {
+    'bars': ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'transactions'],
+    'indicators': MA_COLUMNS + ['volume']
+}
+
+# Rows fetched per round trip when streaming an export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+
+# Rows per multi-row INSERT statement, kept well under max_allowed_packet
+INSERT_BATCH_SIZE = 1000
+
+# Tickers per multi-ticker read
+READ_BATCH_SIZE = 200
+
+# MySQL error raised when a per-ticker table does not exist yet
+NO_SUCH_TABLE = 1146
+
+
+def ensure_rebuild_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history_rebuilds (
+            ticker VARCHAR(16) NOT NULL,
+            dataset VARCHAR(16) NOT NULL,
+            generation BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (ticker, dataset)
+        )
+    """)
+
+
+def record_rebuild(cursor, dataset, ticker):
+    """Bump the rebuild generation of a ticker's bars or indicators, so local copies are discarded and pulled again"""
+    _execute_if_exists(cursor, """
+        INSERT INTO history_rebuilds (ticker, dataset, generation) VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE generation = generation + 1
+    """, (ticker, dataset))
+
+
+def rebuild_generations(cursor, tickers):
+    """{(ticker, dataset): generation} of the given tickers' rebuilt histories"""
+    generations = {}
+    for i in range(0, len(tickers), READ_BATCH_SIZE):
+        batch = list(tickers[i:i + READ_BATCH_SIZE])
+        sql = f"SELECT ticker, dataset, generation FROM history_rebuilds WHERE ticker IN ({', '.join(['%s'] * len(batch))})"
+        if not _execute_if_exists(cursor, sql, batch):
+            break
+        generations.update({(ticker, dataset): generation for ticker, dataset, generation in cursor.fetchall()})
+    return generations
+
+
+def _column(name):
+    """Qualified column of a joined read: indicators as m, bars as d"""
+    return f"m.{name}" if name in MA_COLUMNS else f"d.{name}"
+
+
+def _insert_rows(cursor, table, columns, rows, prefix=None):
+    """Insert rows with multi-row INSERT statements; prefix holds leading values shared by every row"""
+    prefix = list(prefix or [])
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[i:i + INSERT_BATCH_SIZE]
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([row_placeholder] * len(batch)),
+            [value for row in batch for value in prefix + list(row)]
+        )
+
+
+def _execute_if_exists(cursor, sql, params=()):
+    """Execute sql, returning False instead of raising when a per-ticker table does not exist yet"""
+    try:
+        cursor.execute(sql, params)
+    except mysql.connector.Error as e:
+        if e.errno == NO_SUCH_TABLE:
+            return False
+        raise
+    return True
+
+
+def _range_filter(column, start, end, where=None):
+    """WHERE clause and params for start <= column < end (either may be None)"""
+    conditions, params = [where] if where else [], []
+    if start is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} < %s")
+        params.append(end)
+    return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def _fetch_chunks(cursor, chunk_size):
+    """Rows of the executed statement in lists of up to chunk_size, fetched as they are consumed"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _frames_to_arrays(histories, columns):
+    return {
+        ticker: {c: df[c].to_numpy(dtype='datetime64[s]' if c == 'timestamp' else np.float64) for c in columns}
+        for ticker, df in histories.items()
+    }
+
+
+def _group_histories(df):
+    """Split a multi-ticker read into per-ticker frames, oldest first"""
+    histories = {}
+    for ticker, group in df.groupby('ticker', sort=False):
+        histories[ticker] = group.sort_values('timestamp').reset_index(drop=True)
+    return histories
+
+
+class PerTickerStorage:
+    """{ticker}_data and {ticker}_MA tables, one pair per ticker"""
+
+    layout = 'per_ticker'
+    state_table = 'indicator_state'
+
+    def ensure_schema(self, cursor):
+        """Add the timestamp key to {ticker}_data tables created before it was declared"""
+        ensure_rebuild_table(cursor)
+        for ticker in self.unkeyed_bar_tables(cursor):
+            removed = self.add_bar_key(cursor, ticker)
+            print(f"Added the timestamp key to {ticker}_data" + (f", removed {removed} duplicate bars" if removed else ''))
+
+    def unkeyed_bar_tables(self, cursor):
+        """Tickers whose {ticker}_data table lacks the uniq_timestamp key"""
+        tables = {t[:-len('_data')] for t in existing_tables(cursor) if t.endswith('_data')}
+        cursor.execute("""
+            SELECT DISTINCT table_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND index_name = 'uniq_timestamp'
+        """)
+        keyed = {row[0].lower()[:-len('_data')] for row in cursor.fetchall()}
+        return sorted(tables - keyed)
+
+    def add_bar_key(self, cursor, ticker):
+        """Drop duplicate bars (keeping the first copy of each timestamp) and add the unique key; returns rows removed"""
+        cursor.execute(f"""
+            DELETE FROM {ticker}_data WHERE timestamp IS NOT NULL AND id NOT IN (
+                SELECT id FROM (SELECT MIN(id) AS id FROM {ticker}_data WHERE timestamp IS NOT NULL GROUP BY timestamp) first_bars
+            )
+        """)
+        removed = cursor.rowcount
+        if removed:
+            record_rebuild(cursor, 'bars', ticker)
+            # The indicators were computed with the duplicates; without a state the next run rebuilds them
+            _execute_if_exists(cursor, f"DELETE FROM {self.state_table} WHERE ticker = %s", (ticker,))
+        # In MySQL the ALTER also commits the deletes
+        cursor.execute(f"ALTER TABLE {ticker}_data ADD UNIQUE KEY uniq_timestamp (timestamp)")
+        return removed
+
+    def filter_tickers(self, cursor, tickers):
+        """Tickers that have both bars and indicators stored, in the given order"""
+        tables = existing_tables(cursor)
+        return [t for t in tickers if f"{t}_ma" in tables and f"{t}_data" in tables]
+
+    def ensure_bars(self, cursor, ticker):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ticker}_data (id INT AUTO_INCREMENT PRIMARY KEY, open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE, volume BIGINT, vwap DOUBLE, timestamp TIMESTAMP, transactions INT, otc TINYINT NULL, UNIQUE KEY uniq_timestamp (timestamp));
+        """)
+
+    def last_bar_timestamp(self, cursor, ticker):
+        cursor.execute(f"SELECT MAX(timestamp) FROM {ticker}_data")
+        return cursor.fetchone()[0]
+
+    def bar_timestamps(self, cursor, ticker, since):
+        cursor.execute(f"SELECT timestamp FROM {ticker}_data WHERE timestamp >= %s", (since,))
+        return {row[0] for row in cursor.fetchall()}
+
+    def insert_bars(self, cursor, ticker, rows):
+        """Insert bars given as BAR_COLUMNS tuples"""
+        cursor.executemany(f"""
+            INSERT INTO {ticker}_data ({', '.join(BAR_COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(BAR_COLUMNS))})
+        """, rows)
+
+    def read_bars(self, mydb, ticker):
+        """Every bar of a ticker in insertion order, with its id"""
+        return pd.read_sql(f"SELECT * FROM {ticker}_data ORDER BY id", mydb)
+
+    def read_new_bars(self, cursor, ticker, after_id, columns=('id', 'timestamp', 'close')):
+        """Rows of the given columns for the bars inserted after after_id"""
+        sql = f"SELECT {', '.join(columns)} FROM {ticker}_data WHERE id > %s ORDER BY id"
+        return cursor.fetchall() if _execute_if_exists(cursor, sql, (after_id,)) else []
+
+    def read_new_indicators(self, cursor, ticker, since=None):
+        """MA_COLUMNS rows plus the bar's volume for timestamps after since, oldest first"""
+        where = "WHERE m.timestamp > %s" if since is not None else ""
+        sql = f"""
+            SELECT {', '.join(f"m.{c}" for c in MA_COLUMNS)}, d.volume FROM {ticker}_MA m
+            LEFT JOIN {ticker}_data d ON d.timestamp = m.timestamp
+            {where} ORDER BY m.timestamp
+        """
+        return cursor.fetchall() if _execute_if_exists(cursor, sql, (since,) if since is not None else ()) else []
+
+    def iter_rows(self, cursor, ticker, kind, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """EXPORT_COLUMNS[kind] rows with start <= timestamp < end, oldest first, in chunks.
+
+        The cursor is unbuffered, so rows stream from the server as chunks are consumed;
+        consume every chunk before reusing the connection.
+        """
+        if kind == 'bars':
+            source, column = f"SELECT {', '.join(EXPORT_COLUMNS['bars'])} FROM {ticker}_data", 'timestamp'
+        else:
+            source = f"""
+                SELECT {', '.join(f"m.{c}" for c in MA_COLUMNS)}, d.volume FROM {ticker}_MA m
+                LEFT JOIN {ticker}_data d ON d.timestamp = m.timestamp
+            """
+            column = 'm.timestamp'
+        where, params = _range_filter(column, start, end)
+        if _execute_if_exists(cursor, f"{source} {where} ORDER BY {column}", params):
+            yield from _fetch_chunks(cursor, chunk_size)
+
+    def replace_indicators(self, cursor, ticker, rows):
+        """Recreate {ticker}_MA holding rows given as MA_COLUMNS tuples"""
+        cursor.execute(f"DROP TABLE IF EXISTS {ticker}_MA")
+        cursor.execute(f"""
+            CREATE TABLE {ticker}_MA (
+                id INT PRIMARY KEY AUTO_INCREMENT,
+                timestamp TIMESTAMP,
+                close DOUBLE,
+                MA_5DAY DOUBLE,
+                MA_20DAY DOUBLE,
+                MA_50DAY DOUBLE,
+                MA_200DAY DOUBLE,
+                EMA_12DAY DOUBLE,
+                EMA_26DAY DOUBLE,
+                MACD DOUBLE,
+                SIGNAL_LINE DOUBLE,
+                RSI DOUBLE,
+                Fib_0 DOUBLE,
+                Fib_236 DOUBLE,
+                Fib_382 DOUBLE,
+                Fib_500 DOUBLE,
+                Fib_618 DOUBLE,
+                Fib_100 DOUBLE,
+                INDEX idx_timestamp (timestamp)
+            )
+        """)
+        self.append_indicators(cursor, ticker, rows)
+        record_rebuild(cursor, 'indicators', ticker)
+
+    def append_indicators(self, cursor, ticker, rows):
+        if rows:
+            _insert_rows(cursor, f"{ticker}_MA", MA_COLUMNS, rows)
+
+    def read_indicators(self, mydb, tickers, limit=None):
+        """Latest indicator rows (joined with volume) of many tickers, oldest first, keyed by ticker"""
+        cursor = mydb.cursor()
+        tickers = self.filter_tickers(cursor, tickers)
+        cursor.close()
+        limit_sql = f"LIMIT {int(limit)}" if limit else ""
+
+        histories = {}
+        for i in range(0, len(tickers), READ_BATCH_SIZE):
+            query = ' UNION ALL '.join(
+                f"""(SELECT '{t}' AS ticker, m.*, d.volume FROM {t}_MA m
+                    LEFT JOIN {t}_data d ON d.timestamp = m.timestamp
+                    ORDER BY m.timestamp DESC {limit_sql})"""
+                for t in tickers[i:i + READ_BATCH_SIZE]
+            )
+            histories.update(_group_histories(pd.read_sql(query, mydb)))
+        return histories
+
+    def read_arrays(self, mydb, tickers, columns, limit=None):
+        """ticker -> {column: 1-D array} of the latest indicator rows, oldest first"""
+        return _frames_to_arrays(self.read_indicators(mydb, tickers, limit), columns)
+
+    def sync(self, mydb, tickers, force=False, full=False):
+        pass
+
+    def latest_rows(self, cursor, tickers, columns):
+        """(ticker, *columns) of the latest indicator row of every ticker; bar-only columns come from the matching bar"""
+        tickers = self.filter_tickers(cursor, tickers)
+        select = ', '.join(_column(c) for c in columns)
+        rows = []
+        for i in range(0, len(tickers), READ_BATCH_SIZE):
+            cursor.execute(' UNION ALL '.join(
+                f"""(SELECT '{t}' AS ticker, {select}
+                     FROM {t}_MA m LEFT JOIN {t}_data d ON d.timestamp = m.timestamp
+                     ORDER BY m.timestamp DESC LIMIT 1)"""
+                for t in tickers[i:i + READ_BATCH_SIZE]
+            ))
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def recent_bars(self, cursor, ticker, count):
+        """(timestamp, close, volume) of the latest bars, newest first"""
+        sql = f"SELECT timestamp, close, volume FROM {ticker}_data ORDER BY timestamp DESC LIMIT {int(count)}"
+        return cursor.fetchall() if _execute_if_exists(cursor, sql) else []
+
+    def indicator_row(self, cursor, ticker, timestamp, columns):
+        sql = f"SELECT {', '.join(columns)} FROM {ticker}_MA WHERE timestamp = %s LIMIT 1"
+        return cursor.fetchone() if _execute_if_exists(cursor, sql, (timestamp,)) else None
+
+
+class LongStorage:
+    """Narrow bars and indicators tables shared by every ticker, keyed by (ticker_id, timestamp)"""
+
+    layout = 'long'
+    state_table = 'bar_indicator_state'
+
+    def __init__(self, partitions=STORAGE_PARTITIONS):
+        self.partitions = partitions
+        self._ids = {}
+
+    def ensure_schema(self, cursor, partitions=None):
+        """Create the tickers, bars, indicators and history_rebuilds tables; partitioning only applies when a table is created"""
+        partitions = self.partitions if partitions is None else partitions
+        partition_sql = f"PARTITION BY KEY (ticker_id) PARTITIONS {int(partitions)}" if partitions else ""
+        indicator_columns = ',\n'.join(f"{c} DOUBLE" for c in MA_COLUMNS[1:])
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tickers (
+                ticker_id INT AUTO_INCREMENT PRIMARY KEY,
+                ticker VARCHAR(16) NOT NULL,
+                UNIQUE KEY uniq_ticker (ticker)
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS bars (
+                id BIGINT NOT NULL AUTO_INCREMENT,
+                ticker_id INT NOT NULL,
+                timestamp DATETIME NOT NULL,
+                open DOUBLE,
+                high DOUBLE,
+                low DOUBLE,
+                close DOUBLE,
+                volume BIGINT,
+                vwap DOUBLE,
+                transactions INT,
+                otc TINYINT NULL,
+                PRIMARY KEY (ticker_id, timestamp),
+                KEY idx_id (id),
+                KEY idx_timestamp (timestamp)
+            ) {partition_sql}
+        """)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS indicators (
+                ticker_id INT NOT NULL,
+                timestamp DATETIME NOT NULL,
+                {indicator_columns},
+                PRIMARY KEY (ticker_id, timestamp),
+                KEY idx_timestamp (timestamp)
+            ) {partition_sql}
+        """)
+        ensure_rebuild_table(cursor)
+
+    def ticker_ids(self, cursor, tickers, create=False):
+        """ticker -> ticker_id for the given tickers, registering unknown ones when create is set"""
+        missing = [t for t in tickers if t not in self._ids]
+        if missing and create:
+            cursor.executemany('INSERT IGNORE INTO tickers (ticker) VALUES (%s)', [(t,) for t in missing])
+        for i in range(0, len(missing), READ_BATCH_SIZE):
+            batch = missing[i:i + READ_BATCH_SIZE]
+            cursor.execute(
+                f"SELECT ticker, ticker_id FROM tickers WHERE ticker IN ({', '.join(['%s'] * len(batch))})", batch
+            )
+            self._ids.update({ticker.lower(): ticker_id for ticker, ticker_id in cursor.fetchall()})
+        return {t: self._ids[t] for t in tickers if t in self._ids}
+
+    def ticker_id(self, cursor, ticker, create=False):
+        return self.ticker_ids(cursor, [ticker], create).get(ticker)
+
+    def filter_tickers(self, cursor, tickers):
+        ids = self.ticker_ids(cursor, tickers)
+        return [t for t in tickers if t in ids]
+
+    def ensure_bars(self, cursor, ticker):
+        self.ticker_id(cursor, ticker, create=True)
+
+    def last_bar_timestamp(self, cursor, ticker):
+        cursor.execute("SELECT MAX(timestamp) FROM bars WHERE ticker_id = %s", (self.ticker_id(cursor, ticker),))
+        return cursor.fetchone()[0]
+
+    def bar_timestamps(self, cursor, ticker, since):
+        cursor.execute(
+            "SELECT timestamp FROM bars WHERE ticker_id = %s AND timestamp >= %s", (self.ticker_id(cursor, ticker), since)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def insert_bars(self, cursor, ticker, rows):
+        _insert_rows(cursor, 'bars', ['ticker_id'] + BAR_COLUMNS, rows, prefix=[self.ticker_id(cursor, ticker, create=True)])
+
+    def read_bars(self, mydb, ticker):
+        cursor = mydb.cursor()
+        ticker_id = self.ticker_id(cursor, ticker)
+        cursor.close()
+        return pd.read_sql(
+            f"SELECT id, {', '.join(BAR_COLUMNS)} FROM bars WHERE ticker_id = %s ORDER BY id", mydb, params=(ticker_id,)
+        )
+
+    def read_new_bars(self, cursor, ticker, after_id, columns=('id', 'timestamp', 'close')):
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM bars WHERE ticker_id = %s AND id > %s ORDER BY id",
+            (self.ticker_id(cursor, ticker), after_id)
+        )
+        return cursor.fetchall()
+
+    def read_new_indicators(self, cursor, ticker, since=None):
+        params = [self.ticker_id(cursor, ticker)]
+        where = "WHERE m.ticker_id = %s"
+        if since is not None:
+            where += " AND m.timestamp > %s"
+            params.append(since)
+        cursor.execute(f"""
+            SELECT {', '.join(f"m.{c}" for c in MA_COLUMNS)}, d.volume FROM indicators m
+            LEFT JOIN bars d ON d.ticker_id = m.ticker_id AND d.timestamp = m.timestamp
+            {where} ORDER BY m.timestamp
+        """, params)
+        return cursor.fetchall()
+
+    def iter_rows(self, cursor, ticker, kind, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        ticker_id = self.ticker_id(cursor, ticker)
+        if ticker_id is None:
+            return
+        if kind == 'bars':
+            source, column = f"SELECT {', '.join(EXPORT_COLUMNS['bars'])} FROM bars", 'timestamp'
+            where, params = _range_filter(column, start, end, 'ticker_id = %s')
+        else:
+            source = f"""
+                SELECT {', '.join(f"m.{c}" for c in MA_COLUMNS)}, d.volume FROM indicators m
+                LEFT JOIN bars d ON d.ticker_id = m.ticker_id AND d.timestamp = m.timestamp
+            """
+            column = 'm.timestamp'
+            where, params = _range_filter(column, start, end, 'm.ticker_id = %s')
+        # Primary key range scan
+        cursor.execute(f"{source} {where} ORDER BY {column}", [ticker_id] + params)
+        yield from _fetch_chunks(cursor, chunk_size)
+
+    def replace_indicators(self, cursor, ticker, rows):
+        cursor.execute("DELETE FROM indicators WHERE ticker_id = %s", (self.ticker_id(cursor, ticker),))
+        self.append_indicators(cursor, ticker, rows)
+        record_rebuild(cursor, 'indicators', ticker)
+
+    def append_indicators(self, cursor, ticker, rows):
+        if rows:
+            _insert_rows(cursor, 'indicators', ['ticker_id'] + MA_COLUMNS, rows, prefix=[self.ticker_id(cursor, ticker)])
+
+    def read_indicators(self, mydb, tickers, limit=None):
+        cursor = mydb.cursor()
+        ids = self.ticker_ids(cursor, tickers)
+        cursor.close()
+        ordered = [ids[t] for t in tickers if t in ids]
+        columns = ', '.join(['t.ticker'] + [f"m.{c}" for c in MA_COLUMNS] + ['d.volume'])
+        joins = """
+            FROM indicators m
+            JOIN tickers t ON t.ticker_id = m.ticker_id
+            LEFT JOIN bars d ON d.ticker_id = m.ticker_id AND d.timestamp = m.timestamp
+        """
+
+        histories = {}
+        for i in range(0, len(ordered), READ_BATCH_SIZE):
+            batch = ordered[i:i + READ_BATCH_SIZE]
+            if len(batch) == 1 and limit:
+                # Backward scan of the primary key, no sort
+                query = f"SELECT {columns} {joins} WHERE m.ticker_id = %s ORDER BY m.timestamp DESC LIMIT {int(limit)}"
+            elif limit:
+                query = f"""
+                    SELECT * FROM (
+                        SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY m.ticker_id ORDER BY m.timestamp DESC) AS row_num
+                        {joins} WHERE m.ticker_id IN ({', '.join(['%s'] * len(batch))})
+                    ) latest WHERE row_num <= {int(limit)}
+                """
+            else:
+                query = f"SELECT {columns} {joins} WHERE m.ticker_id IN ({', '.join(['%s'] * len(batch))})"
+            df = pd.read_sql(query, mydb, params=batch)
+            histories.update(_group_histories(df.drop(columns=['row_num'], errors='ignore')))
+        return histories
+
+    def read_arrays(self, mydb, tickers, columns, limit=None):
+        return _frames_to_arrays(self.read_indicators(mydb, tickers, limit), columns)
+
+    def sync(self, mydb, tickers, force=False, full=False):
+        pass
+
+    def latest_rows(self, cursor, tickers, columns):
+        ids = self.ticker_ids(cursor, tickers)
+        ordered = [ids[t] for t in tickers if t in ids]
+        select = ', '.join(_column(c) for c in columns)
+        rows = []
+        for i in range(0, len(ordered), READ_BATCH_SIZE):
+            batch = ordered[i:i + READ_BATCH_SIZE]
+            cursor.execute(f"""
+                SELECT t.ticker, {select}
+                FROM (SELECT ticker_id, MAX(timestamp) AS timestamp FROM indicators
+                      WHERE ticker_id IN ({', '.join(['%s'] * len(batch))}) GROUP BY ticker_id) latest
+                JOIN indicators m ON m.ticker_id = latest.ticker_id AND m.timestamp = latest.timestamp
+                JOIN tickers t ON t.ticker_id = latest.ticker_id
+                LEFT JOIN bars d ON d.ticker_id = latest.ticker_id AND d.timestamp = latest.timestamp
+            """, batch)
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def recent_bars(self, cursor, ticker, count):
+        ticker_id = self.ticker_id(cursor, ticker)
+        if ticker_id is None:
+            return []
+        cursor.execute(
+            f"SELECT timestamp, close, volume FROM bars WHERE ticker_id = %s ORDER BY timestamp DESC LIMIT {int(count)}",
+            (ticker_id,)
+        )
+        return cursor.fetchall()
+
+    def indicator_row(self, cursor, ticker, timestamp, columns):
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM indicators WHERE ticker_id = %s AND timestamp = %s",
+            (self.ticker_id(cursor, ticker), timestamp)
+        )
+        return cursor.fetchone()
+
+
+LAYOUTS = {'per_ticker': PerTickerStorage, 'long': LongStorage}
+
+_storages = {}
+
+
+def get_storage(layout=None, local_store_dir=LOCAL_STORE_DIR):
+    """Shared storage instance for a layout (default STORAGE_LAYOUT), cached locally when local_store_dir is set"""
+    layout = layout or STORAGE_LAYOUT
+    key = (layout, local_store_dir)
+    if key in _storages:
+        return _storages[key]
+
+    if layout == 'local':
+        from local_store import LocalStorage, LocalStore
+        storage = LocalStorage(LocalStore(local_store_dir))
+    elif layout in LAYOUTS:
+        storage = LAYOUTS[layout]()
+        if local_store_dir:
+            from local_store import CachedStorage, LocalStore
+            storage = CachedStorage(storage, LocalStore(local_store_dir))
+    else:
+        raise ValueError(f"Unknown STORAGE_LAYOUT {layout!r}, expected one of {', '.join(list(LAYOUTS) + ['local'])}")
+
+    _storages[key] = storage
+    return storage
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """db.connect() opens a fresh SQLite stand-in for MySQL; yields a connection to it"""
+    import db
+    monkeypatch.setattr(db, 'DB_SQLITE_PATH', str(tmp_path / 'stocks.sqlite'))
+    mydb = db.connect()
+    yield mydb
+    mydb.close()
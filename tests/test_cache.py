@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask, jsonify
+import db
+from cache import DataVersion, ResponseCache, cached_response
+
+
+@pytest.fixture
+def client(sqlite_db, monkeypatch):
+    monkeypatch.setattr(db, '_pool', None)
+    app = Flask(__name__)
+    cache = ResponseCache()
+    calls = []
+
+    @app.route('/items')
+    @cached_response(cache, DataVersion(check_interval=0), db.get_connection)
+    def items():
+        calls.append(1)
+        return jsonify({'calls': len(calls)})
+
+    @app.route('/missing')
+    @cached_response(cache, DataVersion(check_interval=0), db.get_connection)
+    def missing():
+        calls.append(1)
+        return jsonify({'error': 'not found'}), 404
+
+    app.calls = calls
+    app.cache = cache
+    return app.test_client()
+
+
+def test_repeated_request_is_served_from_cache(client):
+    first = client.get('/items')
+    second = client.get('/items')
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == second.get_json() == {'calls': 1}
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert client.application.cache.stats()['hits'] == 1
+
+
+def test_matching_etag_gets_304(client):
+    etag = client.get('/items').headers['ETag']
+    response = client.get('/items', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert client.get('/items', headers={'If-None-Match': '"stale"'}).status_code == 200
+    assert client.application.cache.stats()['not_modified'] == 1
+
+
+def test_new_data_version_invalidates(client, sqlite_db):
+    etag = client.get('/items').headers['ETag']
+    db.bump_data_version(sqlite_db)
+    response = client.get('/items', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json() == {'calls': 2}
+    assert response.headers['ETag'] != etag
+
+
+def test_errors_are_not_cached(client):
+    assert client.get('/missing').status_code == 404
+    assert client.get('/missing').status_code == 404
+    assert len(client.application.calls) == 2
@@ -0,0 +1,61 @@
+import datetime
+import db
+from changes import ChangeFeed, Subscription, changed_tickers, ensure_tables
+
+
+def drain(subscription):
+    events = []
+    while (text := subscription.get(0)) is not None:
+        events.append(text)
+    return events
+
+
+def test_replay_then_live_events_are_sent_once_in_order():
+    subscription = Subscription(['aapl'], market=True)
+    subscription.hold()
+    # The poller publishes while the missed changes are still being read
+    subscription.put('bars 7', 7)
+    subscription.put('market', None)
+    subscription.put('bars 9', 9)
+    subscription.release([(5, 'bars 5'), (7, 'bars 7'), (None, 'market')])
+    assert drain(subscription) == ['bars 5', 'bars 7', 'market', 'market', 'bars 9']
+
+    subscription.put('bars 9', 9)
+    subscription.put('bars 10', 10)
+    assert drain(subscription) == ['bars 10']
+
+
+def add_change(mydb, change_id, ticker, age=0):
+    created_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(seconds=age)
+    cursor = mydb.cursor()
+    cursor.execute("INSERT INTO change_feed (id, kind, ticker, since, created_at) VALUES (%s, 'bars', %s, NULL, %s)",
+                   (change_id, ticker, created_at.replace(microsecond=0)))
+    mydb.commit()
+    cursor.close()
+
+
+def test_readers_wait_for_lower_ids_committed_late(sqlite_db, monkeypatch):
+    monkeypatch.setattr(db, '_pool', None)
+    cursor = sqlite_db.cursor()
+    ensure_tables(cursor)
+    feed = ChangeFeed(db.get_connection)
+    feed.last_id = 0
+    for change_id, ticker in [(1, 'a'), (2, 'b'), (4, 'd')]:
+        add_change(sqlite_db, change_id, ticker)
+
+    # 3 is still in an open transaction
+    feed.poll()
+    assert feed.last_id == 2
+    assert changed_tickers(cursor, 'bars', 0) == (2, {'a', 'b'})
+
+    add_change(sqlite_db, 3, 'c')
+    feed.poll()
+    assert feed.last_id == 4
+    assert changed_tickers(cursor, 'bars', 2) == (4, {'c', 'd'})
+
+    # 5 never shows up; once 6 is old enough it counts as rolled back
+    add_change(sqlite_db, 6, 'f', age=60)
+    feed.poll()
+    assert feed.last_id == 6
+    assert changed_tickers(cursor, 'bars', 4) == (6, {'f'})
+    cursor.close()
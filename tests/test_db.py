@@ -0,0 +1,97 @@
+import gc
+import os
+import socket
+import pytest
+import db
+
+
+def test_connections_are_reused(sqlite_db):
+    pool = db.ConnectionPool(size=2)
+    first = pool.get_connection()
+    raw = first._conn
+    first.close()
+    with pool.get_connection() as second:
+        assert second._conn is raw
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['in_use'] == 0
+
+
+def test_old_connections_are_recycled(sqlite_db):
+    pool = db.ConnectionPool(size=1, recycle=0)
+    pool.get_connection().close()
+    with pool.get_connection():
+        pass
+    stats = pool.stats()
+    assert stats['recycled'] == 1
+    assert stats['created'] == 2
+
+
+def test_checkout_times_out_when_exhausted(sqlite_db):
+    pool = db.ConnectionPool(size=1, timeout=0.05)
+    held = pool.get_connection()
+    with pytest.raises(db.PoolTimeout):
+        pool.get_connection()
+    held.close()
+    assert pool.stats()['timeouts'] == 1
+    pool.get_connection().close()
+
+
+class SocketConnection:
+    """Stand-in for mysql.connector's pure-Python connection: its socket is shut down when collected"""
+
+    class Socket:
+        def __init__(self, sock):
+            self.sock = sock
+
+        def __del__(self):
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __init__(self, config=None):
+        self._socket_pair = socket.socketpair()
+        self._socket = self.Socket(self._socket_pair[0])
+
+    def works(self):
+        try:
+            self._socket.sock.sendall(b'x')
+            return self._socket_pair[1].recv(1) == b'x'
+        except OSError:
+            return False
+
+    def is_connected(self):
+        return True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self._socket.sock.close()
+
+
+def test_child_never_shuts_down_inherited_connections(monkeypatch):
+    monkeypatch.setattr(db, 'connect', SocketConnection)
+    monkeypatch.setattr(db, '_pool', None)
+    parent = db.get_pool()
+    in_use, idle = parent.get_connection(), parent.get_connection()
+    idle.close()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # A worker process using the database, then dropping what it inherited
+            child = db.get_connection()
+            child.close()
+            in_use.close()
+            db._pool = None
+            gc.collect()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert in_use.works()
+    in_use.close()
+    with parent.get_connection() as conn, parent.get_connection() as other:
+        assert conn.works() and other.works()
+    assert parent.stats()['created'] == 2
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+from features import check_against_pandas, ewm_mean, rolling_mean, to_matrix
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_engine_matches_pandas(seed):
+    assert check_against_pandas(n_tickers=8, max_days=400, seed=seed) == 8
+
+
+def test_kernels_match_pandas_before_rounding():
+    rng = np.random.default_rng(2)
+    closes = [np.round(20 + np.abs(np.cumsum(rng.normal(0, 1, days))), 2) for days in (30, 250, 600)]
+    closes[1][[0, 40, 41]] = np.nan
+    x = to_matrix(closes)
+    for window in (5, 20, 200):
+        for i, close in enumerate(closes):
+            expected = pd.Series(close).rolling(window).mean().to_numpy()
+            np.testing.assert_allclose(rolling_mean(x, window)[i, :len(close)], expected, rtol=1e-12)
+    for span in (9, 12, 26):
+        for i, close in enumerate(closes):
+            expected = pd.Series(close).ewm(span=span, adjust=True).mean().to_numpy()
+            np.testing.assert_allclose(ewm_mean(x, span)[i, :len(close)], expected, rtol=1e-12)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from forest import CompactForest
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 6)) * [1, 10, 100, 0.01, 5, 1] + [0, 50, -20, 0, 3, 1]
+    y = np.array(['Buy', 'Sell', 'Hold'])[(X[:, 0] + X[:, 1] / 10 + rng.normal(size=len(X)) > 0).astype(int)
+                                          + (X[:, 2] > 0)]
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(scaler.transform(X), y)
+    X_test = rng.normal(size=(500, 6)) * [1, 10, 100, 0.01, 5, 1] + [0, 50, -20, 0, 3, 1]
+    return model, scaler, [f"f{i}" for i in range(6)], X_test
+
+
+@pytest.mark.parametrize('precision', ['float64', 'uint16'])
+def test_matches_scikit_learn(fitted, precision):
+    model, scaler, names, X = fitted
+    forest = CompactForest.compile(model, scaler, names, precision)
+    assert list(forest.classes_) == list(model.classes_)
+    expected = model.predict_proba(scaler.transform(X))
+    np.testing.assert_allclose(forest.predict_proba(X), expected, atol=1e-6)
+    assert (forest.predict(X) == model.predict(scaler.transform(X))).all()
+
+
+def test_float32_thresholds_stay_close(fitted):
+    model, scaler, names, X = fitted
+    forest = CompactForest.compile(model, scaler, names, 'float32')
+    assert (forest.predict(X) == model.predict(scaler.transform(X))).mean() >= 0.99
+
+
+@pytest.mark.parametrize('precision', ['float64', 'float32', 'uint16'])
+def test_save_and_memory_mapped_load(fitted, tmp_path, precision):
+    model, scaler, names, X = fitted
+    forest = CompactForest.compile(model, scaler, names, precision)
+    forest.save(str(tmp_path))
+    loaded = CompactForest.load(str(tmp_path))
+    assert isinstance(loaded.arrays['threshold'], np.memmap)
+    np.testing.assert_array_equal(loaded.predict_proba(X), forest.predict_proba(X))
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+import indicators
+from benchmark import bar_rows, synthetic_universe
+from changes import ensure_tables as ensure_change_tables
+from events import ensure_tables as ensure_event_tables
+from market_summary import ensure_tables as ensure_market_tables
+from storage import get_storage
+
+TICKER = 'syn00000'
+
+
+def read_results(mydb, storage):
+    history = storage.read_indicators(mydb, [TICKER])[TICKER].reset_index(drop=True)
+    cursor = mydb.cursor()
+    cursor.execute('SELECT event_type, timestamp, value FROM indicator_events WHERE ticker = %s '
+                   'ORDER BY timestamp, event_type', (TICKER,))
+    events = cursor.fetchall()
+    cursor.close()
+    return history, events
+
+
+@pytest.mark.parametrize('layout', ['per_ticker', 'long'])
+def test_incremental_updates_equal_full_rebuild(sqlite_db, layout):
+    mydb = sqlite_db
+    storage = get_storage(layout)
+    cursor = mydb.cursor()
+    storage.ensure_schema(cursor)
+    ensure_market_tables(cursor)
+    ensure_event_tables(cursor)
+    ensure_change_tables(cursor)
+    indicators.ensure_state_table(cursor, storage)
+    storage.ensure_bars(cursor, TICKER)
+
+    _, bars = synthetic_universe(1, 400, seed=3)
+    storage.insert_bars(cursor, TICKER, bar_rows(bars, 0, slice(0, 250)))
+    mydb.commit()
+    assert indicators.update_ticker(mydb, cursor, TICKER, storage) == 250
+
+    # Daily runs, a missed week and a long gap
+    for start, stop in [(250, 251), (251, 252), (252, 257), (257, 400)]:
+        storage.insert_bars(cursor, TICKER, bar_rows(bars, 0, slice(start, stop)))
+        mydb.commit()
+        assert indicators.update_ticker(mydb, cursor, TICKER, storage) == stop - start
+    assert indicators.update_ticker(mydb, cursor, TICKER, storage) == 0
+    incremental, incremental_events = read_results(mydb, storage)
+
+    assert indicators.rebuild_ticker(mydb, cursor, TICKER, storage) == 400
+    rebuilt, rebuilt_events = read_results(mydb, storage)
+    cursor.close()
+
+    assert len(incremental) == 400
+    pd.testing.assert_frame_equal(incremental, rebuilt, check_exact=True)
+    assert incremental_events == rebuilt_events
+
+
+def test_state_built_from_history_equals_replayed_state():
+    rng = np.random.default_rng(4)
+    close = np.round(20 + np.abs(np.cumsum(rng.normal(0, 1, 300))), 2)
+    close[[120, 250]] = np.nan
+    (_, state), = indicators.compute_histories([pd.DataFrame({'close': close})])
+
+    replayed = indicators.IndicatorState()
+    for value in close:
+        replayed.update(value)
+    assert state.to_json() == replayed.to_json()
+    assert state.update(21.5) == replayed.update(21.5)
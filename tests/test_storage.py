@@ -0,0 +1,67 @@
+import numpy as np
+import indicators
+from changes import ensure_tables as ensure_change_tables
+from events import ensure_tables as ensure_event_tables
+from features import INDICATOR_COLUMNS
+from benchmark import bar_rows, synthetic_universe
+from storage import get_storage
+
+LEGACY_BARS = """
+    CREATE TABLE old_data (id INT AUTO_INCREMENT PRIMARY KEY, open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE,
+    volume BIGINT, vwap DOUBLE, timestamp TIMESTAMP, transactions INT, otc TINYINT NULL)
+"""
+
+
+def test_ensure_schema_keys_legacy_bar_tables(sqlite_db):
+    storage = get_storage('per_ticker')
+    cursor = sqlite_db.cursor()
+    indicators.ensure_state_table(cursor, storage)
+    ensure_event_tables(cursor)
+    ensure_change_tables(cursor)
+    cursor.execute(LEGACY_BARS)
+    storage.ensure_bars(cursor, 'new')
+    _, bars = synthetic_universe(1, 60)
+    rows = bar_rows(bars, 0, slice(0, 60))
+    # The old full-range fetch stored the overlap again
+    storage.insert_bars(cursor, 'old', rows)
+    storage.insert_bars(cursor, 'old', rows[-10:])
+    assert indicators.update_ticker(sqlite_db, cursor, 'old', storage) == 70
+    assert storage.unkeyed_bar_tables(cursor) == ['old']
+
+    storage.ensure_schema(cursor)
+    sqlite_db.commit()
+
+    assert storage.unkeyed_bar_tables(cursor) == []
+    cursor.execute('SELECT COUNT(*), COUNT(DISTINCT timestamp), MAX(id) FROM old_data')
+    assert cursor.fetchone() == (60, 60, 60)
+    # Indicators built on the duplicates are rebuilt by the next incremental run
+    assert indicators.load_state(cursor, 'old', storage) == (None, None)
+    assert indicators.update_ticker(sqlite_db, cursor, 'old', storage) == 60
+    cursor.close()
+
+
+def test_local_store_pulls_histories_rebuilt_elsewhere(sqlite_db, tmp_path):
+    host_a = get_storage('per_ticker', None)
+    host_b = get_storage('per_ticker', str(tmp_path / 'b'))
+    cursor = sqlite_db.cursor()
+    host_a.ensure_schema(cursor)
+    indicators.ensure_state_table(cursor, host_a)
+    ensure_event_tables(cursor)
+    ensure_change_tables(cursor)
+    host_a.ensure_bars(cursor, 'syn')
+    _, bars = synthetic_universe(1, 300)
+    host_a.insert_bars(cursor, 'syn', bar_rows(bars, 0, slice(0, 300)))
+    sqlite_db.commit()
+    assert indicators.update_ticker(sqlite_db, cursor, 'syn', host_a) == 300
+    before = host_b.read_indicators(sqlite_db, ['syn'])['syn']
+
+    # A corrected bar changes every later indicator row; host A (no local store) rebuilds, host B only reads
+    cursor.execute('UPDATE syn_data SET close = close * 2 WHERE id = 150')
+    sqlite_db.commit()
+    assert indicators.rebuild_ticker(sqlite_db, cursor, 'syn', host_a) == 300
+    cursor.close()
+
+    after = host_b.read_indicators(sqlite_db, ['syn'])['syn']
+    expected = host_a.read_indicators(sqlite_db, ['syn'])['syn']
+    assert not after['MA_200DAY'].equals(before['MA_200DAY'])
+    np.testing.assert_array_equal(after[INDICATOR_COLUMNS].to_numpy(float), expected[INDICATOR_COLUMNS].to_numpy(float))